@@ -13,6 +13,7 @@ from collections import defaultdict
 from datetime import datetime, timezone
 from functools import wraps
 from pathlib import Path
+from urllib.parse import urlencode
 import hashlib
 
 from werkzeug.utils import secure_filename
@@ -29,24 +30,48 @@ RATE_LIMIT_WINDOW = int(os.environ.get("RATE_LIMIT_WINDOW", 60))
 from core import (
     analyze_data,
     generate_report,
-    get_all_reports,
     import_faxcloud_export,
     init_database,
     insert_report_to_db,
     settings,
 )
 from core.config import configure_logging, ensure_directories
+from core.connection import pool_stats
+from core.migrations import start_backfills
+from core.audit import (
+    audit_stats,
+    init_audit_tables,
+    insert_audit_event,
+    list_audit_events,
+    list_audit_partitions,
+)
 from core.db import (
     delete_report,
     get_dashboard_stats,
+    get_report,
     get_report_by_id,
+    database_status,
+    entry_count_stats,
     get_report_entries,
+    get_entry_count,
+    get_number,
+    get_report_entries_page,
+    iter_report_entries,
+    get_report_numero_types,
     get_report_summary_by_id,
-    insert_audit_event,
+    get_trends,
+    list_reports,
+    detached_entry_keys,
+    pending_report_purges,
+    report_catalog_stats,
+    report_purge_stats,
+    shard_stats,
+    start_report_purge,
 )
 from core.asterisk import (
     init_asterisk_tables,
     get_sda_ranges,
+    get_sda_range,
     add_sda_range,
     update_sda_range,
     delete_sda_range,
@@ -58,6 +83,9 @@ from core.asterisk import (
     get_all_cached_tones,
     clear_tone_cache,
     get_dialplan_snippet,
+    sync_passive_listener,
+    schedule_reclassification,
+    AsteriskEngine,
 )
 
 logger = logging.getLogger(__name__)
@@ -78,7 +106,11 @@ def _ensure_report_derived_fields(report_data: dict) -> dict:
     report_data["date_debut"] = _sanitize_none(report_data.get("date_debut"))
     report_data["date_fin"] = _sanitize_none(report_data.get("date_fin"))
 
-    entries = report_data.get("entries") or report_data.get("fax_entries") or []
+    if "fax_sf" in report_data and "pages_reelles_totales" in report_data:
+        # Déjà fournis par les agrégats de la base : pas de parcours des entrées.
+        entries = []
+    else:
+        entries = report_data.get("entries") or report_data.get("fax_entries") or []
 
     pages_sf = 0
     pages_rf = 0
@@ -125,9 +157,19 @@ def create_app() -> Flask:
     ensure_directories()
     init_database()
     init_asterisk_tables()
+    init_audit_tables()
+    start_backfills()
+    if pending_report_purges() or detached_entry_keys():
+        # Purges interrompues par un arrêt : reprises en arrière-plan.
+        start_report_purge()
 
     configure_logging()
 
+    try:
+        sync_passive_listener()
+    except Exception as e:
+        logger.warning("Écoute AMI passive non démarrée: %s", e)
+
     web_dir = settings.base_dir / "frontend"
     templates_dir = web_dir / "templates"
     static_dir = web_dir / "static"
@@ -221,9 +263,10 @@ def create_app() -> Flask:
     def api_health() -> tuple[dict, int]:
         """Health check endpoint pour Docker/Kubernetes/monitoring."""
         import platform
+        db_status = None
         try:
             db_ok = True
-            init_database()
+            db_status = database_status()
         except Exception:
             db_ok = False
 
@@ -232,6 +275,13 @@ def create_app() -> Flask:
             "version": __version__,
             "app": __app_name__,
             "database": "ok" if db_ok else "error",
+            "schema": db_status,
+            "db_pool": pool_stats(),
+            "entry_counts": entry_count_stats(),
+            "audit": audit_stats(),
+            "report_catalog": report_catalog_stats(),
+            "report_purge": report_purge_stats(),
+            "shards": shard_stats(),
             "platform": platform.machine(),
             "python": platform.python_version(),
             "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -246,7 +296,10 @@ def create_app() -> Flask:
             "description": __description__,
             "endpoints": {
                 "health": "/api/health",
+                "dashboard": "/api/dashboard",
                 "reports": "/api/reports",
+                "trends": "/api/trends",
+                "analytics": "/api/analytics",
                 "report": "/api/report/<id>",
                 "entries": "/api/report/<id>/entries",
                 "upload": "/api/upload",
@@ -260,6 +313,7 @@ def create_app() -> Flask:
                 "asterisk_detect_single": "/api/asterisk/detect/<numero>",
                 "asterisk_cache": "/api/asterisk/cache",
                 "asterisk_dialplan": "/api/asterisk/dialplan",
+                "audit": "/api/audit",
             },
         }, 200
 
@@ -272,14 +326,90 @@ def create_app() -> Flask:
             dashboard=dashboard,
         )
 
+    def _report_catalog_filters() -> dict:
+        return {
+            key: request.args.get(key) or None
+            for key in ("contract", "period_from", "period_to", "created_from", "created_to")
+        }
+
+    @app.route("/api/dashboard", methods=["GET"])
+    def api_dashboard():
+        """KPIs globaux + répartition par contrat et par mois d'import."""
+        return jsonify(get_dashboard_stats(breakdowns=True))
+
+    @app.route("/api/trends", methods=["GET"])
+    def api_trends():
+        """Tendances par contrat depuis les cumuls journaliers.
+
+        Params: contract, from/to (AAAA-MM-JJ), granularity=day|week|month|year.
+        """
+        contract = request.args.get("contract") or None
+        date_from = request.args.get("from") or None
+        date_to = request.args.get("to") or None
+        granularity = request.args.get("granularity") or "month"
+        try:
+            series = get_trends(contract, date_from, date_to, granularity)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return jsonify({
+            "contract": contract,
+            "from": date_from,
+            "to": date_to,
+            "granularity": granularity,
+            "series": series,
+        })
+
+    @app.route("/api/analytics", methods=["GET"])
+    def api_analytics():
+        """Agrégat sur toutes les entrées (miroir duckdb si synchronisé, sinon SQLite).
+
+        Params: by=utilisateur,quarter  metrics=entries,error_rate  contract,
+        from/to (AAAA-MM-JJ), engine=auto|sqlite|duckdb, limit.
+        """
+        from core.analytics import AnalyticsUnavailable, aggregate
+
+        try:
+            limit_i = int(request.args.get("limit", 1000))
+        except Exception:
+            limit_i = 1000
+        try:
+            result = aggregate(
+                [d for d in (request.args.get("by") or "").split(",") if d],
+                [m for m in (request.args.get("metrics") or "entries").split(",") if m],
+                contract=request.args.get("contract") or None,
+                date_from=request.args.get("from") or None,
+                date_to=request.args.get("to") or None,
+                engine=request.args.get("engine") or "auto",
+                limit=limit_i,
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except AnalyticsUnavailable as e:
+            return {"error": str(e)}, 503
+        return jsonify(result)
+
     @app.route("/reports", methods=["GET"])
     def reports_page():
-        reports = get_all_reports() or []
-        return render_template("reports.html", reports=reports)
+        filters = _report_catalog_filters()
+        try:
+            page = list_reports(50, request.args.get("cursor") or None, **filters)
+        except ValueError:
+            page = list_reports(50)
+            filters = {}
+        return render_template(
+            "reports.html",
+            reports=page["reports"],
+            total=page["total"],
+            next_url=(
+                "/reports?" + urlencode({**{k: v for k, v in filters.items() if v}, "cursor": page["next_cursor"]})
+                if page["next_cursor"] else None
+            ),
+            filters=filters,
+        )
 
     @app.route("/report/<report_id>", methods=["GET"])
     def report_page(report_id: str):
-        report = _ensure_report_derived_fields(get_report_by_id(report_id))
+        report = _ensure_report_derived_fields(get_report(report_id))
         if not report:
             return render_template("404.html"), 404
         return render_template("report.html", report=report)
@@ -287,7 +417,7 @@ def create_app() -> Flask:
     @app.route("/report/<report_id>/pdf", methods=["GET"])
     def report_pdf(report_id: str):
         from core.pdf import build_report_pdf
-        report = _ensure_report_derived_fields(get_report_by_id(report_id))
+        report = _ensure_report_derived_fields(get_report(report_id))
         if not report:
             abort(404)
         pdf_bytes = build_report_pdf(report)
@@ -302,8 +432,28 @@ def create_app() -> Flask:
 
     @app.route("/api/reports", methods=["GET"])
     def api_reports() -> tuple[dict, int]:
-        reports = get_all_reports() or []
-        return {"reports": reports, "count": len(reports)}, 200
+        """Catalogue paginé (curseur) ; filtres contract, period_from/period_to,
+        created_from/created_to (AAAA-MM-JJ) ; fields=id,contract_id,... pour
+        ne renvoyer que certaines colonnes."""
+        try:
+            limit_i = int(request.args.get("limit", 50))
+        except Exception:
+            limit_i = 50
+        fields = [f.strip() for f in (request.args.get("fields") or "").split(",") if f.strip()]
+        cursor = request.args.get("cursor") or None
+        filters = _report_catalog_filters()
+        try:
+            page = list_reports(limit_i, cursor, fields=fields or None, **filters)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {
+            "reports": page["reports"],
+            "count": len(page["reports"]),
+            "total": page["total"],
+            "cursor": cursor,
+            "next_cursor": page["next_cursor"],
+            "filters": filters,
+        }, 200
 
     @app.route("/api/report/<report_id>", methods=["GET"])
     def api_report(report_id: str):
@@ -318,6 +468,7 @@ def create_app() -> Flask:
 
     @app.route("/api/report/<report_id>/entries", methods=["GET"])
     def api_report_entries(report_id: str):
+        cursor = request.args.get("cursor")
         offset = request.args.get("offset", 0)
         limit = request.args.get("limit", 200)
         entry_type = request.args.get("type") or None
@@ -328,6 +479,7 @@ def create_app() -> Flask:
         pages_min = request.args.get("pages_min")
         pages_max = request.args.get("pages_max")
         order = request.args.get("order") or "asc"
+        approximate = request.args.get("approx") in {"1", "true", "yes"}
         try:
             offset_i = int(offset)
         except Exception:
@@ -358,24 +510,43 @@ def create_app() -> Flask:
             except Exception:
                 pages_max_i = None
 
-        rows, total = get_report_entries(
-            report_id,
-            offset=offset_i,
-            limit=limit_i,
-            entry_type=entry_type,
-            valide=valide_i,
-            q=q,
-            date_from=date_from,
-            date_to=date_to,
-            pages_min=pages_min_i,
-            pages_max=pages_max_i,
-            order=order,
-        )
+        filters = {
+            "entry_type": entry_type,
+            "valide": valide_i,
+            "q": q,
+            "date_from": date_from,
+            "date_to": date_to,
+            "pages_min": pages_min_i,
+            "pages_max": pages_max_i,
+        }
+        next_cursor = None
+        if cursor is not None:
+            # Pagination par curseur (?cursor= vide pour la première page).
+            try:
+                rows, next_cursor = get_report_entries_page(
+                    report_id, cursor or None, limit_i, order=order, **filters,
+                )
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            # Total mis en cache par (rapport, filtres) ; estimé si approx=1 sur un gros rapport.
+            total, total_exact = get_entry_count(report_id, approximate=approximate, **filters)
+        else:
+            rows, total, total_exact = get_report_entries(
+                report_id,
+                offset=offset_i,
+                limit=limit_i,
+                order=order,
+                approximate=approximate,
+                **filters,
+            )
         return jsonify({
             "report_id": report_id,
-            "offset": offset_i,
+            "offset": offset_i if cursor is None else None,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
             "limit": limit_i,
             "total": total,
+            "total_exact": total_exact,
             "filters": {
                 "type": entry_type,
                 "valide": valide_i,
@@ -487,45 +658,34 @@ def create_app() -> Flask:
             buffer.seek(0)
             buffer.truncate(0)
 
-            offset = 0
-            page_size = 2000
-            while True:
-                rows, total = get_report_entries(
-                    report_id,
-                    offset=offset,
-                    limit=page_size,
-                    entry_type=entry_type,
-                    valide=valide_i,
-                    q=q,
-                    date_from=date_from,
-                    date_to=date_to,
-                    pages_min=pages_min_i,
-                    pages_max=pages_max_i,
-                    order=order,
-                )
-                if not rows:
-                    break
-                for r in rows:
-                    writer.writerow([
-                        r.get("id"),
-                        r.get("fax_id"),
-                        r.get("utilisateur"),
-                        r.get("type"),
-                        r.get("numero_original"),
-                        r.get("numero_normalise"),
-                        r.get("numero_type", ""),
-                        r.get("numero_type_label", ""),
-                        r.get("valide"),
-                        r.get("pages"),
-                        r.get("datetime"),
-                        r.get("erreurs"),
-                    ])
-                    yield buffer.getvalue()
-                    buffer.seek(0)
-                    buffer.truncate(0)
-                offset += len(rows)
-                if offset >= total:
-                    break
+            for r in iter_report_entries(
+                report_id,
+                entry_type=entry_type,
+                valide=valide_i,
+                q=q,
+                date_from=date_from,
+                date_to=date_to,
+                pages_min=pages_min_i,
+                pages_max=pages_max_i,
+                order=order,
+            ):
+                writer.writerow([
+                    r.get("id"),
+                    r.get("fax_id"),
+                    r.get("utilisateur"),
+                    r.get("type"),
+                    r.get("numero_original"),
+                    r.get("numero_normalise"),
+                    r.get("numero_type", ""),
+                    r.get("numero_type_label", ""),
+                    r.get("valide"),
+                    r.get("pages"),
+                    r.get("datetime"),
+                    r.get("erreurs"),
+                ])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
 
         filename = f"faxcloud_report_{report_id}.csv"
         headers = {
@@ -592,33 +752,22 @@ def create_app() -> Flask:
         def generate():
             yield "["
             first = True
-            offset = 0
-            page_size = 2000
-            while True:
-                rows, total = get_report_entries(
-                    report_id,
-                    offset=offset,
-                    limit=page_size,
-                    entry_type=entry_type,
-                    valide=valide_i,
-                    q=q,
-                    date_from=date_from,
-                    date_to=date_to,
-                    pages_min=pages_min_i,
-                    pages_max=pages_max_i,
-                    order=order,
-                )
-                if not rows:
-                    break
-                for r in rows:
-                    if first:
-                        first = False
-                    else:
-                        yield ","
-                    yield jsonify(r).get_data(as_text=True)
-                offset += len(rows)
-                if offset >= total:
-                    break
+            for r in iter_report_entries(
+                report_id,
+                entry_type=entry_type,
+                valide=valide_i,
+                q=q,
+                date_from=date_from,
+                date_to=date_to,
+                pages_min=pages_min_i,
+                pages_max=pages_max_i,
+                order=order,
+            ):
+                if first:
+                    first = False
+                else:
+                    yield ","
+                yield json.dumps(r, ensure_ascii=False)
             yield "]"
 
         filename = f"faxcloud_report_{report_id}_entries.json"
@@ -658,11 +807,13 @@ def create_app() -> Flask:
         trunk = data.get("ami_trunk", "")
         cache_ttl_hours = int(data.get("cache_ttl_hours", 168))
         simulation = bool(data.get("ami_simulation", False))
+        passive_listener = bool(data.get("ami_passive_listener", False))
 
         save_ami_config(host, port, username, secret, enabled,
                         context, caller_id, call_timeout, detect_timeout,
-                        trunk, cache_ttl_hours, simulation)
-        reload_asterisk_engine()
+                        trunk, cache_ttl_hours, simulation, passive_listener)
+        reload_asterisk_engine(sda_ranges=False)
+        sync_passive_listener()
 
         insert_audit_event(
             action="asterisk_config_update",
@@ -696,7 +847,8 @@ def create_app() -> Flask:
             site=data.get("site", ""),
             description=data.get("description", ""),
         )
-        reload_asterisk_engine()
+        reload_asterisk_engine(ami_config=False)
+        schedule_reclassification([prefix])
 
         insert_audit_event(
             action="sda_range_add",
@@ -711,17 +863,22 @@ def create_app() -> Flask:
     def api_sda_range_update(range_id: int):
         """Met à jour une plage SDA."""
         data = request.get_json(silent=True) or {}
+        previous = get_sda_range(range_id)
         updated = update_sda_range(range_id, **data)
         if updated:
-            reload_asterisk_engine()
+            reload_asterisk_engine(ami_config=False)
+            current = get_sda_range(range_id) or {}
+            schedule_reclassification([(previous or {}).get("prefix", ""), current.get("prefix", "")])
         return {"success": updated}, 200 if updated else 404
 
     @app.route("/api/asterisk/sda/<int:range_id>", methods=["DELETE"])
     def api_sda_range_delete(range_id: int):
         """Supprime une plage SDA."""
+        previous = get_sda_range(range_id)
         deleted = delete_sda_range(range_id)
         if deleted:
-            reload_asterisk_engine()
+            reload_asterisk_engine(ami_config=False)
+            schedule_reclassification([(previous or {}).get("prefix", "")])
             insert_audit_event(
                 action="sda_range_delete",
                 user=_current_user(),
@@ -767,15 +924,12 @@ def create_app() -> Flask:
 
     @app.route("/api/asterisk/stats/<report_id>", methods=["GET"])
     def api_asterisk_report_stats(report_id: str):
-        """Calcule les stats SDA/Téléphone pour un rapport existant."""
-        report = get_report_by_id(report_id)
+        """Stats SDA/Téléphone d'un rapport existant (agrégats tenus à jour par la reclassification)."""
+        report = get_report(report_id)
         if not report:
             return {"error": "Rapport non trouvé"}, 404
 
-        entries = report.get("fax_entries", report.get("entries", []))
-        engine = get_asterisk_engine()
-        entries = engine.classify_entries(entries)
-        stats = engine.get_stats(entries)
+        stats = AsteriskEngine.stats_from_type_counts(get_report_numero_types(report_id))
         return jsonify({"report_id": report_id, "asterisk_stats": stats})
 
     @app.route("/api/asterisk/detect", methods=["POST"])
@@ -827,6 +981,15 @@ def create_app() -> Flask:
         result["numero_original"] = numero
         return jsonify(result)
 
+    @app.route("/api/numbers/<numero>", methods=["GET"])
+    def api_number(numero: str):
+        """Fiche d'un numéro : classification, tonalité et rapports où il apparaît."""
+        from core.analyzer import normalize_number
+        number = get_number(normalize_number(numero))
+        if not number:
+            return {"error": "Numéro inconnu"}, 404
+        return jsonify(number)
+
     @app.route("/api/asterisk/cache", methods=["GET"])
     def api_asterisk_cache():
         """Liste tous les résultats de détection en cache."""
@@ -845,8 +1008,40 @@ def create_app() -> Flask:
         """Retourne le snippet de dialplan Asterisk à configurer."""
         return Response(get_dialplan_snippet(), mimetype="text/plain")
 
+    @app.route("/api/audit", methods=["GET"])
+    def api_audit():
+        """Journal d'audit, du plus récent au plus ancien (pagination par curseur).
+
+        Filtres: action, user, report_id, date_from/date_to (AAAA-MM-JJ).
+        """
+        try:
+            limit_i = int(request.args.get("limit", 200))
+        except Exception:
+            limit_i = 200
+        cursor = request.args.get("cursor") or None
+        filters = {
+            "action": request.args.get("action") or None,
+            "user": request.args.get("user") or None,
+            "report_id": request.args.get("report_id") or None,
+            "date_from": request.args.get("date_from") or None,
+            "date_to": request.args.get("date_to") or None,
+        }
+        try:
+            events, next_cursor = list_audit_events(limit_i, cursor, **filters)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return jsonify({
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "filters": filters,
+            "events": events,
+            "partitions": list_audit_partitions() if cursor is None else None,
+        })
+
     @app.route("/api/report/<report_id>", methods=["DELETE"])
     def api_report_delete(report_id: str):
+        if not delete_report(report_id):
+            return {"error": "Rapport introuvable"}, 404
         insert_audit_event(
             action="delete_report",
             user=_current_user(),
@@ -855,12 +1050,12 @@ def create_app() -> Flask:
             user_agent=request.headers.get("User-Agent"),
             meta=None,
         )
-        delete_report(report_id)
-        return {"success": True, "deleted": report_id}, 200
+        # Entrées et fichiers purgés en arrière-plan.
+        return {"success": True, "deleted": report_id, "purge": "pending"}, 200
 
     @app.route("/api/report/<report_id>/qr", methods=["GET"])
     def api_report_qr(report_id: str):
-        report = get_report_by_id(report_id)
+        report = get_report(report_id)
         if not report or not report.get("qr_path"):
             return {"error": "QR code non trouvé"}, 404
 
@@ -1009,6 +1204,14 @@ def create_app() -> Flask:
                 report_data = generate_report(analysis)
 
                 _set_job(upload_id, stage="save", message="Sauvegarde…", percent=90)
+
+                def on_save_progress(done: int, total: int) -> None:
+                    _set_job(
+                        upload_id,
+                        message=f"Sauvegarde… {done}/{total} lignes",
+                        percent=90 + int(9 * done / total) if total else 99,
+                    )
+
                 insert_report_to_db(
                     report_data["report_id"],
                     report_data,
@@ -1016,6 +1219,7 @@ def create_app() -> Flask:
                     source_filename=filename,
                     source_filesize=size,
                     source_sha256=sha256,
+                    on_progress=on_save_progress,
                 )
 
                 insert_audit_event(
@@ -7,6 +7,7 @@ This module exposes helper functions to keep import paths concise for the CLI.
 from .config import settings, set_debug_mode
 from .db import (
     get_all_reports,
+    get_report,
     get_report_by_id,
     init_database,
     insert_report_to_db,
@@ -20,6 +21,7 @@ __all__ = [
     "generate_qr_code",
     "generate_report",
     "get_all_reports",
+    "get_report",
     "get_report_by_id",
     "import_faxcloud_export",
     "init_database",
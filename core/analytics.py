@@ -0,0 +1,383 @@
+"""
+Requêtes analytiques sur l'ensemble des rapports.
+
+Deux moteurs pour les mêmes agrégats (`aggregate()`) :
+  - sqlite : la vue fax_entries de la base, ligne à ligne (toujours disponible) ;
+  - duckdb : un miroir en colonnes (data/analytics.duckdb), optionnel.
+
+Le miroir copie reports et numbers à chaque synchronisation (petites tables)
+et les entrées rapport par rapport : seuls les rapports nouveaux, réimportés
+ou supprimés depuis la dernière synchronisation sont traités. La
+classification des numéros vivant dans numbers, une reclassification est
+reprise à la synchronisation suivante sans recopier les entrées.
+
+Avec DB_SHARDING=contract, le miroir rassemble la base principale et les
+bases par contrat : les entrées y référencent le numéro normalisé (les
+identifiants de numbers sont propres à chaque base). Le moteur sqlite, lui,
+ne lit que la base principale : dès qu'une base par contrat existe, il est
+refusé (AnalyticsUnavailable) plutôt que de renvoyer des totaux partiels.
+
+Les entrées des rapports archivés ne sont plus dans SQLite : le miroir les lit
+dans leur archive, le moteur sqlite les exclut et le signale
+(`archived_reports_excluded`).
+
+Les écritures restent sur SQLite ; le miroir ne sert qu'aux lectures.
+"""
+
+from __future__ import annotations
+
+import calendar
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .connection import get_connection
+from .db import all_databases, report_database, shard_databases
+
+logger = logging.getLogger(__name__)
+
+try:
+    import duckdb
+    _HAS_DUCKDB = True
+except ImportError:
+    duckdb = None
+    _HAS_DUCKDB = False
+
+class AnalyticsUnavailable(RuntimeError):
+    """Moteur colonnes indisponible (duckdb absent ou miroir non synchronisé)."""
+
+def analytics_path() -> Path:
+    return Path(settings.analytics_db_path or settings.data_dir / "analytics.duckdb")
+
+def duckdb_available() -> bool:
+    return _HAS_DUCKDB
+
+def _duckdb_connect(read_only: bool):
+    if not _HAS_DUCKDB:
+        raise AnalyticsUnavailable("duckdb n'est pas installé (pip install duckdb)")
+    path = analytics_path()
+    if read_only and not path.exists():
+        raise AnalyticsUnavailable("Miroir analytique absent : python main.py analytics sync")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return duckdb.connect(str(path), read_only=read_only)
+
+_MIRROR_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        report_id VARCHAR, entry_id BIGINT, utilisateur VARCHAR, type VARCHAR,
+        numero_normalise VARCHAR, valide TINYINT, pages INTEGER, ts TIMESTAMP
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS mirrored_reports (report_id VARCHAR PRIMARY KEY, created_at VARCHAR, entries BIGINT)",
+    """
+    CREATE OR REPLACE VIEW fax_entries AS
+    SELECT e.*, n.numero_type, r.contract_id
+    FROM entries e
+    LEFT JOIN numbers n ON n.numero_normalise = e.numero_normalise
+    LEFT JOIN reports r ON r.id = e.report_id
+    """,
+)
+
+_MIRROR_ENTRIES_SQL = """
+    SELECT k.report_id, e.id AS entry_id, u.name AS utilisateur, t.name AS type,
+           n.numero_normalise, e.valide, e.pages, e.datetime_ts
+    FROM entries e
+    JOIN report_keys k ON k.id = e.report_key
+    LEFT JOIN numbers n ON n.id = e.number_id
+    LEFT JOIN entry_users u ON u.id = e.user_id
+    LEFT JOIN entry_types t ON t.id = e.type_code
+    WHERE e.report_key = (SELECT id FROM report_keys WHERE report_id = ?)
+    ORDER BY e.id
+"""
+
+_ARCHIVE_MIRROR_COLUMNS = ("utilisateur", "type", "numero_normalise", "valide", "pages", "datetime_ts")
+
+def _read_frame(conn, sql: str, params: Sequence = ()):
+    import pandas as pd
+    return pd.read_sql_query(sql, conn, params=tuple(params))
+
+def _entry_frames(report_id: str, archive_path: Optional[str]):
+    """Entrées d'un rapport par blocs : depuis sa base, ou son archive s'il est archivé."""
+    import pandas as pd
+
+    if archive_path:
+        from .archive import EntryArchive
+
+        for first, values in EntryArchive(archive_path).iter_chunks(_ARCHIVE_MIRROR_COLUMNS):
+            size = len(values["datetime_ts"])
+            yield pd.DataFrame({
+                "report_id": [report_id] * size,
+                "entry_id": range(first, first + size),
+                **{c: values[c] for c in _ARCHIVE_MIRROR_COLUMNS},
+            })
+        return
+    conn = get_connection(readonly=True, path=report_database(report_id))
+    try:
+        yield from pd.read_sql_query(
+            _MIRROR_ENTRIES_SQL, conn, params=(report_id,), chunksize=settings.analytics_sync_chunk_size,
+        )
+    finally:
+        conn.close()
+
+def sync_analytics(full: bool = False) -> Dict[str, int]:
+    """Met le miroir duckdb à jour depuis SQLite ; `full` le reconstruit entièrement."""
+    import pandas as pd
+
+    started = time.perf_counter()
+    sconn = get_connection(readonly=True, path=settings.database_path)
+    dconn = _duckdb_connect(read_only=False)
+    try:
+        # Petites tables : copiées en entier (classification des numéros à jour).
+        reports = _read_frame(
+            sconn,
+            """
+            SELECT id, contract_id, date_debut, date_fin, created_at,
+                   total_fax, erreurs_totales, taux_reussite, archive_path
+            FROM reports WHERE deleted_at IS NULL
+            """,
+        )
+        frames = []
+        for path in all_databases():
+            conn = get_connection(readonly=True, path=path)
+            try:
+                frames.append(_read_frame(
+                    conn,
+                    """
+                    SELECT n.numero_normalise, COALESCE(nt.name, 'unknown') AS numero_type
+                    FROM numbers n LEFT JOIN numero_types nt ON nt.id = n.numero_type_code
+                    """,
+                ))
+            finally:
+                conn.close()
+        # Un même numéro peut figurer dans plusieurs bases, classé à l'identique.
+        numbers = pd.concat(frames, ignore_index=True).drop_duplicates("numero_normalise")
+        columns = {r[0] for r in dconn.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'entries'"
+        ).fetchall()}
+        if "number_id" in columns:
+            # Miroir antérieur (entrées par identifiant de numéro) : reconstruit.
+            full = True
+        if full:
+            dconn.execute("DROP VIEW IF EXISTS fax_entries")
+            dconn.execute("DROP TABLE IF EXISTS entries")
+            dconn.execute("DROP TABLE IF EXISTS mirrored_reports")
+        dconn.register("src_reports", reports)
+        dconn.register("src_numbers", numbers)
+        dconn.execute("CREATE OR REPLACE TABLE reports AS SELECT * FROM src_reports")
+        dconn.execute("CREATE OR REPLACE TABLE numbers AS SELECT * FROM src_numbers")
+        for stmt in _MIRROR_DDL:
+            dconn.execute(stmt)
+
+        current = dict(zip(reports["id"], reports["created_at"].fillna("")))
+        archives = {r: p for r, p in zip(reports["id"], reports["archive_path"]) if p}
+        mirrored = {r: (created, entries) for r, created, entries in dconn.execute(
+            "SELECT report_id, created_at, entries FROM mirrored_reports"
+        ).fetchall()}
+        stale = [r for r, (created, _) in mirrored.items() if current.get(r) != created]
+        # Rapport archivé avant d'être copié (miroir antérieur : copié sans entrées).
+        from .archive import EntryArchive
+        stale += [r for r, (created, entries) in mirrored.items()
+                  if r not in stale and entries == 0 and r in archives and EntryArchive(archives[r]).rows]
+        missing = [r for r in current if r not in mirrored or r in stale]
+
+        dconn.execute("BEGIN")
+        for report_id in stale:
+            dconn.execute("DELETE FROM entries WHERE report_id = ?", [report_id])
+            dconn.execute("DELETE FROM mirrored_reports WHERE report_id = ?", [report_id])
+        dconn.execute("COMMIT")
+
+        copied = 0
+        for report_id in missing:
+            count = 0
+            dconn.execute("BEGIN")
+            for chunk in _entry_frames(report_id, archives.get(report_id)):
+                dconn.register("src_entries", chunk)
+                dconn.execute(
+                    """
+                    INSERT INTO entries
+                    SELECT report_id, entry_id, utilisateur, type, numero_normalise, valide, pages,
+                           epoch_ms(CAST(datetime_ts AS BIGINT) * 1000)
+                    FROM src_entries
+                    """
+                )
+                dconn.unregister("src_entries")
+                count += len(chunk)
+            dconn.execute(
+                "INSERT INTO mirrored_reports VALUES (?, ?, ?)",
+                [report_id, current[report_id], count],
+            )
+            dconn.execute("COMMIT")
+            copied += count
+    finally:
+        dconn.close()
+        sconn.close()
+
+    stats = {
+        "reports": len(current),
+        "reports_synced": len(missing),
+        "reports_removed": len([r for r in stale if r not in current]),
+        "entries_copied": copied,
+        "numbers": len(numbers),
+        "duration_ms": int((time.perf_counter() - started) * 1000),
+    }
+    logger.info("Miroir analytique synchronisé: %s", stats)
+    return stats
+
+# Dimensions et mesures autorisées : (expression SQLite, expression duckdb).
+ANALYTICS_DIMENSIONS: Dict[str, Tuple[str, str]] = {
+    "utilisateur": ("utilisateur", "utilisateur"),
+    "type": ("type", "type"),
+    "numero_type": ("numero_type", "numero_type"),
+    "contract_id": ("contract_id", "contract_id"),
+    "report_id": ("report_id", "report_id"),
+    "pages": ("pages", "pages"),
+    "valide": ("valide", "valide"),
+    "year": ("strftime('%Y', datetime_ts, 'unixepoch')", "strftime(ts, '%Y')"),
+    "quarter": (
+        "strftime('%Y', datetime_ts, 'unixepoch') || '-Q' || "
+        "((CAST(strftime('%m', datetime_ts, 'unixepoch') AS INTEGER) + 2) / 3)",
+        "strftime(ts, '%Y') || '-Q' || CAST(quarter(ts) AS VARCHAR)",
+    ),
+    "month": ("strftime('%Y-%m', datetime_ts, 'unixepoch')", "strftime(ts, '%Y-%m')"),
+    "day": ("strftime('%Y-%m-%d', datetime_ts, 'unixepoch')", "strftime(ts, '%Y-%m-%d')"),
+}
+
+_ERRORS_SQL = "SUM(CASE WHEN valide = 0 THEN 1 ELSE 0 END)"
+
+ANALYTICS_METRICS: Dict[str, str] = {
+    "entries": "COUNT(*)",
+    "errors": _ERRORS_SQL,
+    "error_rate": f"ROUND(100.0 * {_ERRORS_SQL} / COUNT(*), 2)",
+    "pages": "SUM(pages)",
+    "pages_avg": "ROUND(AVG(pages), 2)",
+    "numbers": "COUNT(DISTINCT numero_normalise)",
+}
+
+_SOURCES = {
+    "sqlite": (
+        "(SELECT f.*, r.contract_id FROM fax_entries f JOIN reports r ON r.id = f.report_id"
+        " WHERE r.deleted_at IS NULL AND r.archived_at IS NULL)"
+    ),
+    "duckdb": "fax_entries",
+}
+
+def _ts_bound(value: str, engine: str, label: str, next_day: bool = False) -> Tuple[str, object]:
+    """Colonne et borne (UTC) d'un filtre de date AAAA-MM-JJ selon le moteur."""
+    try:
+        day = datetime.strptime(str(value).strip(), "%Y-%m-%d")
+    except ValueError as e:
+        raise ValueError(f"{label} invalide (AAAA-MM-JJ attendu): {value!r}") from e
+    if next_day:
+        day += timedelta(days=1)
+    if engine == "sqlite":
+        return "datetime_ts", calendar.timegm(day.timetuple())
+    return "ts", day
+
+def aggregate(
+    by: Sequence[str],
+    metrics: Sequence[str] = ("entries",),
+    *,
+    contract: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    engine: str = "auto",
+    limit: int = 1000,
+) -> Dict:
+    """Agrégat GROUP BY sur toutes les entrées.
+
+    `by` et `metrics` sont pris dans ANALYTICS_DIMENSIONS / ANALYTICS_METRICS
+    (jamais de SQL libre). `engine` : "sqlite", "duckdb" ou "auto" (duckdb
+    si le miroir existe). Lève ValueError si un paramètre est invalide,
+    AnalyticsUnavailable si duckdb est demandé sans être disponible, ou si
+    le moteur retenu est sqlite alors que des rapports sont rangés dans des
+    bases par contrat (invisibles depuis la base principale). Avec sqlite,
+    les rapports archivés sont exclus et comptés dans
+    `archived_reports_excluded` (toujours 0 avec duckdb, qui les copie).
+    """
+    by = list(by)
+    metrics = list(metrics) or ["entries"]
+    unknown = [d for d in by if d not in ANALYTICS_DIMENSIONS] + [m for m in metrics if m not in ANALYTICS_METRICS]
+    if unknown:
+        raise ValueError(f"Dimensions/mesures inconnues: {', '.join(unknown)}")
+    if engine == "auto":
+        engine = "duckdb" if _HAS_DUCKDB and analytics_path().exists() else "sqlite"
+    if engine not in _SOURCES:
+        raise ValueError(f"Moteur inconnu: {engine!r} (sqlite, duckdb, auto)")
+    if engine == "sqlite" and shard_databases():
+        raise AnalyticsUnavailable(
+            "Rapports répartis en bases par contrat : le moteur sqlite ne les voit pas"
+            " (pip install duckdb, puis python main.py analytics sync)"
+        )
+    limit = max(1, min(100000, int(limit)))
+    idx = 0 if engine == "sqlite" else 1
+
+    where: List[str] = []
+    params: List = []
+    if contract:
+        where.append("contract_id = ?")
+        params.append(contract)
+    if date_from:
+        column, bound = _ts_bound(date_from, engine, "date_from")
+        where.append(f"{column} >= ?")
+        params.append(bound)
+    if date_to:
+        column, bound = _ts_bound(date_to, engine, "date_to", next_day=True)
+        where.append(f"{column} < ?")
+        params.append(bound)
+
+    select = [f"{ANALYTICS_DIMENSIONS[d][idx]} AS {d}" for d in by]
+    select += [f"{ANALYTICS_METRICS[m]} AS {m}" for m in metrics]
+    positions = ", ".join(str(i + 1) for i in range(len(by)))
+    group = f"GROUP BY {positions} ORDER BY {positions}" if by else ""
+    sql = f"""
+        SELECT {", ".join(select)}
+        FROM {_SOURCES[engine]}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        {group}
+        LIMIT {limit}
+    """
+
+    started = time.perf_counter()
+    excluded = 0
+    if engine == "sqlite":
+        conn = get_connection(readonly=True)
+        try:
+            cur = conn.execute(sql, tuple(params))
+            columns = [c[0] for c in cur.description]
+            rows = [tuple(r) for r in cur.fetchall()]
+            excluded = conn.execute(
+                "SELECT COUNT(*) FROM reports WHERE archived_at IS NOT NULL AND deleted_at IS NULL"
+                + (" AND contract_id = ?" if contract else ""),
+                (contract,) if contract else (),
+            ).fetchone()[0]
+        finally:
+            conn.close()
+    else:
+        conn = _duckdb_connect(read_only=True)
+        try:
+            cur = conn.execute(sql, params)
+            columns = [c[0] for c in cur.description]
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+    return {
+        "engine": engine,
+        "columns": columns,
+        "rows": [dict(zip(columns, r)) for r in rows],
+        "archived_reports_excluded": excluded,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+def query_mirror(sql: str) -> Dict:
+    """SQL libre en lecture seule sur le miroir duckdb (CLI uniquement)."""
+    conn = _duckdb_connect(read_only=True)
+    try:
+        cur = conn.execute(sql)
+        columns = [c[0] for c in cur.description]
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+    return {"engine": "duckdb", "columns": columns, "rows": [dict(zip(columns, r)) for r in rows]}
@@ -0,0 +1,549 @@
+"""
+Archivage à froid des entrées des rapports anciens.
+
+Au-delà de `ARCHIVE_AFTER_DAYS` jours depuis l'import, les entrées d'un
+rapport sont écrites dans une archive en colonnes (data/entries_archive/,
+un fichier zip par rapport : un membre JSON compressé par colonne et par bloc
+de `ARCHIVE_CHUNK_ROWS` lignes), puis supprimées de la table entries par
+petits lots. L'en-tête, les agrégats, la répartition par type et les cumuls
+journaliers restent dans SQLite ; ils sont figés à l'archivage
+(une reclassification ultérieure ne touche plus le rapport).
+
+Les lectures (page du rapport, exports, comptages) passent par `EntryArchive`
+dès que reports.archive_path est renseigné, un bloc décodé à la fois. Les
+lignes d'une archive sont numérotées dans l'ordre d'insertion (1, 2, ...) :
+ce numéro tient lieu de rowid dans les curseurs de pagination. Le manifeste
+indexe chaque bloc (lignes, datetime_ts min/max) : une page par curseur et
+un filtre de dates ne décodent que les blocs qui peuvent y contribuer.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from bisect import bisect_left, bisect_right
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import settings
+from .connection import get_connection, using_database, write_transaction
+from .db import (
+    COMPACT_BACKFILL,
+    ENTRY_FROM,
+    ENTRY_SELECT,
+    _REPORT_KEY_SQL,
+    _date_str_to_range,
+    _on_report_database,
+    _sync_catalog,
+    _write_report_rollups,
+    all_databases,
+    invalidate_entry_counts,
+    invalidate_report_catalog,
+    reclaim_free_pages,
+)
+from .migrations import backfill_pending
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = 1
+ARCHIVE_CHUNK_ROWS = 20000
+ARCHIVE_COLUMNS = (
+    "id", "fax_id", "utilisateur", "type", "numero_original", "numero_normalise",
+    "numero_type", "numero_type_label", "valide", "pages", "datetime", "erreurs",
+    "datetime_ts",
+)
+# Ordres de pagination (rowids triés par filtre) gardés en mémoire.
+ARCHIVE_ORDER_CACHE_SIZE = 8
+
+# datetime_ts NULL trié en tête, comme dans SQLite.
+_NULL_TS = -(2 ** 62)
+_MAX_TS = 2 ** 62
+
+def _archive_dir() -> Path:
+    return settings.data_dir / "entries_archive"
+
+class EntryArchive:
+    """Archive en colonnes des entrées d'un rapport (lecture seule)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with zipfile.ZipFile(self.path) as zf:
+            self.manifest = json.loads(zf.read("manifest.json"))
+        if self.manifest.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"Format d'archive inconnu: {self.path}")
+        self.report_id: str = self.manifest["report_id"]
+        self.rows: int = self.manifest["rows"]
+        self.chunk_rows: int = self.manifest["chunk_rows"]
+        self.chunks: int = self.manifest["chunks"]
+        # Index par bloc ({"rows", "ts_min", "ts_max"}), absent des archives
+        # écrites avant son introduction.
+        self.index: Optional[List[Dict]] = self.manifest.get("index")
+
+    @staticmethod
+    def _member(chunk: int, column: str) -> str:
+        return f"{chunk:05d}/{column}.json"
+
+    def chunk_bounds(self, chunk: int) -> Tuple[int, int]:
+        """datetime_ts min/max du bloc (NULL compté comme _NULL_TS)."""
+        if self.index is None:
+            return _NULL_TS, _MAX_TS
+        entry = self.index[chunk]
+        return entry["ts_min"], entry["ts_max"]
+
+    def iter_chunks(self, columns: Iterable[str] = ARCHIVE_COLUMNS,
+                    chunks: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, Dict[str, list]]]:
+        """Blocs (tous, ou `chunks` dans l'ordre donné) : (rowid de la première ligne, {colonne: valeurs})."""
+        columns = tuple(columns)
+        with zipfile.ZipFile(self.path) as zf:
+            for chunk in (range(self.chunks) if chunks is None else chunks):
+                yield chunk * self.chunk_rows + 1, {
+                    c: json.loads(zf.read(self._member(chunk, c))) for c in columns
+                }
+
+    def _row(self, values: Dict[str, list], i: int) -> Dict:
+        row = {c: values[c][i] for c in ARCHIVE_COLUMNS}
+        row["report_id"] = self.report_id
+        return row
+
+    def iter_entries(self) -> Iterator[Dict]:
+        """Entrées dans l'ordre d'insertion (avec datetime_ts), bloc par bloc."""
+        for _, values in self.iter_chunks():
+            for i in range(len(values["id"])):
+                yield self._row(values, i)
+
+    def rows_at(self, rowids: List[int]) -> Dict[int, Dict]:
+        """Lignes des rowids donnés ; ne décode que les blocs concernés."""
+        wanted: Dict[int, List[int]] = {}
+        for rowid in rowids:
+            wanted.setdefault((rowid - 1) // self.chunk_rows, []).append(rowid)
+        found: Dict[int, Dict] = {}
+        with zipfile.ZipFile(self.path) as zf:
+            for chunk, ids in sorted(wanted.items()):
+                values = {c: json.loads(zf.read(self._member(chunk, c))) for c in ARCHIVE_COLUMNS}
+                for rowid in ids:
+                    found[rowid] = self._row(values, rowid - 1 - chunk * self.chunk_rows)
+        return found
+
+def _entry_filter(
+    *,
+    entry_type: Optional[str] = None,
+    valide: Optional[int] = None,
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    pages_min: Optional[int] = None,
+    pages_max: Optional[int] = None,
+) -> Tuple[Tuple[str, ...], List[Callable[[Dict[str, list], int], bool]]]:
+    """Équivalent en Python de `_entries_filters_sql` : (colonnes lues, tests)."""
+    columns = {"datetime_ts"}
+    tests: List[Callable[[Dict[str, list], int], bool]] = []
+
+    if entry_type:
+        wanted_type = str(entry_type).lower()
+        columns.add("type")
+        tests.append(lambda v, i: (v["type"][i] or "").lower() == wanted_type)
+
+    if valide in (0, 1):
+        wanted_valide = int(valide)
+        columns.add("valide")
+        tests.append(lambda v, i: v["valide"][i] == wanted_valide)
+
+    q = (q or "").strip().lower()
+    if q:
+        columns.update(("utilisateur", "numero_normalise", "numero_original"))
+        tests.append(lambda v, i: any(
+            q in (v[c][i] or "").lower() for c in ("utilisateur", "numero_normalise", "numero_original")
+        ))
+
+    start_ts = _date_str_to_range(date_from)[0] if date_from else None
+    if start_ts is not None:
+        tests.append(lambda v, i: v["datetime_ts"][i] is not None and v["datetime_ts"][i] >= start_ts)
+    end_exclusive = _date_str_to_range(date_to)[1] if date_to else None
+    if end_exclusive is not None:
+        tests.append(lambda v, i: v["datetime_ts"][i] is not None and v["datetime_ts"][i] < end_exclusive)
+
+    for bound, keep in ((pages_min, lambda p, b: p >= b), (pages_max, lambda p, b: p <= b)):
+        try:
+            bound = int(bound) if bound is not None else None
+        except Exception:
+            bound = None
+        if bound is not None:
+            columns.add("pages")
+            tests.append(lambda v, i, b=bound, keep=keep: v["pages"][i] is not None and keep(v["pages"][i], b))
+
+    return tuple(sorted(columns)), tests
+
+def _date_chunks(archive: EntryArchive, filters: Dict) -> List[int]:
+    """Blocs dont l'intervalle de datetime_ts recoupe le filtre de dates."""
+    low, high = _NULL_TS, _MAX_TS
+    if filters.get("date_from"):
+        start = _date_str_to_range(filters["date_from"])[0]
+        if start is not None:
+            low = start
+    if filters.get("date_to"):
+        end = _date_str_to_range(filters["date_to"])[1]
+        if end is not None:
+            high = end - 1
+    return [c for c in range(archive.chunks)
+            if archive.chunk_bounds(c)[1] >= low and archive.chunk_bounds(c)[0] <= high]
+
+def _active_filters(filters: Dict) -> Dict:
+    return {k: v for k, v in filters.items() if v not in (None, "")}
+
+class _ArchiveOrder:
+    """Lignes d'une archive retenues par un filtre, triées sur (datetime_ts, rowid)."""
+
+    def __init__(self, archive: EntryArchive, filters: Dict):
+        columns, tests = _entry_filter(**filters)
+        keys: List[Tuple[int, int]] = []
+        for first, values in archive.iter_chunks(columns, _date_chunks(archive, filters)):
+            timestamps = values["datetime_ts"]
+            for i, ts in enumerate(timestamps):
+                if all(test(values, i) for test in tests):
+                    keys.append((_NULL_TS if ts is None else ts, first + i))
+        keys.sort()
+        self.ts = array("q", (k[0] for k in keys))
+        self.rowids = array("q", (k[1] for k in keys))
+
+    def __len__(self) -> int:
+        return len(self.rowids)
+
+    def key(self, i: int) -> Tuple[int, int]:
+        return self.ts[i], self.rowids[i]
+
+_orders: "OrderedDict[Tuple, _ArchiveOrder]" = OrderedDict()
+_orders_lock = Lock()
+
+def _order_key(path: str, filters: Dict) -> Tuple:
+    return str(path), os.stat(path).st_mtime_ns, tuple(sorted(_active_filters(filters).items()))
+
+def _cached_order(key: Tuple) -> Optional[_ArchiveOrder]:
+    with _orders_lock:
+        order = _orders.get(key)
+        if order is not None:
+            _orders.move_to_end(key)
+        return order
+
+def _archive_order(path: str, filters: Dict) -> Tuple[EntryArchive, _ArchiveOrder]:
+    archive = EntryArchive(path)
+    key = _order_key(path, filters)
+    order = _cached_order(key)
+    if order is not None:
+        return archive, order
+    order = _ArchiveOrder(archive, filters)
+    with _orders_lock:
+        _orders[key] = order
+        while len(_orders) > ARCHIVE_ORDER_CACHE_SIZE:
+            _orders.popitem(last=False)
+    return archive, order
+
+def _page_rows(archive: EntryArchive, order: _ArchiveOrder, positions: List[int]) -> List[Dict]:
+    found = archive.rows_at([order.rowids[i] for i in positions])
+    rows = []
+    for i in positions:
+        row = found[order.rowids[i]]
+        del row["datetime_ts"]
+        rows.append(row)
+    return rows
+
+def count_archived_entries(path: str, **filters) -> int:
+    """Nombre d'entrées archivées correspondant aux filtres."""
+    if not _active_filters(filters):
+        return EntryArchive(path).rows
+    return len(_archive_order(path, filters)[1])
+
+def archived_entries_slice(path: str, offset: int, limit: int, order: str = "asc", **filters) -> List[Dict]:
+    """Page d'entrées archivées par OFFSET (tri datetime_ts puis rowid)."""
+    archive, ordered = _archive_order(path, filters)
+    positions = range(offset, min(offset + limit, len(ordered)))
+    if str(order).lower() == "desc":
+        positions = [len(ordered) - 1 - i for i in positions]
+    return _page_rows(archive, ordered, list(positions))
+
+def archived_entries_page(
+    path: str,
+    cursor: Optional[Tuple[Optional[int], int]],
+    limit: int,
+    order: str = "asc",
+    **filters,
+) -> Tuple[List[Dict], Optional[Tuple[Optional[int], int]]]:
+    """Page d'entrées archivées après `cursor` (datetime_ts, rowid).
+
+    Retourne les lignes et la position de la dernière si d'autres suivent.
+    """
+    archive = EntryArchive(path)
+    if archive.index is not None and _cached_order(_order_key(path, filters)) is None:
+        rows, last, decoded = _indexed_page(archive, cursor, limit, str(order).lower() == "desc", filters)
+        # Blocs qui se chevauchent (dates mélangées) : l'index n'élague
+        # presque rien, l'ordre complet mis en cache sert les pages suivantes.
+        if decoded > max(2, archive.chunks // 2):
+            _archive_order(path, filters)
+        return rows, last
+    archive, ordered = _archive_order(path, filters)
+    desc = str(order).lower() == "desc"
+    n = len(ordered)
+    if cursor is None:
+        start = 0
+    else:
+        ts, rowid = cursor
+        key = (_NULL_TS if ts is None else ts, rowid)
+        if desc:
+            start = n - bisect_left(range(n), key, key=ordered.key)
+        else:
+            start = bisect_right(range(n), key, key=ordered.key)
+    positions = list(range(start, min(start + limit, n)))
+    if desc:
+        positions = [n - 1 - i for i in positions]
+    rows = _page_rows(archive, ordered, positions)
+    last = None
+    if positions and start + limit < n:
+        ts, rowid = ordered.key(positions[-1])
+        last = (None if ts == _NULL_TS else ts, rowid)
+    return rows, last
+
+def _indexed_page(archive: EntryArchive, cursor: Optional[Tuple[Optional[int], int]],
+                  limit: int, desc: bool, filters: Dict) -> Tuple[List[Dict], Optional[Tuple[Optional[int], int]], int]:
+    """Page par curseur guidée par l'index des blocs.
+
+    Les blocs sont parcourus dans l'ordre de leur borne de datetime_ts ; on
+    s'arrête dès qu'un bloc ne peut plus rien apporter aux `limit + 1`
+    meilleures clés. Seuls les blocs des lignes retenues sont décodés en
+    entier. Retourne aussi le nombre de blocs parcourus.
+    """
+    columns, tests = _entry_filter(**filters)
+    after = None if cursor is None else (_NULL_TS if cursor[0] is None else cursor[0], cursor[1])
+    chunks = _date_chunks(archive, filters)
+    if after is not None:
+        chunks = [c for c in chunks if (archive.chunk_bounds(c)[0] <= after[0] if desc
+                                        else archive.chunk_bounds(c)[1] >= after[0])]
+    chunks.sort(key=lambda c: -archive.chunk_bounds(c)[1] if desc else archive.chunk_bounds(c)[0])
+
+    want = limit + 1
+    best: List[Tuple[int, int]] = []
+    decoded = 0
+    values_iter = archive.iter_chunks(columns, chunks)
+    for chunk in chunks:
+        if len(best) >= want:
+            low, high = archive.chunk_bounds(chunk)
+            if (high < best[-1][0]) if desc else (low > best[-1][0]):
+                break
+        first, values = next(values_iter)
+        decoded += 1
+        found = []
+        for i, ts in enumerate(values["datetime_ts"]):
+            key = (_NULL_TS if ts is None else ts, first + i)
+            if after is not None and ((key >= after) if desc else (key <= after)):
+                continue
+            if all(test(values, i) for test in tests):
+                found.append(key)
+        best = (heapq.nlargest if desc else heapq.nsmallest)(want, best + found)
+    values_iter.close()
+
+    page = best[:limit]
+    found_rows = archive.rows_at([rowid for _, rowid in page])
+    rows = []
+    for _, rowid in page:
+        row = found_rows[rowid]
+        del row["datetime_ts"]
+        rows.append(row)
+    last = None
+    if len(best) > limit:
+        ts, rowid = page[-1]
+        last = (None if ts == _NULL_TS else ts, rowid)
+    return rows, last, decoded
+
+def _archive_file(report_id: str) -> Path:
+    archive_dir = _archive_dir()
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    name = re.sub(r"[^\w.-]", "_", report_id)
+    path = archive_dir / f"{name}.zip"
+    suffix = 1
+    while path.exists():
+        path = archive_dir / f"{name}.{suffix}.zip"
+        suffix += 1
+    return path
+
+def _write_archive(report_id: str, path: Path) -> int:
+    """Écrit les entrées du rapport dans `path` ; retourne le nombre de lignes."""
+    rows = chunks = 0
+    index: List[Dict] = []
+    conn = get_connection(readonly=True)
+    try:
+        cur = conn.execute(
+            f"""
+            SELECT {ENTRY_SELECT}, e.datetime_ts AS datetime_ts
+            FROM {ENTRY_FROM}
+            WHERE e.report_key = {_REPORT_KEY_SQL}
+            ORDER BY e.id
+            """,
+            (report_id,),
+        )
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+            while True:
+                batch = cur.fetchmany(ARCHIVE_CHUNK_ROWS)
+                if not batch:
+                    break
+                for column in ARCHIVE_COLUMNS:
+                    zf.writestr(
+                        EntryArchive._member(chunks, column),
+                        json.dumps([r[column] for r in batch], ensure_ascii=False, separators=(",", ":")),
+                    )
+                timestamps = [_NULL_TS if r["datetime_ts"] is None else r["datetime_ts"] for r in batch]
+                index.append({"rows": len(batch), "ts_min": min(timestamps), "ts_max": max(timestamps)})
+                rows += len(batch)
+                chunks += 1
+            zf.writestr("manifest.json", json.dumps({
+                "format": ARCHIVE_FORMAT,
+                "report_id": report_id,
+                "rows": rows,
+                "chunk_rows": ARCHIVE_CHUNK_ROWS,
+                "chunks": chunks,
+                "columns": list(ARCHIVE_COLUMNS),
+                "index": index,
+                "archived_at": datetime.now(timezone.utc).isoformat(),
+            }))
+    finally:
+        conn.close()
+    return rows
+
+def _purge_entries(report_id: str) -> int:
+    """Supprime les entrées d'un rapport archivé par lots, une transaction par lot."""
+    deleted = 0
+    while True:
+        with write_transaction() as conn:
+            count = conn.execute(
+                f"""
+                DELETE FROM entries WHERE id IN (
+                    SELECT id FROM entries WHERE report_key = {_REPORT_KEY_SQL} LIMIT ?
+                )
+                """,
+                (report_id, settings.db_backfill_batch_size),
+            ).rowcount
+        deleted += count
+        if count < settings.db_backfill_batch_size:
+            return deleted
+        time.sleep(settings.db_backfill_pause_ms / 1000)
+
+@_on_report_database
+def archive_report(report_id: str) -> Dict:
+    """Archive les entrées d'un rapport puis les retire de la base.
+
+    L'archive est écrite hors verrou, puis le rapport est basculé dessus
+    dans une transaction qui vérifie qu'il n'a pas été réimporté entre-temps
+    et fige ses cumuls journaliers. Les entrées sont ensuite supprimées par
+    lots, et les pages libérées rendues au système si la base le permet.
+    Lève ValueError si le rapport est introuvable ou déjà archivé, ou si
+    la conversion des anciennes entrées n'est pas terminée.
+    """
+    conn = get_connection(readonly=True)
+    try:
+        report = conn.execute(
+            "SELECT created_at, archive_path FROM reports WHERE id = ? AND deleted_at IS NULL", (report_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if report is None:
+        raise ValueError(f"Rapport introuvable: {report_id}")
+    if report["archive_path"]:
+        raise ValueError(f"Rapport déjà archivé: {report_id}")
+    if backfill_pending(COMPACT_BACKFILL):
+        raise ValueError(f"Conversion des anciennes entrées en cours, archivage différé: {report_id}")
+
+    path = _archive_file(report_id)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        rows = _write_archive(report_id, tmp_path)
+        with write_transaction() as wconn:
+            cur = wconn.cursor()
+            current = cur.execute(
+                f"""
+                SELECT r.created_at, r.archive_path, r.deleted_at,
+                       (SELECT COUNT(*) FROM entries WHERE report_key = {_REPORT_KEY_SQL}) AS entries
+                FROM reports r WHERE r.id = ?
+                """,
+                (report_id, report_id),
+            ).fetchone()
+            if (current is None or current["archive_path"] or current["deleted_at"]
+                    or current["created_at"] != report["created_at"]
+                    or current["entries"] != rows):
+                raise RuntimeError(f"Rapport modifié pendant l'archivage: {report_id}")
+            os.replace(tmp_path, path)
+            _write_report_rollups(cur, report_id)
+            cur.execute(
+                "UPDATE reports SET archived_at = ?, archive_path = ? WHERE id = ?",
+                (datetime.now(timezone.utc).isoformat(), str(path), report_id),
+            )
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    invalidate_entry_counts([report_id])
+    invalidate_report_catalog()
+    _sync_catalog(report_id)
+
+    deleted = _purge_entries(report_id)
+    reclaimed = reclaim_free_pages()
+    logger.info("Rapport %s archivé (%d entrées): %s", report_id, rows, path)
+    return {
+        "report_id": report_id, "entries": rows, "deleted": deleted,
+        "pages_reclaimed": reclaimed, "archive_path": str(path),
+        "archive_size": path.stat().st_size,
+    }
+
+def archive_old_reports(older_than_days: Optional[int] = None, now: Optional[datetime] = None,
+                        limit: Optional[int] = None) -> List[Dict]:
+    """Archive les rapports importés depuis plus de `older_than_days` jours.
+
+    0 désactive l'archivage. Termine d'abord la purge des rapports archivés
+    dont des entrées restent en base (archivage interrompu). Retourne les
+    rapports archivés.
+    """
+    if older_than_days is None:
+        older_than_days = settings.archive_after_days
+    if older_than_days <= 0:
+        return []
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=older_than_days)).strftime("%Y-%m-%dT%H:%M:%S")
+
+    # Le catalogue recense aussi les rapports des bases par contrat.
+    conn = get_connection(readonly=True, path=settings.database_path)
+    try:
+        candidates = [r[0] for r in conn.execute(
+            "SELECT id FROM reports WHERE archive_path IS NULL AND deleted_at IS NULL AND created_at < ?"
+            " ORDER BY created_at, id"
+            + (" LIMIT ?" if limit else ""),
+            (cutoff, limit) if limit else (cutoff,),
+        )]
+    finally:
+        conn.close()
+
+    for path in all_databases():
+        with using_database(path):
+            conn = get_connection(readonly=True)
+            try:
+                unfinished = [r[0] for r in conn.execute(
+                    """
+                    SELECT r.id FROM reports r JOIN report_keys k ON k.report_id = r.id
+                    WHERE r.archive_path IS NOT NULL AND r.deleted_at IS NULL
+                      AND EXISTS (SELECT 1 FROM entries WHERE report_key = k.id)
+                    """
+                )]
+            finally:
+                conn.close()
+            for report_id in unfinished:
+                logger.info("Reprise de la purge du rapport archivé %s", report_id)
+                _purge_entries(report_id)
+    archived = []
+    for report_id in candidates:
+        try:
+            archived.append(archive_report(report_id))
+        except (ValueError, RuntimeError) as e:
+            logger.warning("Archivage ignoré: %s", e)
+    return archived
@@ -12,8 +12,9 @@ Trois méthodes de détection (par priorité) :
 
 Architecture :
   AsteriskEngine
-    ├── Cache BDD (tone_detection_cache)
+    ├── Cache BDD (tone_detection_cache, écriture différée par lots)
     ├── AMI : Originate → AMD() + FaxDetect
+    ├── Écoute AMI passive : FAXStatus / AMD sur le trafic réel (optionnelle)
     ├── Plages SDA manuelles (fallback)
     └── Classification préfixe FR (fallback)
 
@@ -25,11 +26,14 @@ Tonalités fax :
 
 from __future__ import annotations
 
+import atexit
+import itertools
 import json
 import logging
 import re
 import socket
 import sqlite3
+import threading
 import time
 import uuid
 import os
@@ -39,6 +43,8 @@ from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 
 from .config import settings, ensure_directories
+from .connection import get_connection, using_database, write_transaction
+from .migrations import Migration, add_column, migrate
 
 logger = logging.getLogger(__name__)
 
@@ -92,6 +98,7 @@ class AMIConfig:
     trunk: str = ""
     cache_ttl_hours: int = 24 * 7
     simulation: bool = False
+    passive_listener: bool = False
 
 @dataclass
 class SDARange:
@@ -467,17 +474,17 @@ class AMIConnection:
                 current[key.strip()] = val.strip()
         return items
 
-def _connect_db() -> sqlite3.Connection:
-    ensure_directories()
-    conn = sqlite3.connect(settings.database_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Tables Asterisk (plages SDA, cache tonalité) : toujours dans la base
+# principale, même pendant un traitement sur une base par contrat.
+def _connect_db(readonly: bool = False) -> sqlite3.Connection:
+    return get_connection(readonly=readonly, path=settings.database_path)
 
-def init_asterisk_tables() -> None:
-    """Crée les tables pour la configuration Asterisk/SDA."""
-    conn = _connect_db()
-    cur = conn.cursor()
+def _write_db():
+    return write_transaction(settings.database_path)
+
+ASTERISK_SCHEMA = "asterisk"
 
+def _migration_asterisk_tables(cur: sqlite3.Cursor) -> None:
     cur.execute("""
         CREATE TABLE IF NOT EXISTS asterisk_config (
             id INTEGER PRIMARY KEY CHECK (id = 1),
@@ -521,65 +528,72 @@ def init_asterisk_tables() -> None:
             amd_status TEXT DEFAULT '',
             amd_cause TEXT DEFAULT '',
             detected_at TEXT NOT NULL,
-            expires_at TEXT NOT NULL
+            expires_at TEXT NOT NULL,
+            stable_count INTEGER DEFAULT 1,
+            ttl_hours INTEGER DEFAULT 168,
+            source TEXT DEFAULT 'call'
         )
     """)
 
-    for stmt in (
-        "ALTER TABLE fax_entries ADD COLUMN numero_type TEXT DEFAULT 'unknown'",
-        "ALTER TABLE fax_entries ADD COLUMN numero_type_label TEXT DEFAULT ''",
-    ):
-        try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
-
-    for stmt in (
-        "ALTER TABLE asterisk_config ADD COLUMN ami_context TEXT DEFAULT 'faxcloud-detect'",
-        "ALTER TABLE asterisk_config ADD COLUMN ami_caller_id TEXT DEFAULT 'FaxCloudTest'",
-        "ALTER TABLE asterisk_config ADD COLUMN ami_call_timeout INTEGER DEFAULT 15",
-        "ALTER TABLE asterisk_config ADD COLUMN ami_detect_timeout INTEGER DEFAULT 10",
-        "ALTER TABLE asterisk_config ADD COLUMN ami_trunk TEXT DEFAULT ''",
-        "ALTER TABLE asterisk_config ADD COLUMN cache_ttl_hours INTEGER DEFAULT 168",
-        "ALTER TABLE asterisk_config ADD COLUMN ami_simulation INTEGER DEFAULT 0",
+    # Bases créées avant les migrations : colonnes ajoutées au fil des versions.
+    add_column(cur, "tone_detection_cache", "stable_count", "INTEGER DEFAULT 1")
+    add_column(cur, "tone_detection_cache", "ttl_hours", "INTEGER DEFAULT 168")
+    add_column(cur, "tone_detection_cache", "source", "TEXT DEFAULT 'call'")
+    for column, decl in (
+        ("ami_context", "TEXT DEFAULT 'faxcloud-detect'"),
+        ("ami_caller_id", "TEXT DEFAULT 'FaxCloudTest'"),
+        ("ami_call_timeout", "INTEGER DEFAULT 15"),
+        ("ami_detect_timeout", "INTEGER DEFAULT 10"),
+        ("ami_trunk", "TEXT DEFAULT ''"),
+        ("cache_ttl_hours", "INTEGER DEFAULT 168"),
+        ("ami_simulation", "INTEGER DEFAULT 0"),
+        ("ami_passive_listener", "INTEGER DEFAULT 0"),
     ):
-        try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
+        add_column(cur, "asterisk_config", column, decl)
 
     cur.execute("INSERT OR IGNORE INTO asterisk_config (id) VALUES (1)")
-    conn.commit()
-    conn.close()
-    logger.info("Tables Asterisk initialisées")
+
+ASTERISK_MIGRATIONS = (
+    Migration(1, "configuration AMI, plages SDA et cache tonalité", _migration_asterisk_tables),
+)
+
+def init_asterisk_tables() -> None:
+    """Applique les migrations des tables Asterisk/SDA (après `init_database`)."""
+    migrate(ASTERISK_SCHEMA, ASTERISK_MIGRATIONS)
 
 def get_sda_ranges() -> List[Dict]:
-    conn = _connect_db()
+    conn = _connect_db(readonly=True)
     cur = conn.cursor()
     cur.execute("SELECT * FROM sda_ranges ORDER BY prefix, range_start")
     rows = [dict(r) for r in cur.fetchall()]
     conn.close()
     return rows
 
+def get_sda_range(range_id: int) -> Optional[Dict]:
+    conn = _connect_db(readonly=True)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM sda_ranges WHERE id = ?", (range_id,))
+    row = cur.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
 def add_sda_range(label: str, prefix: str, range_start: str = "", range_end: str = "",
                   site: str = "", description: str = "") -> Dict:
     from datetime import datetime, timezone
-    conn = _connect_db()
-    cur = conn.cursor()
-    now = datetime.now(timezone.utc).isoformat()
-    cur.execute(
-        """
-        INSERT INTO sda_ranges (label, prefix, range_start, range_end, site, description, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (label, prefix.strip(), range_start.strip(), range_end.strip(), site, description, now, now),
-    )
-    conn.commit()
-    row_id = cur.lastrowid
-    conn.close()
-    logger.info("Plage SDA ajoutée: %s (prefix=%s)", label, prefix)
-    return {"id": row_id, "label": label, "prefix": prefix, "range_start": range_start,
-            "range_end": range_end, "site": site, "description": description}
+    with _write_db() as conn:
+        cur = conn.cursor()
+        now = datetime.now(timezone.utc).isoformat()
+        cur.execute(
+            """
+            INSERT INTO sda_ranges (label, prefix, range_start, range_end, site, description, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (label, prefix.strip(), range_start.strip(), range_end.strip(), site, description, now, now),
+        )
+        row_id = cur.lastrowid
+        logger.info("Plage SDA ajoutée: %s (prefix=%s)", label, prefix)
+        return {"id": row_id, "label": label, "prefix": prefix, "range_start": range_start,
+                "range_end": range_end, "site": site, "description": description}
 
 def update_sda_range(range_id: int, **kwargs) -> bool:
     from datetime import datetime, timezone
@@ -590,25 +604,21 @@ def update_sda_range(range_id: int, **kwargs) -> bool:
     updates["updated_at"] = datetime.now(timezone.utc).isoformat()
     set_clause = ", ".join(f"{k} = ?" for k in updates)
     values = list(updates.values()) + [range_id]
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute(f"UPDATE sda_ranges SET {set_clause} WHERE id = ?", values)
-    conn.commit()
-    changed = cur.rowcount > 0
-    conn.close()
-    return changed
+    with _write_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"UPDATE sda_ranges SET {set_clause} WHERE id = ?", values)
+        changed = cur.rowcount > 0
+        return changed
 
 def delete_sda_range(range_id: int) -> bool:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM sda_ranges WHERE id = ?", (range_id,))
-    conn.commit()
-    changed = cur.rowcount > 0
-    conn.close()
-    return changed
+    with _write_db() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM sda_ranges WHERE id = ?", (range_id,))
+        changed = cur.rowcount > 0
+        return changed
 
 def get_ami_config() -> Dict:
-    conn = _connect_db()
+    conn = _connect_db(readonly=True)
     cur = conn.cursor()
     cur.execute("SELECT * FROM asterisk_config WHERE id = 1")
     row = cur.fetchone()
@@ -629,94 +639,396 @@ def get_ami_config() -> Dict:
             "ami_secret": "", "ami_enabled": 0, "ami_context": "faxcloud-detect",
             "ami_caller_id": "FaxCloudTest", "ami_call_timeout": 15,
             "ami_detect_timeout": 10, "ami_trunk": "", "cache_ttl_hours": 168,
-            "ami_simulation": 0}
+            "ami_simulation": 0, "ami_passive_listener": 0}
 
 def save_ami_config(host: str, port: int, username: str, secret: str, enabled: bool,
                     context: str = "faxcloud-detect", caller_id: str = "FaxCloudTest",
                     call_timeout: int = 15, detect_timeout: int = 10,
                     trunk: str = "", cache_ttl_hours: int = 168,
-                    simulation: bool = False) -> None:
-    conn = _connect_db()
-    cur = conn.cursor()
-    now = datetime.now(timezone.utc).isoformat()
-    cur.execute(
-        """
-        INSERT OR REPLACE INTO asterisk_config
-        (id, ami_host, ami_port, ami_username, ami_secret, ami_enabled,
-         ami_context, ami_caller_id, ami_call_timeout, ami_detect_timeout,
-         ami_trunk, cache_ttl_hours, ami_simulation, updated_at)
-        VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (host, port, username, secret, 1 if enabled else 0,
-         context, caller_id, call_timeout, detect_timeout,
-         trunk, cache_ttl_hours, 1 if simulation else 0, now),
-    )
-    conn.commit()
-    conn.close()
+                    simulation: bool = False, passive_listener: bool = False) -> None:
+    with _write_db() as conn:
+        cur = conn.cursor()
+        now = datetime.now(timezone.utc).isoformat()
+        cur.execute(
+            """
+            INSERT OR REPLACE INTO asterisk_config
+            (id, ami_host, ami_port, ami_username, ami_secret, ami_enabled,
+             ami_context, ami_caller_id, ami_call_timeout, ami_detect_timeout,
+             ami_trunk, cache_ttl_hours, ami_simulation, ami_passive_listener, updated_at)
+            VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (host, port, username, secret, 1 if enabled else 0,
+             context, caller_id, call_timeout, detect_timeout,
+             trunk, cache_ttl_hours, 1 if simulation else 0,
+             1 if passive_listener else 0, now),
+        )
+
+# TTL adaptatif : un résultat fax/voix confirmé par plusieurs détections
+# successives vit plus longtemps (jusqu'à x4), un résultat occupé / pas de
+# réponse / incertain est revérifié plus tôt.
+_TTL_MAX_STABLE_FACTOR = 4
+_TTL_SHORT_HOURS = {
+    TONE_BUSY: 6,
+    TONE_NO_ANSWER: 12,
+    TONE_UNKNOWN: 24,
+}
+
+_TONE_CACHE_COLUMNS = (
+    "numero", "tone", "is_fax", "details", "duration_ms", "hangup_cause",
+    "amd_status", "amd_cause", "detected_at", "expires_at", "stable_count", "ttl_hours",
+    "source",
+)
 
-def get_cached_tone(numero: str) -> Optional[Dict]:
-    """Retourne le résultat en cache si valide, sinon None."""
-    conn = _connect_db()
+class ToneCacheWriter:
+    """
+    Tampon write-behind pour tone_detection_cache.
+
+    Les résultats de détection sont gardés en mémoire puis écrits par lots
+    (une transaction, un executemany) dès que `max_pending` résultats sont en
+    attente ou toutes les `flush_interval` secondes. Les lectures passent
+    d'abord par le tampon : un résultat en attente est visible immédiatement,
+    y compris pendant son écriture (lot "en vol" jusqu'au dernier commit).
+    """
+
+    def __init__(self, max_pending: int = settings.tone_cache_flush_size,
+                 flush_interval: float = settings.tone_cache_flush_interval):
+        self.max_pending = max(1, int(max_pending))
+        self.flush_interval = max(0.1, float(flush_interval))
+        self._pending: Dict[str, Dict] = {}
+        self._inflight: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, row: Dict) -> None:
+        with self._lock:
+            self._pending[row["numero"]] = row
+            full = len(self._pending) >= self.max_pending
+            self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def get(self, numero: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._pending.get(numero) or self._inflight.get(numero)
+            return dict(row) if row else None
+
+    def pending(self) -> List[Dict]:
+        with self._lock:
+            rows = {**self._inflight, **self._pending}
+            return [dict(r) for r in rows.values()]
+
+    def flush(self) -> int:
+        """Écrit les résultats en attente en une seule transaction."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._inflight = self._pending
+                self._pending = {}
+            if not batch:
+                return 0
+            from .db import record_number_tones, shard_databases
+
+            try:
+                with _write_db() as conn:
+                    conn.executemany(
+                        f"""
+                        INSERT OR REPLACE INTO tone_detection_cache
+                        ({", ".join(_TONE_CACHE_COLUMNS)})
+                        VALUES ({", ".join("?" for _ in _TONE_CACHE_COLUMNS)})
+                        """,
+                        [tuple(r[c] for c in _TONE_CACHE_COLUMNS) for r in batch.values()],
+                    )
+                    # Dernier résultat connu, gardé sur la dimension des numéros.
+                    record_number_tones(conn.cursor(), list(batch.values()))
+                for path in shard_databases():
+                    with write_transaction(path) as conn:
+                        record_number_tones(conn.cursor(), list(batch.values()))
+            except sqlite3.Error as e:
+                logger.warning("Écriture du cache tonalité échouée (%d résultats): %s", len(batch), e)
+                with self._lock:
+                    for numero, row in batch.items():
+                        self._pending.setdefault(numero, row)
+                    self._inflight = {}
+                return 0
+            with self._lock:
+                self._inflight = {}
+            logger.debug("Cache tonalité: %d résultats écrits", len(batch))
+            return len(batch)
+
+    def close(self) -> None:
+        """Arrête le thread d'écriture et vide le tampon (arrêt propre)."""
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="tone-cache-writer", daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+_tone_cache_writer = ToneCacheWriter()
+atexit.register(_tone_cache_writer.close)
+
+def flush_tone_cache() -> int:
+    """Force l'écriture des résultats de détection en attente."""
+    return _tone_cache_writer.flush()
+
+def _adaptive_ttl_hours(tone: str, stable_count: int, base_ttl_hours: int) -> int:
+    """TTL d'un résultat selon la tonalité et sa stabilité."""
+    base = max(1, int(base_ttl_hours))
+    if tone in _TTL_SHORT_HOURS:
+        return min(base, _TTL_SHORT_HOURS[tone])
+    return base * max(1, min(int(stable_count), _TTL_MAX_STABLE_FACTOR))
+
+def _load_tone_row(numero: str) -> Optional[Dict]:
+    pending = _tone_cache_writer.get(numero)
+    if pending:
+        return pending
+    conn = _connect_db(readonly=True)
     cur = conn.cursor()
-    now = datetime.now(timezone.utc).isoformat()
-    cur.execute(
-        "SELECT * FROM tone_detection_cache WHERE numero = ? AND expires_at > ?",
-        (numero, now),
-    )
+    cur.execute("SELECT * FROM tone_detection_cache WHERE numero = ?", (numero,))
     row = cur.fetchone()
     conn.close()
     return dict(row) if row else None
 
+def get_cached_tone(numero: str, allow_stale: bool = False) -> Optional[Dict]:
+    """Retourne le résultat en cache si valide, sinon None.
+
+    Avec allow_stale=True, un résultat expiré depuis moins de
+    `Settings.tone_cache_stale_hours` est encore retourné, marqué `stale=True`.
+    """
+    row = _load_tone_row(numero)
+    if not row:
+        return None
+
+    now = datetime.now(timezone.utc)
+    if row["expires_at"] > now.isoformat():
+        row["stale"] = False
+        return row
+    if not allow_stale:
+        return None
+
+    stale_limit = (now - timedelta(hours=settings.tone_cache_stale_hours)).isoformat()
+    if row["expires_at"] <= stale_limit:
+        return None
+    row["stale"] = True
+    return row
+
 def save_tone_cache(result: Dict, ttl_hours: int = 168) -> None:
-    """Sauvegarde un résultat de détection en cache."""
-    conn = _connect_db()
-    cur = conn.cursor()
+    """Sauvegarde un résultat de détection en cache (écriture différée).
+
+    `ttl_hours` est le TTL de base ; le TTL effectif est adapté à la
+    tonalité et au nombre de détections identiques consécutives.
+    """
+    numero = result["numero"]
+    tone = result["tone"]
+    previous = _load_tone_row(numero)
+    if previous and previous.get("tone") == tone:
+        stable_count = int(previous.get("stable_count") or 1) + 1
+    else:
+        stable_count = 1
+
+    effective_ttl = _adaptive_ttl_hours(tone, stable_count, ttl_hours)
     now = datetime.now(timezone.utc)
-    expires = now + timedelta(hours=ttl_hours)
-    cur.execute(
-        """
-        INSERT OR REPLACE INTO tone_detection_cache
-        (numero, tone, is_fax, details, duration_ms, hangup_cause, amd_status, amd_cause,
-         detected_at, expires_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            result["numero"],
-            result["tone"],
-            1 if result.get("is_fax") else 0,
-            result.get("details", ""),
-            result.get("duration_ms", 0),
-            result.get("hangup_cause", 0),
-            result.get("amd_status", ""),
-            result.get("amd_cause", ""),
-            now.isoformat(),
-            expires.isoformat(),
-        ),
-    )
-    conn.commit()
-    conn.close()
+    expires = now + timedelta(hours=effective_ttl)
+    _tone_cache_writer.put({
+        "numero": numero,
+        "tone": tone,
+        "is_fax": 1 if result.get("is_fax") else 0,
+        "details": result.get("details", ""),
+        "duration_ms": result.get("duration_ms", 0),
+        "hangup_cause": result.get("hangup_cause", 0),
+        "amd_status": result.get("amd_status", ""),
+        "amd_cause": result.get("amd_cause", ""),
+        "detected_at": now.isoformat(),
+        "expires_at": expires.isoformat(),
+        "stable_count": stable_count,
+        "ttl_hours": effective_ttl,
+        "source": result.get("source") or ("simulation" if result.get("from_simulation") else "call"),
+    })
+
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.tone_refresh_workers), thread_name_prefix="tone-refresh",
+)
+_refresh_in_flight: set = set()
+_refresh_lock = threading.Lock()
 
 def get_all_cached_tones() -> List[Dict]:
     """Retourne tous les résultats en cache (même expirés)."""
-    conn = _connect_db()
+    conn = _connect_db(readonly=True)
     cur = conn.cursor()
     cur.execute("SELECT * FROM tone_detection_cache ORDER BY detected_at DESC")
-    rows = [dict(r) for r in cur.fetchall()]
+    rows = {r["numero"]: dict(r) for r in cur.fetchall()}
     conn.close()
-    return rows
+    for row in _tone_cache_writer.pending():
+        rows[row["numero"]] = row
+    return sorted(rows.values(), key=lambda r: r.get("detected_at") or "", reverse=True)
 
 def clear_tone_cache(numero: Optional[str] = None) -> int:
     """Supprime le cache (un numéro ou tout)."""
-    conn = _connect_db()
-    cur = conn.cursor()
-    if numero:
-        cur.execute("DELETE FROM tone_detection_cache WHERE numero = ?", (numero,))
+    _tone_cache_writer.flush()
+    with _write_db() as conn:
+        cur = conn.cursor()
+        if numero:
+            cur.execute("DELETE FROM tone_detection_cache WHERE numero = ?", (numero,))
+        else:
+            cur.execute("DELETE FROM tone_detection_cache")
+        count = cur.rowcount
+        return count
+
+@dataclass(frozen=True)
+class CompiledRange:
+    """Plage SDA pré-calculée (voir `_compile_sda_ranges`)."""
+    range_start: str = ""
+    range_end: str = ""
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+@dataclass(frozen=True)
+class EngineSnapshot:
+    """
+    État immuable et versionné du moteur de classification.
+
+    Une modification de configuration construit un nouveau snapshot à partir
+    du précédent (seule la partie modifiée est relue) puis le publie
+    atomiquement ; une classification en cours garde le snapshot avec
+    lequel elle a démarré.
+    """
+    version: int
+    sda_ranges: Tuple[Dict, ...]
+    compiled_ranges: Dict[str, Tuple[CompiledRange, ...]]
+    prefix_lengths: Tuple[int, ...]
+    ami_config: AMIConfig
+    ami_peers: Tuple[str, ...] = ()
+    peers_refreshed_at: float = 0.0
+
+def _ami_config_from_row(config: Dict) -> AMIConfig:
+    return AMIConfig(
+        host=config.get("ami_host", "127.0.0.1"),
+        port=config.get("ami_port", 5038),
+        username=config.get("ami_username", "admin"),
+        secret=config.get("ami_secret", ""),
+        enabled=bool(config.get("ami_enabled", 0)),
+        context=config.get("ami_context", "faxcloud-detect"),
+        caller_id=config.get("ami_caller_id", "FaxCloudTest"),
+        call_timeout=config.get("ami_call_timeout", 15),
+        detect_timeout=config.get("ami_detect_timeout", 10),
+        trunk=config.get("ami_trunk", ""),
+        cache_ttl_hours=config.get("cache_ttl_hours", 168),
+        simulation=bool(config.get("ami_simulation", 0)),
+        passive_listener=bool(config.get("ami_passive_listener", 0)),
+    )
+
+def _compile_sda_ranges(
+    ranges: List[Dict],
+) -> Tuple[Dict[str, Tuple[CompiledRange, ...]], Tuple[int, ...]]:
+    """Indexe les plages SDA par préfixe (recherche par longueur de préfixe)."""
+    compiled: Dict[str, List[CompiledRange]] = {}
+    for sda in ranges:
+        prefix = sda.get("prefix", "") or ""
+        if not prefix:
+            continue
+        range_start = sda.get("range_start", "") or ""
+        range_end = sda.get("range_end", "") or ""
+        start = end = None
+        if range_start and range_end:
+            try:
+                start, end = int(range_start), int(range_end)
+            except (ValueError, TypeError):
+                start = end = None
+        compiled.setdefault(prefix, []).append(
+            CompiledRange(range_start=range_start, range_end=range_end, start=start, end=end)
+        )
+    lengths = tuple(sorted({len(p) for p in compiled}))
+    return {p: tuple(specs) for p, specs in compiled.items()}, lengths
+
+def fetch_ami_peers(config: AMIConfig) -> Optional[Tuple[str, ...]]:
+    """Récupère les numéros SDA depuis Asterisk via AMI (None si injoignable)."""
+    ami = AMIConnection(config)
+    if not ami.connect():
+        return None
+    peers_found: List[str] = []
+    try:
+        peers = ami.get_pjsip_endpoints()
+        if not peers:
+            peers = ami.get_sip_peers()
+
+        for peer in peers:
+            callerid = peer.get("Callerid", peer.get("CallerID", ""))
+            match = re.search(r'<(\d+)>', callerid)
+            if match:
+                peers_found.append(match.group(1))
+            obj_name = peer.get("ObjectName", peer.get("Endpoint", ""))
+            if obj_name and obj_name.isdigit():
+                peers_found.append(obj_name)
+
+        logger.info("AMI: %d peers/endpoints récupérés", len(peers_found))
+    finally:
+        ami.disconnect()
+    return tuple(dict.fromkeys(peers_found))
+
+_snapshot_versions = itertools.count(1)
+
+def build_snapshot(
+    previous: Optional[EngineSnapshot] = None,
+    *,
+    sda_ranges: Optional[List[Dict]] = None,
+    ami_config: Optional[AMIConfig] = None,
+    ami_peers: Optional[Tuple[str, ...]] = None,
+) -> EngineSnapshot:
+    """
+    Construit un nouveau snapshot à partir du précédent.
+
+    Les parties non fournies sont reprises telles quelles du snapshot
+    précédent (ou relues en BDD s'il n'y en a pas). Les peers AMI ne sont
+    jamais récupérés ici : voir `refresh_engine_peers`.
+    """
+    if sda_ranges is not None:
+        ranges = tuple(dict(r) for r in sda_ranges)
+        compiled, lengths = _compile_sda_ranges(list(ranges))
+    elif previous is not None:
+        ranges = previous.sda_ranges
+        compiled, lengths = previous.compiled_ranges, previous.prefix_lengths
     else:
-        cur.execute("DELETE FROM tone_detection_cache")
-    count = cur.rowcount
-    conn.commit()
-    conn.close()
-    return count
+        ranges = tuple(get_sda_ranges())
+        compiled, lengths = _compile_sda_ranges(list(ranges))
+
+    if ami_config is None:
+        ami_config = previous.ami_config if previous is not None else _ami_config_from_row(get_ami_config())
+
+    peers_refreshed_at = previous.peers_refreshed_at if previous is not None else 0.0
+    if ami_peers is not None:
+        peers_refreshed_at = time.time()
+    elif not ami_config.enabled:
+        ami_peers = ()
+    elif previous is not None:
+        ami_peers = previous.ami_peers
+    else:
+        ami_peers = ()
+
+    return EngineSnapshot(
+        version=next(_snapshot_versions),
+        sda_ranges=ranges,
+        compiled_ranges=compiled,
+        prefix_lengths=lengths,
+        ami_config=ami_config,
+        ami_peers=tuple(ami_peers),
+        peers_refreshed_at=peers_refreshed_at,
+    )
 
 class AsteriskEngine:
     """
@@ -727,64 +1039,51 @@ class AsteriskEngine:
       2. Plages SDA manuelles : préfixes configurés
       3. Appel test AMI : Originate + AMD/FaxDetect (si activé)
       4. Classification préfixe FR : fallback
+
+    Un moteur est lié à un `EngineSnapshot` immuable : une mise à jour de
+    configuration publie un nouveau moteur au lieu de modifier celui-ci.
     """
 
-    def __init__(self):
-        self._sda_ranges: List[Dict] = []
-        self._ami_config: Optional[AMIConfig] = None
-        self._ami_peers: List[str] = []
-        self._loaded = False
+    def __init__(self, snapshot: Optional[EngineSnapshot] = None):
+        self._snapshot = snapshot
 
-    def load(self) -> None:
-        """Charge la configuration depuis la BDD."""
-        self._sda_ranges = get_sda_ranges()
-
-        config = get_ami_config()
-        self._ami_config = AMIConfig(
-            host=config.get("ami_host", "127.0.0.1"),
-            port=config.get("ami_port", 5038),
-            username=config.get("ami_username", "admin"),
-            secret=config.get("ami_secret", ""),
-            enabled=bool(config.get("ami_enabled", 0)),
-            context=config.get("ami_context", "faxcloud-detect"),
-            caller_id=config.get("ami_caller_id", "FaxCloudTest"),
-            call_timeout=config.get("ami_call_timeout", 15),
-            detect_timeout=config.get("ami_detect_timeout", 10),
-            trunk=config.get("ami_trunk", ""),
-            cache_ttl_hours=config.get("cache_ttl_hours", 168),
-            simulation=bool(config.get("ami_simulation", 0)),
-        )
+    @property
+    def _loaded(self) -> bool:
+        return self._snapshot is not None
 
-        if self._ami_config.enabled:
-            self._load_ami_peers()
+    @property
+    def snapshot(self) -> EngineSnapshot:
+        if self._snapshot is None:
+            self.load()
+        return self._snapshot
 
-        self._loaded = True
-        logger.info("AsteriskEngine chargé: %d plages SDA, AMI %s",
-                     len(self._sda_ranges),
-                     "activé" if self._ami_config.enabled else "désactivé")
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
 
-    def _load_ami_peers(self) -> None:
-        """Récupère les numéros SDA depuis Asterisk via AMI."""
-        ami = AMIConnection(self._ami_config)
-        if not ami.connect():
-            return
-        try:
-            peers = ami.get_pjsip_endpoints()
-            if not peers:
-                peers = ami.get_sip_peers()
-
-            for peer in peers:
-                callerid = peer.get("Callerid", peer.get("CallerID", ""))
-                match = re.search(r'<(\d+)>', callerid)
-                if match:
-                    self._ami_peers.append(match.group(1))
-                obj_name = peer.get("ObjectName", peer.get("Endpoint", ""))
-                if obj_name and obj_name.isdigit():
-                    self._ami_peers.append(obj_name)
-
-            logger.info("AMI: %d peers/endpoints récupérés", len(self._ami_peers))
-        finally:
-            ami.disconnect()
+    @property
+    def _sda_ranges(self) -> Tuple[Dict, ...]:
+        return self.snapshot.sda_ranges
+
+    @property
+    def _ami_config(self) -> AMIConfig:
+        return self.snapshot.ami_config
+
+    @property
+    def _ami_peers(self) -> Tuple[str, ...]:
+        return self.snapshot.ami_peers
+
+    def load(self) -> None:
+        """Charge la configuration depuis la BDD (snapshot complet, peers AMI inclus)."""
+        snapshot = build_snapshot()
+        if snapshot.ami_config.enabled:
+            peers = fetch_ami_peers(snapshot.ami_config)
+            snapshot = build_snapshot(snapshot, ami_peers=peers or ())
+        self._snapshot = snapshot
+        logger.info("AsteriskEngine chargé (v%d): %d plages SDA, AMI %s",
+                     snapshot.version,
+                     len(snapshot.sda_ranges),
+                     "activé" if snapshot.ami_config.enabled else "désactivé")
 
     def detect_tone(self, numero: str, force: bool = False) -> Dict:
         """
@@ -804,9 +1103,12 @@ class AsteriskEngine:
             return AMIConnection._error_result(numero, "AMI non activé")
 
         if not force:
-            cached = get_cached_tone(numero)
+            cached = get_cached_tone(numero, allow_stale=True)
             if cached:
-                logger.info("Cache hit pour %s: %s", numero, cached.get("tone"))
+                logger.info("Cache hit pour %s: %s%s", numero, cached.get("tone"),
+                            " (périmé, revalidation)" if cached["stale"] else "")
+                if cached["stale"]:
+                    self._schedule_refresh(numero)
                 cached["from_cache"] = True
                 return cached
 
@@ -828,6 +1130,30 @@ class AsteriskEngine:
         result["from_cache"] = False
         return result
 
+    def _schedule_refresh(self, numero: str) -> None:
+        """Relance une détection en arrière-plan pour un résultat périmé."""
+        if not self._ami_config or not self._ami_config.enabled:
+            return
+        with _refresh_lock:
+            if numero in _refresh_in_flight:
+                return
+            _refresh_in_flight.add(numero)
+
+        def _refresh() -> None:
+            try:
+                self.detect_tone(numero, force=True)
+            except Exception as e:
+                logger.warning("Revalidation tonalité %s échouée: %s", numero, e)
+            finally:
+                with _refresh_lock:
+                    _refresh_in_flight.discard(numero)
+
+        try:
+            _refresh_executor.submit(_refresh)
+        except RuntimeError:
+            with _refresh_lock:
+                _refresh_in_flight.discard(numero)
+
     def _simulate_tone(self, numero: str) -> Dict:
         """Retourne un résultat simulé sans appel réel selon le type du numéro."""
 
@@ -907,7 +1233,9 @@ class AsteriskEngine:
         if not numero_normalise or len(numero_normalise) < 4:
             return NUMBER_TYPE_UNKNOWN, NUMBER_TYPE_LABELS[NUMBER_TYPE_UNKNOWN]
 
-        cached = get_cached_tone(numero_normalise)
+        # Un résultat périmé sert tel quel : seule la détection explicite
+        # (detect_tone) relance un appel au PBX pour le revalider.
+        cached = get_cached_tone(numero_normalise, allow_stale=True)
         if cached:
             return self._tone_to_type(cached.get("tone", ""), cached.get("is_fax", False))
 
@@ -936,36 +1264,32 @@ class AsteriskEngine:
 
     def _is_sda_by_range(self, numero: str) -> bool:
         """Vérifie si le numéro appartient à une plage SDA configurée."""
-        for sda in self._sda_ranges:
-            prefix = sda.get("prefix", "")
-            if not prefix:
-                continue
-
-            if not numero.startswith(prefix):
+        snapshot = self.snapshot
+        for length in snapshot.prefix_lengths:
+            if length > len(numero):
+                break
+            specs = snapshot.compiled_ranges.get(numero[:length])
+            if not specs:
                 continue
 
-            range_start = sda.get("range_start", "")
-            range_end = sda.get("range_end", "")
-
-            if not range_start and not range_end:
-                return True
+            suffix = numero[length:]
+            for spec in specs:
+                if not spec.range_start and not spec.range_end:
+                    return True
 
-            suffix = numero[len(prefix):]
-            if not suffix:
-                return True
+                if not suffix:
+                    return True
 
-            if range_start and range_end:
-                try:
-                    s = int(suffix.ljust(len(range_start), '0'))
-                    r_start = int(range_start)
-                    r_end = int(range_end)
-                    if r_start <= s <= r_end:
+                if spec.start is not None and spec.end is not None:
+                    try:
+                        s = int(suffix.ljust(len(spec.range_start), '0'))
+                    except (ValueError, TypeError):
+                        continue
+                    if spec.start <= s <= spec.end:
+                        return True
+                elif spec.range_start and not spec.range_end:
+                    if suffix.startswith(spec.range_start):
                         return True
-                except (ValueError, TypeError):
-                    pass
-            elif range_start:
-                if suffix.startswith(range_start):
-                    return True
 
         return False
 
@@ -1017,11 +1341,13 @@ class AsteriskEngine:
         if not self._loaded:
             self.load()
 
+        # Un numéro revient sur de nombreuses entrées : classé une fois.
+        classes: Dict[str, Tuple[str, str]] = {}
         for entry in entries:
             numero = entry.get("numero_normalise", "")
-            num_type, num_label = self.classify_number(numero)
-            entry["numero_type"] = num_type
-            entry["numero_type_label"] = num_label
+            if numero not in classes:
+                classes[numero] = self.classify_number(numero)
+            entry["numero_type"], entry["numero_type_label"] = classes[numero]
 
         return entries
 
@@ -1140,8 +1466,17 @@ class AsteriskEngine:
 
     def get_stats(self, entries: List[Dict]) -> Dict:
         """Calcule les statistiques SDA/Téléphone à partir des entrées classifiées."""
+        par_type: Dict[str, int] = {}
+        for entry in entries:
+            num_type = entry.get("numero_type", NUMBER_TYPE_UNKNOWN)
+            par_type[num_type] = par_type.get(num_type, 0) + 1
+        return self.stats_from_type_counts(par_type)
+
+    @staticmethod
+    def stats_from_type_counts(par_type: Dict[str, int]) -> Dict:
+        """Calcule les statistiques SDA/Téléphone à partir d'un décompte par type."""
         stats = {
-            "total": len(entries),
+            "total": sum(par_type.values()),
             "sda": 0,
             "sda_fax": 0,
             "telephone": 0,
@@ -1152,33 +1487,30 @@ class AsteriskEngine:
             "busy": 0,
             "error": 0,
             "unknown": 0,
-            "par_type": {},
+            "par_type": dict(par_type),
         }
 
-        for entry in entries:
-            num_type = entry.get("numero_type", NUMBER_TYPE_UNKNOWN)
-            stats["par_type"][num_type] = stats["par_type"].get(num_type, 0) + 1
-
+        for num_type, count in par_type.items():
             if num_type == NUMBER_TYPE_SDA:
-                stats["sda"] += 1
+                stats["sda"] += count
             elif num_type == NUMBER_TYPE_SDA_FAX:
-                stats["sda_fax"] += 1
+                stats["sda_fax"] += count
             elif num_type in (NUMBER_TYPE_GEOGRAPHIC, NUMBER_TYPE_PHONE):
-                stats["telephone"] += 1
+                stats["telephone"] += count
             elif num_type == NUMBER_TYPE_MOBILE:
-                stats["mobile"] += 1
+                stats["mobile"] += count
             elif num_type == NUMBER_TYPE_INTERNATIONAL:
-                stats["international"] += 1
+                stats["international"] += count
             elif num_type == NUMBER_TYPE_SPECIAL:
-                stats["special"] += 1
+                stats["special"] += count
             elif num_type == NUMBER_TYPE_NO_ANSWER:
-                stats["no_answer"] += 1
+                stats["no_answer"] += count
             elif num_type == NUMBER_TYPE_BUSY:
-                stats["busy"] += 1
+                stats["busy"] += count
             elif num_type == NUMBER_TYPE_ERROR:
-                stats["error"] += 1
+                stats["error"] += count
             else:
-                stats["unknown"] += 1
+                stats["unknown"] += count
 
         total = stats["total"] or 1
         stats["pct_sda"] = round(stats["sda"] / total * 100, 1)
@@ -1193,20 +1525,400 @@ class AsteriskEngine:
         return stats
 
 _engine: Optional[AsteriskEngine] = None
+_engine_lock = threading.Lock()
+_peers_refresh_lock = threading.Lock()
+_peers_refresh_running = False
 
 def get_engine() -> AsteriskEngine:
     global _engine
-    if _engine is None:
-        _engine = AsteriskEngine()
-        _engine.load()
+    engine = _engine
+    if engine is None:
+        with _engine_lock:
+            if _engine is None:
+                loaded = AsteriskEngine()
+                loaded.load()
+                _engine = loaded
+            engine = _engine
+    snapshot = engine.snapshot
+    if (snapshot.ami_config.enabled
+            and time.time() - snapshot.peers_refreshed_at > settings.ami_peers_refresh_seconds):
+        _schedule_peers_refresh()
+    return engine
+
+def reload_engine(*, sda_ranges: bool = True, ami_config: bool = True) -> AsteriskEngine:
+    """
+    Publie un nouveau snapshot du moteur après une modification de configuration.
+
+    Seules les parties demandées sont relues en BDD ; les peers AMI du
+    snapshot courant sont conservés et rafraîchis en arrière-plan si la
+    connexion AMI a changé.
+    """
+    global _engine
+    with _engine_lock:
+        current = _engine.snapshot if _engine is not None else None
+        ranges = get_sda_ranges() if sda_ranges or current is None else None
+        config = None
+        if ami_config or current is None:
+            config = _ami_config_from_row(get_ami_config())
+        snapshot = build_snapshot(current, sda_ranges=ranges, ami_config=config)
+        _engine = AsteriskEngine(snapshot)
+
+    connection_changed = current is None or (
+        config is not None
+        and (config.host, config.port, config.username, config.secret, config.enabled)
+        != (current.ami_config.host, current.ami_config.port, current.ami_config.username,
+            current.ami_config.secret, current.ami_config.enabled)
+    )
+    if snapshot.ami_config.enabled and connection_changed:
+        _schedule_peers_refresh()
+
+    logger.info("AsteriskEngine v%d publié (plages=%s, config AMI=%s)",
+                snapshot.version, sda_ranges, ami_config)
     return _engine
 
-def reload_engine() -> AsteriskEngine:
+def refresh_engine_peers() -> AsteriskEngine:
+    """Récupère les peers AMI puis publie un snapshot qui les contient."""
     global _engine
-    _engine = AsteriskEngine()
-    _engine.load()
+    config = get_engine().snapshot.ami_config
+    peers = fetch_ami_peers(config) if config.enabled else ()
+    with _engine_lock:
+        current = _engine.snapshot
+        if current.ami_config is not config:
+            # La configuration a changé pendant la récupération : les peers
+            # récupérés ne correspondent plus, le prochain rafraîchissement
+            # s'en chargera.
+            return _engine
+        if peers is None:
+            peers = current.ami_peers
+        _engine = AsteriskEngine(build_snapshot(current, ami_peers=peers))
     return _engine
 
+def _schedule_peers_refresh() -> None:
+    global _peers_refresh_running
+    with _peers_refresh_lock:
+        if _peers_refresh_running:
+            return
+        _peers_refresh_running = True
+
+    def _run() -> None:
+        global _peers_refresh_running
+        try:
+            refresh_engine_peers()
+        except Exception as e:
+            logger.warning("Rafraîchissement des peers AMI échoué: %s", e)
+        finally:
+            with _peers_refresh_lock:
+                _peers_refresh_running = False
+
+    threading.Thread(target=_run, name="ami-peers-refresh", daemon=True).start()
+
+RECLASSIFY_BATCH_SIZE = 500
+
+def _prefix_bounds(prefix: str) -> Tuple[str, str]:
+    """Bornes [début, fin) des chaînes commençant par `prefix` (parcours d'index)."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def reclassify_entries_for_prefixes(prefixes: List[str]) -> Dict:
+    """
+    Reclasse les numéros stockés qui commencent par l'un des préfixes.
+
+    Les numéros de la plage sont lus dans la dimension `numbers` ; un numéro
+    dont le type change est mis à jour sur sa seule ligne, vue par tous les
+    rapports. Les répartitions par type des rapports qui le contiennent
+    (index (number_id, report_key)) sont ensuite recalculées.
+    """
+    from .db import all_databases, numero_type_codes, refresh_report_numero_types, set_number_types
+
+    engine = get_engine()
+    prefixes = sorted({p.strip() for p in prefixes if p and p.strip()})
+    numbers_checked = 0
+    numbers_updated = 0
+    touched_reports: set = set()
+
+    # Chaque base par contrat a sa dimension des numéros.
+    for path in all_databases():
+        with using_database(path):
+            touched_here: set = set()
+            for prefix in prefixes:
+                low, high = _prefix_bounds(prefix)
+                conn = get_connection(readonly=True)
+                try:
+                    numeros = [
+                        (r["id"], r["numero_normalise"], r["numero_type_code"]) for r in conn.execute(
+                            """
+                            SELECT id, numero_normalise, numero_type_code FROM numbers
+                            WHERE numero_normalise >= ? AND numero_normalise < ?
+                            """,
+                            (low, high),
+                        )
+                    ]
+                finally:
+                    conn.close()
+
+                for i in range(0, len(numeros), RECLASSIFY_BATCH_SIZE):
+                    batch = [(number_id, code, *engine.classify_number(n))
+                             for number_id, n, code in numeros[i:i + RECLASSIFY_BATCH_SIZE]]
+                    # Une transaction par lot : le verrou d'écriture est rendu entre deux lots.
+                    with write_transaction() as conn:
+                        cur = conn.cursor()
+                        codes = numero_type_codes(cur, {t: label for _, _, t, label in batch})
+                        changed = {number_id: codes[t] for number_id, code, t, _ in batch if code != codes[t]}
+                        touched_here.update(set_number_types(cur, changed))
+                    numbers_updated += len(changed)
+                numbers_checked += len(numeros)
+
+            refresh_report_numero_types(sorted(touched_here))
+            touched_reports |= touched_here
+
+    logger.info(
+        "Reclassification SDA (%s): %d numéros vérifiés, %d numéros reclassés, %d rapports",
+        ", ".join(prefixes), numbers_checked, numbers_updated, len(touched_reports),
+    )
+    return {
+        "prefixes": prefixes,
+        "numbers_checked": numbers_checked,
+        "numbers_updated": numbers_updated,
+        "reports_updated": sorted(touched_reports),
+    }
+
+_reclassify_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sda-reclassify")
+
+def schedule_reclassification(prefixes: List[str]):
+    """Planifie une reclassification en arrière-plan (une à la fois, dans l'ordre)."""
+    def _run() -> Optional[Dict]:
+        try:
+            return reclassify_entries_for_prefixes(prefixes)
+        except Exception as e:
+            logger.warning("Reclassification SDA échouée (%s): %s", prefixes, e)
+            return None
+
+    return _reclassify_executor.submit(_run)
+
+_FAX_EVENTS = ("FAXStatus", "ReceiveFAXStatus", "SendFAXStatus", "ReceiveFAX", "SendFAX")
+
+class AMIEventListener:
+    """
+    Écoute passive du trafic Asterisk pour alimenter tone_detection_cache.
+
+    Connexion AMI longue durée, sans aucun appel émis :
+      - FAXStatus / ReceiveFAXStatus / SendFAXStatus (et ReceiveFAX/SendFAX)
+        sur un appel réel → les numéros de l'appel sont des fax
+      - AMDSTATUS/AMDCAUSE positionnés par AMD() sur un appel réel
+        → fax (MACHINE + cause FAX) ou voix (HUMAN / répondeur)
+    Les appels test FaxCloud (contexte de détection, FAXCLOUD_TEST=1) sont
+    ignorés : ils sont déjà traités par `detect_tone`.
+    """
+
+    RECONNECT_DELAY_MAX = 60.0
+
+    def __init__(self, config: AMIConfig):
+        self.config = config
+        self._channels: Dict[str, Dict] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[AMIConnection] = None
+        self.observed = 0
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ami-passive-listener", daemon=True)
+        self._thread.start()
+        logger.info("Écoute AMI passive démarrée (%s:%s)", self.config.host, self.config.port)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        thread = self._thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        logger.info("Écoute AMI passive arrêtée (%d tonalités observées)", self.observed)
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stopped.is_set():
+            conn = AMIConnection(self.config)
+            if not conn.connect():
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+                continue
+            delay = 1.0
+            try:
+                self._listen(conn)
+            except (socket.error, OSError) as e:
+                logger.warning("Écoute AMI passive interrompue: %s", e)
+            finally:
+                conn.disconnect()
+                self._channels.clear()
+
+    def _listen(self, conn: AMIConnection) -> None:
+        sock = conn._socket
+        if not sock:
+            return
+        sock.settimeout(1.0)
+        buffer = ""
+        while not self._stopped.is_set():
+            try:
+                chunk = sock.recv(8192).decode("utf-8", errors="replace")
+            except socket.timeout:
+                continue
+            if not chunk:
+                return
+            buffer += chunk
+            while "\r\n\r\n" in buffer:
+                event_str, buffer = buffer.split("\r\n\r\n", 1)
+                event = AMIConnection._parse_event(event_str)
+                if event and "Event" in event:
+                    try:
+                        self.handle_event(event)
+                    except Exception as e:
+                        logger.debug("Événement AMI ignoré (%s): %s", event.get("Event"), e)
+
+    def _channel(self, event: Dict) -> Dict:
+        key = event.get("Uniqueid") or event.get("Channel", "")
+        return self._channels.setdefault(key, {"numbers": [], "remote": [], "test": False})
+
+    def _is_test_channel(self, event: Dict) -> bool:
+        channel = event.get("Channel", "")
+        return (
+            event.get("Context") == self.config.context
+            or f"@{self.config.context}" in channel
+            or event.get("CallerIDNum") == self.config.caller_id
+            or event.get("CallerIDName") == self.config.caller_id
+        )
+
+    def handle_event(self, event: Dict) -> List[Dict]:
+        """Traite un événement AMI ; retourne les résultats enregistrés en cache."""
+        name = event.get("Event", "")
+
+        if name == "Hangup":
+            self._channels.pop(event.get("Uniqueid") or event.get("Channel", ""), None)
+            return []
+
+        state = self._channel(event)
+        if self._is_test_channel(event):
+            state["test"] = True
+
+        if name in ("Newchannel", "NewCallerid", "NewConnectedLine", "Newexten"):
+            for key in ("CallerIDNum", "Exten"):
+                _append_number(state["numbers"], event.get(key))
+            _append_number(state["remote"], event.get("ConnectedLineNum"))
+            return []
+
+        if name == "DialBegin":
+            dest = self._channels.setdefault(
+                event.get("DestUniqueid") or event.get("DestChannel", ""),
+                {"numbers": [], "remote": [], "test": state["test"]},
+            )
+            dialed = event.get("DialString", "").split("@")[0].split("/")[-1]
+            for value in (event.get("DestCallerIDNum"), event.get("DestExten"), dialed):
+                _append_number(dest["remote"], value)
+                _append_number(state["remote"], value)
+            return []
+
+        if name == "VarSet":
+            variable = event.get("Variable", "")
+            if variable == "FAXCLOUD_TEST":
+                state["test"] = True
+            elif variable == "AMDSTATUS":
+                state["amd_status"] = event.get("Value", "")
+                return self._record_amd(event, state)
+            elif variable == "AMDCAUSE":
+                state["amd_cause"] = event.get("Value", "")
+                return self._record_amd(event, state)
+            return []
+
+        if name in _FAX_EVENTS:
+            if state["test"]:
+                return []
+            if name == "FAXStatus" and event.get("Status", "").upper() in ("FAILED", "ERROR"):
+                return []
+            numbers = list(state["numbers"]) + list(state["remote"])
+            for key in ("CallerIDNum", "ConnectedLineNum", "Exten", "RemoteStationID"):
+                _append_number(numbers, event.get(key))
+            details = f"[PASSIF] Trafic fax observé ({name})"
+            return [self._record(n, TONE_FAX, details) for n in numbers]
+
+        return []
+
+    def _record_amd(self, event: Dict, state: Dict) -> List[Dict]:
+        status = state.get("amd_status", "").upper()
+        cause = state.get("amd_cause", "")
+        if state["test"] or not status or (status == "MACHINE" and not cause):
+            return []
+        if status == "MACHINE" and "FAX" in cause.upper():
+            tone, details = TONE_FAX, f"[PASSIF] AMD: tonalité fax ({cause})"
+        elif status == "MACHINE":
+            tone, details = TONE_VOICE, f"[PASSIF] AMD: répondeur ({cause})"
+        elif status == "HUMAN":
+            tone, details = TONE_VOICE, "[PASSIF] AMD: voix humaine"
+        else:
+            return []
+
+        remote = list(state["remote"])
+        _append_number(remote, event.get("ConnectedLineNum"))
+        if not remote:
+            remote = list(state["numbers"])
+        results = [self._record(n, tone, details, state) for n in remote]
+        state["amd_status"] = state["amd_cause"] = ""
+        return results
+
+    def _record(self, numero: str, tone: str, details: str, state: Optional[Dict] = None) -> Dict:
+        result = {
+            "numero": numero,
+            "tone": tone,
+            "is_fax": tone == TONE_FAX,
+            "details": details,
+            "duration_ms": 0,
+            "hangup_cause": 0,
+            "amd_status": (state or {}).get("amd_status", ""),
+            "amd_cause": (state or {}).get("amd_cause", ""),
+            "source": "passive",
+        }
+        save_tone_cache(result, self.config.cache_ttl_hours)
+        self.observed += 1
+        logger.debug("[PASSIF] %s → %s", numero, tone)
+        return result
+
+def _append_number(numbers: List[str], value: Optional[str]) -> None:
+    """Ajoute un numéro normalisé (33XXXXXXXXX) s'il ressemble à un numéro public."""
+    if not value:
+        return
+    from .analyzer import normalize_number
+    digits = re.sub(r"\D", "", str(value))
+    if len(digits) < 9:
+        return
+    numero = normalize_number(digits)
+    if numero not in numbers:
+        numbers.append(numero)
+
+_listener: Optional[AMIEventListener] = None
+_listener_lock = threading.Lock()
+
+def sync_passive_listener() -> Optional[AMIEventListener]:
+    """Démarre, redémarre ou arrête l'écoute passive selon la configuration AMI."""
+    global _listener
+    config = get_engine().snapshot.ami_config
+    wanted = config.enabled and config.passive_listener and not config.simulation
+    with _listener_lock:
+        if _listener is not None and (not wanted or _listener.config != config):
+            _listener.stop()
+            _listener = None
+        if wanted and _listener is None:
+            _listener = AMIEventListener(config)
+            _listener.start()
+        return _listener
+
+def stop_passive_listener() -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
 DIALPLAN_SNIPPET = """
 ; ==============================================
 ; FaxCloud Analyzer - Contexte de détection fax
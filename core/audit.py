@@ -0,0 +1,523 @@
+"""
+Journal d'audit partitionné par mois.
+
+Chaque mois a sa table `audit_log_AAAA_MM` (index sur ts, action, user et
+report_id) ; la table audit_partitions les recense avec leur nombre de lignes
+et le dernier id attribué. Les ids restent croissants d'une partition à
+l'autre, ce qui permet une pagination par curseur (mois, id) sans OFFSET.
+
+Rétention : au-delà de `AUDIT_RETENTION_MONTHS` mois, une partition est
+exportée en JSON lignes compressé (gzip) dans data/audit_archive puis
+supprimée d'un DROP TABLE, sans DELETE ligne à ligne.
+
+Les événements passent par une file bornée écrite en arrière-plan par lots
+(`AuditWriter`) : une requête n'attend jamais l'audit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import base64
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+from .connection import get_connection, write_transaction
+from .migrations import Migration, migrate
+
+logger = logging.getLogger(__name__)
+
+AUDIT_SCHEMA = "audit"
+
+_AUDIT_COLUMNS = ("ts", "user", "action", "report_id", "ip", "user_agent", "meta_json")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+def _connect(readonly: bool = False) -> sqlite3.Connection:
+    return get_connection(readonly=readonly)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _partition_table(month: str) -> str:
+    if not _MONTH_RE.match(month):
+        raise ValueError(f"Mois de partition invalide: {month!r}")
+    return "audit_log_" + month.replace("-", "_")
+
+def _event_month(ts: Optional[str]) -> str:
+    month = (ts or "")[:7]
+    return month if _MONTH_RE.match(month) else datetime.now(timezone.utc).strftime("%Y-%m")
+
+def _ensure_partition(cur: sqlite3.Cursor, month: str) -> Tuple[str, bool]:
+    """Crée la partition du mois si besoin ; retourne (table, créée)."""
+    table = _partition_table(month)
+    row = cur.execute(
+        "SELECT archived_at FROM audit_partitions WHERE month = ?", (month,)
+    ).fetchone()
+    if row is not None and row[0] is None:
+        return table, False
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            ts TEXT NOT NULL,
+            user TEXT,
+            action TEXT,
+            report_id TEXT,
+            ip TEXT,
+            user_agent TEXT,
+            meta_json TEXT
+        )
+        """
+    )
+    # Chaque index se termine par le rowid : filtre + tri par id sans tri temporaire.
+    for column in ("ts", "action", "user", "report_id"):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+    # Partition archivée qui reçoit un événement tardif : elle repart à vide,
+    # l'archive existante n'est pas modifiée.
+    cur.execute(
+        """
+        INSERT INTO audit_partitions (month, table_name, created_at) VALUES (?, ?, ?)
+        ON CONFLICT(month) DO UPDATE SET archived_at = NULL, row_count = 0
+        """,
+        (month, table, _now()),
+    )
+    return table, True
+
+def _migration_audit_partitions(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS audit_partitions (
+            month TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            max_id INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            archived_at TEXT,
+            archive_path TEXT
+        )
+        """
+    )
+    legacy = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_log'"
+    ).fetchone()
+    if legacy is None:
+        return
+    # Ancienne table unique : recopiée mois par mois (ids conservés), puis supprimée.
+    months = [
+        r[0] for r in cur.execute("SELECT DISTINCT substr(ts, 1, 7) FROM audit_log")
+    ]
+    by_month: Dict[str, List[str]] = {}
+    for value in months:
+        by_month.setdefault(_event_month(value), []).append(value or "")
+    for month, prefixes in sorted(by_month.items()):
+        table, _ = _ensure_partition(cur, month)
+        cur.execute(
+            f"""
+            INSERT INTO {table} (id, {", ".join(_AUDIT_COLUMNS)})
+            SELECT id, COALESCE(ts, ''), {", ".join(_AUDIT_COLUMNS[1:])}
+            FROM audit_log
+            WHERE COALESCE(substr(ts, 1, 7), '') IN ({", ".join("?" for _ in prefixes)})
+            ORDER BY id
+            """,
+            prefixes,
+        )
+        cur.execute(
+            f"""
+            UPDATE audit_partitions
+            SET row_count = (SELECT COUNT(*) FROM {table}),
+                max_id = (SELECT COALESCE(MAX(id), 0) FROM {table})
+            WHERE month = ?
+            """,
+            (month,),
+        )
+    cur.execute("DROP TABLE audit_log")
+
+AUDIT_MIGRATIONS = (
+    Migration(1, "journal d'audit partitionné par mois", _migration_audit_partitions),
+)
+
+def init_audit_tables() -> None:
+    """Applique les migrations du journal d'audit (après `init_database`)."""
+    migrate(AUDIT_SCHEMA, AUDIT_MIGRATIONS)
+
+def _write_events(rows: List[Tuple]) -> bool:
+    """Insère des événements dans leurs partitions ; True si une partition a été créée."""
+    created = False
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        next_id = cur.execute(
+            "SELECT COALESCE(MAX(max_id), 0) + 1 FROM audit_partitions"
+        ).fetchone()[0]
+        by_month: Dict[str, List[Tuple]] = {}
+        for row in rows:
+            by_month.setdefault(_event_month(row[0]), []).append(row)
+        for month, month_rows in sorted(by_month.items()):
+            table, new = _ensure_partition(cur, month)
+            created = created or new
+            cur.executemany(
+                f"""
+                INSERT INTO {table} (id, {", ".join(_AUDIT_COLUMNS)})
+                VALUES (?, {", ".join("?" for _ in _AUDIT_COLUMNS)})
+                """,
+                [(next_id + i,) + tuple(r) for i, r in enumerate(month_rows)],
+            )
+            next_id += len(month_rows)
+            cur.execute(
+                """
+                UPDATE audit_partitions SET row_count = row_count + ?, max_id = ?
+                WHERE month = ?
+                """,
+                (len(month_rows), next_id - 1, month),
+            )
+    return created
+
+class AuditWriter:
+    """
+    File d'attente bornée des événements d'audit.
+
+    `put()` ne fait qu'ajouter l'événement en mémoire : le thread d'écriture
+    les insère par lots (une transaction, un executemany par partition) dès
+    que `flush_size` événements attendent ou toutes les `flush_interval`
+    secondes. File pleine : l'événement est abandonné et compté, la requête
+    n'attend jamais. La rétention est appliquée au démarrage du thread puis
+    à chaque nouvelle partition (changement de mois). `snapshot()` rend les
+    événements pas encore commités, lot en cours d'écriture compris.
+    """
+
+    def __init__(self, max_queue: int = settings.audit_queue_size,
+                 flush_size: int = settings.audit_flush_size,
+                 flush_interval: float = settings.audit_flush_interval):
+        self.max_queue = max(1, int(max_queue))
+        self.flush_size = max(1, int(flush_size))
+        self.flush_interval = max(0.1, float(flush_interval))
+        self._pending: List[Tuple] = []
+        self._inflight: List[Tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._retention_due = threading.Event()
+        self._retention_due.set()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed_batches": 0}
+
+    def put(self, row: Tuple) -> bool:
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                self._stats["dropped"] += 1
+                return False
+            self._pending.append(row)
+            self._stats["queued"] += 1
+            full = len(self._pending) >= self.flush_size
+            self._ensure_thread()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Écrit les événements en attente en une seule transaction."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._inflight = self._pending
+                self._pending = []
+            if not batch:
+                return 0
+            try:
+                init_audit_tables()
+                if _write_events(batch):
+                    self._retention_due.set()
+            except sqlite3.Error as e:
+                logger.warning("Écriture de l'audit échouée (%d événements): %s", len(batch), e)
+                with self._lock:
+                    # Remis en tête de file, dans la limite de la capacité.
+                    kept = batch[: max(0, self.max_queue - len(self._pending))]
+                    self._pending[:0] = kept
+                    self._inflight = []
+                    self._stats["failed_batches"] += 1
+                    self._stats["dropped"] += len(batch) - len(kept)
+                return 0
+            with self._lock:
+                self._inflight = []
+                self._stats["written"] += len(batch)
+            return len(batch)
+
+    def snapshot(self) -> List[Tuple]:
+        """Événements non commités, du plus ancien au plus récent."""
+        with self._lock:
+            return self._inflight + self._pending
+
+    def close(self) -> None:
+        """Arrête le thread d'écriture et vide la file (arrêt propre)."""
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="audit-writer", daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self._retention_due.is_set():
+                self._retention_due.clear()
+                try:
+                    apply_audit_retention()
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning("Rétention de l'audit non appliquée: %s", e)
+
+_audit_writer = AuditWriter()
+atexit.register(_audit_writer.close)
+
+def insert_audit_event(
+    action: str,
+    user: str = "anonymous",
+    report_id: Optional[str] = None,
+    ip: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    meta: Optional[Dict] = None,
+) -> None:
+    """Met en file un événement d'audit (best-effort, sans attente).
+
+    Ne doit jamais casser l'app si l'audit échoue : l'écriture a lieu en
+    arrière-plan, un événement refusé (file pleine) est seulement compté.
+    """
+    try:
+        ts = datetime.now(timezone.utc).isoformat()
+        meta_json = json.dumps(meta or {}, ensure_ascii=False)
+        _audit_writer.put((ts, user, action, report_id, ip, user_agent, meta_json))
+    except Exception:
+
+        return
+
+def flush_audit_events() -> int:
+    """Force l'écriture des événements d'audit en attente."""
+    return _audit_writer.flush()
+
+def audit_stats() -> Dict[str, int]:
+    return _audit_writer.stats()
+
+def list_audit_partitions() -> List[Dict]:
+    init_audit_tables()
+    conn = _connect(readonly=True)
+    try:
+        rows = conn.execute(
+            "SELECT * FROM audit_partitions ORDER BY month DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+def encode_audit_cursor(month: str, event_id: int) -> str:
+    raw = json.dumps([month, event_id], separators=(",", ":")).encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_audit_cursor(token: str) -> Tuple[str, int]:
+    """Décode un jeton de `encode_audit_cursor` ; ValueError s'il est invalide."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        month, event_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Curseur invalide: {token!r}") from e
+    if not isinstance(month, str) or not _MONTH_RE.match(month) or not isinstance(event_id, int):
+        raise ValueError(f"Curseur invalide: {token!r}")
+    return month, event_id
+
+def _parse_day(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+    except ValueError as e:
+        raise ValueError(f"Date invalide (AAAA-MM-JJ attendu): {value!r}") from e
+
+def list_audit_events(
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    *,
+    action: Optional[str] = None,
+    user: Optional[str] = None,
+    report_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Événements d'audit du plus récent au plus ancien + curseur de la page suivante.
+
+    Filtres indexés (action, user, report_id, dates AAAA-MM-JJ incluses) ;
+    les partitions hors de l'intervalle de dates ne sont pas lues. Lève
+    ValueError si le curseur ou une date est invalide. La première page
+    commence par les événements encore en file (id None), sans attendre
+    leur écriture.
+    """
+    limit = max(1, min(1000, int(limit)))
+    after = decode_audit_cursor(cursor) if cursor else None
+    day_from = _parse_day(date_from)
+    day_to = _parse_day(date_to)
+    # Relevée avant la lecture des partitions : un lot commité entre-temps
+    # est écarté plus bas, il est déjà dans les lignes lues.
+    queued = _audit_writer.snapshot() if after is None else []
+
+    where: List[str] = []
+    params: List = []
+    matches: List[Tuple[int, str]] = []
+    for column, value in (("action", action), ("user", user), ("report_id", report_id)):
+        if value:
+            where.append(f"{column} = ?")
+            params.append(value)
+            matches.append((_AUDIT_COLUMNS.index(column), value))
+    ts_from = day_from.isoformat() if day_from else None
+    ts_to = (day_to + timedelta(days=1)).isoformat() if day_to else None
+    if ts_from:
+        where.append("ts >= ?")
+        params.append(ts_from)
+    if ts_to:
+        where.append("ts < ?")
+        params.append(ts_to)
+    queued = [
+        row for row in reversed(queued)
+        if all(row[i] == value for i, value in matches)
+        and (ts_from is None or row[0] >= ts_from)
+        and (ts_to is None or row[0] < ts_to)
+    ]
+
+    months = [
+        p["month"] for p in list_audit_partitions()
+        if p["archived_at"] is None
+        and (day_from is None or p["month"] >= day_from.strftime("%Y-%m"))
+        and (day_to is None or p["month"] <= day_to.strftime("%Y-%m"))
+        and (after is None or p["month"] <= after[0])
+    ]
+
+    rows: List[sqlite3.Row] = []
+    conn = _connect(readonly=True)
+    try:
+        for month in months:
+            clauses = list(where)
+            clause_params = list(params)
+            if after is not None and month == after[0]:
+                clauses.append("id < ?")
+                clause_params.append(after[1])
+            where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            try:
+                rows.extend(conn.execute(
+                    f"""
+                    SELECT id, {", ".join(_AUDIT_COLUMNS)}, ? AS _month
+                    FROM {_partition_table(month)}
+                    {where_sql}
+                    ORDER BY id DESC
+                    LIMIT ?
+                    """,
+                    tuple([month] + clause_params + [limit + 1 - len(rows)]),
+                ).fetchall())
+            except sqlite3.OperationalError:
+                # Partition archivée entre la lecture du registre et la requête.
+                continue
+            if len(rows) > limit:
+                break
+    finally:
+        conn.close()
+
+    committed = {tuple(r[c] for c in _AUDIT_COLUMNS) for r in rows}
+    events: List[Dict] = [
+        dict(zip(("id",) + _AUDIT_COLUMNS, (None,) + tuple(row)))
+        for row in queued if tuple(row) not in committed
+    ][:limit]
+    next_cursor = None
+    if len(rows) + len(events) > limit:
+        rows = rows[:limit - len(events)]
+        if rows:
+            next_cursor = encode_audit_cursor(rows[-1]["_month"], rows[-1]["id"])
+        else:
+            # Page remplie par la file : la suivante part du plus récent commité.
+            newest = max((p for p in list_audit_partitions() if p["archived_at"] is None),
+                         key=lambda p: p["month"], default=None)
+            if newest is not None:
+                next_cursor = encode_audit_cursor(newest["month"], newest["max_id"] + 1)
+    for r in rows:
+        event = dict(r)
+        del event["_month"]
+        events.append(event)
+    return events, next_cursor
+
+def _archive_dir() -> Path:
+    return settings.data_dir / "audit_archive"
+
+def _month_index(month: str) -> int:
+    year, mon = month.split("-")
+    return int(year) * 12 + int(mon) - 1
+
+def apply_audit_retention(retention_months: Optional[int] = None,
+                          now: Optional[datetime] = None) -> List[Dict]:
+    """Archive puis supprime les partitions plus anciennes que la rétention.
+
+    Garde les `retention_months` derniers mois (mois courant compris) ;
+    0 désactive la rétention. Chaque partition est écrite en JSON lignes
+    gzip avant son DROP TABLE. Retourne les partitions archivées.
+    """
+    if retention_months is None:
+        retention_months = settings.audit_retention_months
+    if retention_months <= 0:
+        return []
+    now = now or datetime.now(timezone.utc)
+    cutoff = now.year * 12 + now.month - 1 - retention_months
+
+    archived = []
+    for partition in list_audit_partitions():
+        month = partition["month"]
+        if partition["archived_at"] is not None or _month_index(month) > cutoff:
+            continue
+        archived.append(_archive_partition(month))
+    return archived
+
+def _archive_partition(month: str) -> Dict:
+    table = _partition_table(month)
+    archive_dir = _archive_dir()
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{table}.jsonl.gz"
+    suffix = 1
+    while path.exists():
+        # Partition rouverte par un événement tardif : l'archive précédente est gardée.
+        path = archive_dir / f"{table}.{suffix}.jsonl.gz"
+        suffix += 1
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    # Le verrou d'écriture est tenu de l'export au DROP : aucun événement
+    # ne peut arriver dans la partition entre les deux.
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        rows = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+            for r in cur.execute(f"SELECT id, {', '.join(_AUDIT_COLUMNS)} FROM {table} ORDER BY id"):
+                fh.write(json.dumps(dict(r), ensure_ascii=False) + "\n")
+                rows += 1
+        os.replace(tmp_path, path)
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(
+            "UPDATE audit_partitions SET archived_at = ?, archive_path = ?, row_count = ? WHERE month = ?",
+            (_now(), str(path), rows, month),
+        )
+    logger.info("Partition d'audit %s archivée (%d événements): %s", month, rows, path)
+    return {"month": month, "rows": rows, "archive_path": str(path)}
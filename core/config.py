@@ -22,6 +22,30 @@ class Settings:
     default_base_url: str = os.environ.get("BASE_URL", "https://faxcloud-analyzer.local/reports")
     max_upload_size_mb: int = int(os.environ.get("MAX_UPLOAD_SIZE_MB", "100"))
     log_level: str = os.environ.get("LOG_LEVEL", "INFO")
+    db_busy_timeout_ms: int = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "10000"))
+    db_synchronous: str = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+    db_mmap_size: int = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    db_cache_size_kb: int = int(os.environ.get("DB_CACHE_SIZE_KB", "16000"))
+    db_checkpoint_interval: int = int(os.environ.get("DB_CHECKPOINT_INTERVAL", "60"))
+    db_backfill_batch_size: int = int(os.environ.get("DB_BACKFILL_BATCH_SIZE", "5000"))
+    db_backfill_pause_ms: int = int(os.environ.get("DB_BACKFILL_PAUSE_MS", "50"))
+    entry_count_cache_size: int = int(os.environ.get("ENTRY_COUNT_CACHE_SIZE", "1024"))
+    entry_count_exact_threshold: int = int(os.environ.get("ENTRY_COUNT_EXACT_THRESHOLD", "500000"))
+    report_catalog_cache_size: int = int(os.environ.get("REPORT_CATALOG_CACHE_SIZE", "64"))
+    report_catalog_cache_ttl: float = float(os.environ.get("REPORT_CATALOG_CACHE_TTL", "30"))
+    audit_queue_size: int = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+    audit_flush_size: int = int(os.environ.get("AUDIT_FLUSH_SIZE", "200"))
+    audit_flush_interval: float = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0"))
+    audit_retention_months: int = int(os.environ.get("AUDIT_RETENTION_MONTHS", "12"))
+    tone_cache_flush_size: int = int(os.environ.get("TONE_CACHE_FLUSH_SIZE", "50"))
+    tone_cache_flush_interval: float = float(os.environ.get("TONE_CACHE_FLUSH_INTERVAL", "2.0"))
+    tone_cache_stale_hours: int = int(os.environ.get("TONE_CACHE_STALE_HOURS", str(24 * 30)))
+    tone_refresh_workers: int = int(os.environ.get("TONE_REFRESH_WORKERS", "2"))
+    ami_peers_refresh_seconds: int = int(os.environ.get("AMI_PEERS_REFRESH_SECONDS", "900"))
+    archive_after_days: int = int(os.environ.get("ARCHIVE_AFTER_DAYS", "365"))
+    analytics_db_path: str = os.environ.get("ANALYTICS_DB_PATH", "")
+    analytics_sync_chunk_size: int = int(os.environ.get("ANALYTICS_SYNC_CHUNK_SIZE", "100000"))
+    db_sharding: str = os.environ.get("DB_SHARDING", "").strip().lower()
 
 def _build_settings() -> Settings:
     if getattr(sys, "frozen", False):
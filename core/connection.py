@@ -0,0 +1,294 @@
+"""
+Gestion des connexions SQLite.
+
+Chaque thread garde une connexion par (base, mode) : les pragmas sont appliqués
+une seule fois à l'ouverture, `close()` rend la connexion au pool au lieu de la
+fermer (avec rollback de ce qui n'a pas été commité, comme un vrai close).
+Un appel imbriqué (connexion demandée alors que celle du pool n'est pas
+rendue) reçoit une connexion à part, fermée par `close()` : il ne touche pas
+à la transaction en cours. Deux transactions d'écriture imbriquées sur une
+même base lèvent RuntimeError.
+
+Profil de stockage : journal WAL (les lectures ne bloquent jamais sur une
+écriture), busy timeout, synchronous, mmap et cache configurables (voir
+`Settings.db_*`), checkpoint périodique du WAL. Toutes les écritures passent
+par `write_transaction()`, qui les sérialise par base dans le processus.
+
+Sans chemin explicite, la base visée est celle du contexte courant
+(`using_database`, utilisé pour les bases par contrat), sinon
+`Settings.database_path`.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from .config import settings, ensure_directories
+
+logger = logging.getLogger(__name__)
+
+_current_database: ContextVar[Optional[Path]] = ContextVar("current_database", default=None)
+
+def current_database_path() -> Path:
+    """Base visée par défaut dans le contexte courant."""
+    return _current_database.get() or settings.database_path
+
+@contextmanager
+def using_database(path: Optional[Path]) -> Iterator[Path]:
+    """Dirige les connexions sans chemin explicite vers `path` le temps du bloc."""
+    token = _current_database.set(Path(path) if path else None)
+    try:
+        yield current_database_path()
+    finally:
+        _current_database.reset(token)
+
+CONNECTION_PRAGMAS: Dict[str, str] = {
+    "busy_timeout": str(settings.db_busy_timeout_ms),
+    "synchronous": settings.db_synchronous,
+    "mmap_size": str(settings.db_mmap_size),
+    "cache_size": str(-abs(settings.db_cache_size_kb)),
+    "temp_store": "MEMORY",
+    "journal_size_limit": str(64 * 1024 * 1024),
+}
+
+class PooledConnection(sqlite3.Connection):
+    """Connexion SQLite rendue au pool par `close()`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool: Optional["ConnectionManager"] = None
+        self._checked_out = False
+        self.readonly = False
+        self.path: Optional[Path] = None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool._release(self)
+            return
+        super().close()
+
+    def discard(self) -> None:
+        """Ferme réellement la connexion."""
+        self._pool = None
+        super().close()
+
+class ConnectionManager:
+    """Pool de connexions SQLite par thread, avec verrou d'écriture par base."""
+
+    def __init__(self, pragmas: Optional[Dict[str, str]] = None,
+                 checkpoint_interval: int = settings.db_checkpoint_interval):
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self.checkpoint_interval = checkpoint_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: "weakref.WeakSet[PooledConnection]" = weakref.WeakSet()
+        self._writer_locks: Dict[str, threading.RLock] = {}
+        self._wal_paths: set = set()
+        self._checkpointers: Dict[str, threading.Thread] = {}
+        self._stats = {
+            "created": 0, "reused": 0, "nested": 0, "released": 0, "rollbacks": 0,
+            "write_transactions": 0, "checkpoints": 0,
+        }
+
+    def connect(self, path: Optional[Path] = None, readonly: bool = False) -> PooledConnection:
+        path = Path(path or current_database_path())
+        key: Tuple[str, bool] = (str(path), bool(readonly))
+        pool = getattr(self._local, "connections", None)
+        if pool is None:
+            pool = self._local.connections = {}
+
+        conn = pool.get(key)
+        if conn is None:
+            conn = self._open_connection(path, readonly)
+            pool[key] = conn
+            with self._lock:
+                self._stats["created"] += 1
+                self._open.add(conn)
+        elif conn._checked_out:
+            # Connexion du pool pas encore rendue (appel imbriqué) : la
+            # réutiliser annulerait ou validerait la transaction de l'appelant.
+            conn = self._open_connection(path, readonly)
+            conn._pool = None
+            with self._lock:
+                self._stats["nested"] += 1
+                self._open.add(conn)
+            return conn
+        else:
+            with self._lock:
+                self._stats["reused"] += 1
+        conn._checked_out = True
+        return conn
+
+    def dedicated_connection(self, path: Optional[Path] = None,
+                             pragmas: Optional[Dict[str, str]] = None) -> PooledConnection:
+        """Connexion hors pool (fermée par `close()`), avec des pragmas en plus.
+
+        Pour les réglages propres à une opération (chargement en masse) qui
+        ne doivent pas rester sur la connexion partagée du thread.
+        """
+        path = Path(path or current_database_path())
+        conn = self._open_connection(path, readonly=False)
+        conn._pool = None
+        for name, value in (pragmas or {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._open.add(conn)
+        return conn
+
+    def _open_connection(self, path: Path, readonly: bool) -> PooledConnection:
+        ensure_directories()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._ensure_wal(conn, str(path))
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        conn.readonly = readonly
+        conn.path = path
+        conn._pool = self
+        return conn
+
+    def _ensure_wal(self, conn: sqlite3.Connection, key: str) -> None:
+        with self._lock:
+            if key in self._wal_paths:
+                return
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            # Base neuve : pages libérées rendues par PRAGMA incremental_vacuum.
+            # À régler avant le passage en WAL, qui fige le format du fichier.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if str(mode).lower() != "wal":
+            logger.warning("Mode WAL indisponible pour %s (journal_mode=%s)", key, mode)
+            return
+        with self._lock:
+            self._wal_paths.add(key)
+        self._start_checkpointer(key)
+
+    def _release(self, conn: PooledConnection) -> None:
+        conn._checked_out = False
+        rolled_back = False
+        if conn.in_transaction:
+            conn.rollback()
+            rolled_back = True
+        with self._lock:
+            self._stats["released"] += 1
+            if rolled_back:
+                self._stats["rollbacks"] += 1
+
+    def writer_lock(self, path: Optional[Path] = None) -> threading.RLock:
+        key = str(Path(path or current_database_path()))
+        with self._lock:
+            lock = self._writer_locks.get(key)
+            if lock is None:
+                lock = self._writer_locks[key] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def write_transaction(self, path: Optional[Path] = None,
+                          conn: Optional[PooledConnection] = None) -> Iterator[PooledConnection]:
+        """Transaction d'écriture sur la connexion du thread, ou sur `conn`
+        (connexion dédiée, laissée ouverte en sortie)."""
+        path = conn.path if conn is not None else Path(path or current_database_path())
+        key = str(path)
+        writing = getattr(self._local, "writing", None)
+        if writing is None:
+            writing = self._local.writing = set()
+        with self.writer_lock(path):
+            if key in writing:
+                # Une seconde connexion attendrait le verrou de la première.
+                raise RuntimeError(f"Transaction d'écriture imbriquée sur {key}")
+            writing.add(key)
+            own = conn is None
+            if own:
+                conn = self.connect(path)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                writing.discard(key)
+                with self._lock:
+                    self._stats["write_transactions"] += 1
+                if own:
+                    conn.close()
+
+    def checkpoint(self, path: Optional[Path] = None, mode: str = "PASSIVE") -> Optional[Tuple[int, int, int]]:
+        """Lance un checkpoint du WAL ; retourne (busy, pages WAL, pages copiées)."""
+        conn = self.connect(path)
+        try:
+            row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats["checkpoints"] += 1
+        return tuple(row) if row else None
+
+    def _start_checkpointer(self, key: str) -> None:
+        if self.checkpoint_interval <= 0:
+            return
+        with self._lock:
+            if key in self._checkpointers:
+                return
+            thread = threading.Thread(
+                target=self._checkpoint_loop, args=(key,),
+                name="sqlite-checkpoint", daemon=True,
+            )
+            self._checkpointers[key] = thread
+        thread.start()
+
+    def _checkpoint_loop(self, key: str) -> None:
+        while True:
+            time.sleep(self.checkpoint_interval)
+            try:
+                self.checkpoint(Path(key))
+            except sqlite3.Error as e:
+                logger.debug("Checkpoint WAL ignoré (%s): %s", key, e)
+
+    def close_thread_connections(self) -> None:
+        """Ferme les connexions du thread courant."""
+        pool = getattr(self._local, "connections", None) or {}
+        for conn in pool.values():
+            conn.discard()
+        pool.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open"] = len(self._open)
+            stats["wal_databases"] = len(self._wal_paths)
+        return stats
+
+_manager = ConnectionManager()
+
+def get_connection(readonly: bool = False, path: Optional[Path] = None) -> PooledConnection:
+    """Retourne la connexion du thread courant (à rendre avec `close()`)."""
+    return _manager.connect(path, readonly=readonly)
+
+def write_transaction(path: Optional[Path] = None, conn: Optional[PooledConnection] = None):
+    """Transaction d'écriture sérialisée : commit en sortie, rollback sur erreur."""
+    return _manager.write_transaction(path, conn)
+
+def dedicated_connection(path: Optional[Path] = None,
+                         pragmas: Optional[Dict[str, str]] = None) -> PooledConnection:
+    return _manager.dedicated_connection(path, pragmas)
+
+def checkpoint(path: Optional[Path] = None, mode: str = "PASSIVE"):
+    return _manager.checkpoint(path, mode)
+
+def pool_stats() -> Dict[str, int]:
+    return _manager.stats()
+
+def close_thread_connections() -> None:
+    _manager.close_thread_connections()
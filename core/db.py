@@ -1,24 +1,51 @@
 from __future__ import annotations
 
+import base64
+import functools
+import itertools
 import json
+import logging
 import sqlite3
+import threading
+import time
+import re
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import hashlib
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from .config import settings, ensure_directories
-
-def _connect() -> sqlite3.Connection:
-    ensure_directories()
-    conn = sqlite3.connect(settings.database_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_database() -> None:
-    ensure_directories()
-    conn = _connect()
-    cur = conn.cursor()
+from .connection import (
+    checkpoint,
+    close_thread_connections,
+    current_database_path,
+    dedicated_connection,
+    get_connection,
+    using_database,
+    write_transaction,
+)
+from .migrations import (
+    Migration,
+    add_column,
+    column_exists,
+    enqueue_backfill,
+    migrate,
+    pending_backfills,
+    register_backfill,
+    schema_version,
+)
+
+logger = logging.getLogger(__name__)
+
+def _connect(readonly: bool = False, path: Optional[Path] = None) -> sqlite3.Connection:
+    return get_connection(readonly=readonly, path=path)
+
+CORE_SCHEMA = "core"
+
+def _migration_base_tables(cur: sqlite3.Cursor) -> None:
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS reports (
@@ -60,8 +87,6 @@ def init_database() -> None:
         )
         """
     )
-    conn.commit()
-
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS audit_log (
@@ -76,38 +101,867 @@ def init_database() -> None:
         )
         """
     )
-    conn.commit()
-
-    for stmt in (
-        "ALTER TABLE reports ADD COLUMN source_filename TEXT",
-        "ALTER TABLE reports ADD COLUMN source_filesize INTEGER",
-        "ALTER TABLE reports ADD COLUMN source_sha256 TEXT",
-        "ALTER TABLE fax_entries ADD COLUMN datetime_ts INTEGER",
-    ):
-        try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
-
+    # Bases créées avant les migrations : colonnes ajoutées au fil des versions.
+    add_column(cur, "reports", "source_filename", "TEXT")
+    add_column(cur, "reports", "source_filesize", "INTEGER")
+    add_column(cur, "reports", "source_sha256", "TEXT")
+    add_column(cur, "fax_entries", "datetime_ts", "INTEGER")
+    add_column(cur, "fax_entries", "numero_type", "TEXT DEFAULT 'unknown'")
+    add_column(cur, "fax_entries", "numero_type_label", "TEXT DEFAULT ''")
+
+def _migration_entry_indexes(cur: sqlite3.Cursor) -> None:
     for stmt in (
         "CREATE INDEX IF NOT EXISTS idx_fax_entries_report_ts ON fax_entries(report_id, datetime_ts)",
         "CREATE INDEX IF NOT EXISTS idx_fax_entries_report_type ON fax_entries(report_id, type)",
         "CREATE INDEX IF NOT EXISTS idx_fax_entries_report_valide ON fax_entries(report_id, valide)",
         "CREATE INDEX IF NOT EXISTS idx_fax_entries_report_pages ON fax_entries(report_id, pages)",
+        "CREATE INDEX IF NOT EXISTS idx_fax_entries_numero ON fax_entries(numero_normalise)",
     ):
+        cur.execute(stmt)
+
+def _migration_report_aggregates(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_numero_types (
+            report_id TEXT NOT NULL,
+            numero_type TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (report_id, numero_type)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_aggregates (
+            report_id TEXT PRIMARY KEY,
+            entries_total INTEGER NOT NULL DEFAULT 0,
+            fax_sf INTEGER NOT NULL DEFAULT 0,
+            fax_rf INTEGER NOT NULL DEFAULT 0,
+            pages_sf INTEGER NOT NULL DEFAULT 0,
+            pages_rf INTEGER NOT NULL DEFAULT 0,
+            valid_count INTEGER NOT NULL DEFAULT 0,
+            invalid_count INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+def _migration_superseded(cur: sqlite3.Cursor) -> None:
+    """Étape remplacée par la conversion au stockage compact (migration 6)."""
+
+ENTRIES_FTS_MIN_QUERY = 3  # le tokenizer trigram n'indexe que des fragments de 3 caractères
+
+ENTRY_TYPE_CODES = {"send": 1, "receive": 2, "unknown": 3}
+ENTRY_ERROR_BITS = 62  # bits utilisables du masque (entier signé 64 bits)
+
+class _Dictionary:
+    """Table de correspondance texte -> entier, en ajout seul.
+
+    Les identifiants ne sont jamais réattribués : un cache tenu par
+    l'appelant reste valable pour toute la durée d'un import. Les nouvelles
+    valeurs sont aussi indexées dans la table FTS associée, s'il y en a une.
+    """
+
+    def __init__(self, table: str, column: str, extra: Tuple[str, ...] = (), fts: bool = False):
+        self.table = table
+        self.column = column
+        self.extra = extra
+        self.fts = f"{table}_fts" if fts else None
+
+    def ids(self, cur: sqlite3.Cursor, values: Dict[str, Tuple], cache: Dict[str, int]) -> Dict[str, int]:
+        """Retourne {valeur: id}, en créant les valeurs absentes.
+
+        `values` associe chaque valeur à ses colonnes `extra` (tuple vide sinon).
+        Comme dans une colonne TEXT, les valeurs non textuelles sont stockées
+        sous leur forme texte.
+        """
+        texts = {v: v if isinstance(v, str) else str(v) for v in values if v is not None}
+        extras = {t: values[v] for v, t in texts.items()}
+        missing = [t for t in extras if t not in cache]
+        for i in range(0, len(missing), 500):
+            batch = missing[i:i + 500]
+            cur.execute(
+                f"SELECT id, {self.column} FROM {self.table} WHERE {self.column} IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            cache.update((r[1], r[0]) for r in cur.fetchall())
+
+        new = [v for v in missing if v not in cache]
+        if new:
+            # Identifiant lu à chaque insertion : une plage "id > MAX(id)" lue
+            # avant pourrait inclure les valeurs d'un autre processus.
+            insert_sql = (
+                f"INSERT INTO {self.table} ({', '.join((self.column,) + self.extra)}) "
+                f"VALUES ({', '.join('?' * (1 + len(self.extra)))})"
+            )
+            created = []
+            for t in new:
+                cur.execute(insert_sql, (t, *extras[t]))
+                created.append((cur.lastrowid, t))
+            if self.fts and _dictionary_fts_exists(cur):
+                cur.executemany(f"INSERT INTO {self.fts} (rowid, {self.column}) VALUES (?, ?)", created)
+            cache.update((t, i) for i, t in created)
+        return {v: cache[t] for v, t in texts.items()}
+
+_ENTRY_USERS = _Dictionary("entry_users", "name", fts=True)
+_NUMBERS = _Dictionary("numbers", "numero_normalise", fts=True)
+_NUMBER_ORIGINALS = _Dictionary("number_originals", "numero_original", extra=("number_id",), fts=True)
+_ENTRY_TYPES = _Dictionary("entry_types", "name")
+_NUMERO_TYPES = _Dictionary("numero_types", "name", extra=("label",))
+_ENTRY_ERRORS = _Dictionary("entry_errors", "message")
+
+_ENTRY_DICTIONARIES = (_ENTRY_USERS, _NUMBERS, _NUMBER_ORIGINALS, _ENTRY_TYPES, _NUMERO_TYPES, _ENTRY_ERRORS)
+
+_dictionary_fts: Optional[bool] = None
+
+def _dictionary_fts_exists(cur: sqlite3.Cursor) -> bool:
+    global _dictionary_fts
+    if _dictionary_fts is None:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'numbers_fts'")
+        _dictionary_fts = cur.fetchone() is not None
+    return _dictionary_fts
+
+def _uuid_value(value):
+    """UUID canonique -> 16 octets ; toute autre valeur est gardée telle quelle."""
+    if isinstance(value, str) and len(value) == 36:
         try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
+            parsed = uuid.UUID(value)
+        except ValueError:
+            return value
+        if str(parsed) == value:
+            return parsed.bytes
+    return value
+
+def _canonical_datetime(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def numero_type_codes(cur: sqlite3.Cursor, labels: Dict[str, str],
+                      cache: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Codes des types de numéro donnés ({type: libellé}), libellés mis à jour."""
+    cache = {} if cache is None else cache
+    codes = _NUMERO_TYPES.ids(cur, {t: (label or "",) for t, label in labels.items()}, cache)
+    cur.executemany(
+        "UPDATE numero_types SET label = ? WHERE id = ? AND label IS NOT ?",
+        [(label or "", codes[t], label or "") for t, label in labels.items() if t is not None],
+    )
+    return codes
+
+def _error_mask(erreurs: Tuple, errors: Dict[str, int]) -> Tuple[int, Optional[str]]:
+    """Masque de bits des messages d'erreur, ou (0, JSON) s'il ne peut pas les restituer.
+
+    Le masque rend chaque message une fois, dans l'ordre des bits : une liste
+    avec doublon, dans un autre ordre ou au-delà de ENTRY_ERROR_BITS messages
+    connus est gardée en JSON.
+    """
+    positions = [errors[m] for m in erreurs]
+    if positions != sorted(set(positions)) or (positions and positions[-1] > ENTRY_ERROR_BITS):
+        return 0, json.dumps(list(erreurs), ensure_ascii=False, separators=(",", ":"))
+    return sum(1 << (p - 1) for p in positions), None
 
+def _encode_entry_rows(cur: sqlite3.Cursor, report_key: int, rows: List[Tuple],
+                       caches: Dict[str, Dict[str, int]]) -> Tuple[List[Tuple], Dict[int, List]]:
+    """Encode des lignes de `_prepare_entry_rows` au format de la table entries.
+
+    Retourne aussi, par numéro, [code numero_types, premier datetime_ts,
+    dernier datetime_ts] à reporter dans la dimension `numbers`.
+    """
+    def cache(d: _Dictionary) -> Dict[str, int]:
+        return caches.setdefault(d.table, {})
+
+    users = _ENTRY_USERS.ids(cur, {r[2]: () for r in rows}, cache(_ENTRY_USERS))
+    types = _ENTRY_TYPES.ids(cur, {r[3]: () for r in rows}, cache(_ENTRY_TYPES))
+    numbers = _NUMBERS.ids(cur, {r[5]: () for r in rows}, cache(_NUMBERS))
+    originals = _NUMBER_ORIGINALS.ids(
+        cur, {r[4]: (numbers.get(r[5]),) for r in rows}, cache(_NUMBER_ORIGINALS),
+    )
+    numero_types = numero_type_codes(cur, {r[11]: r[12] for r in rows}, cache(_NUMERO_TYPES))
+    errors = _ENTRY_ERRORS.ids(cur, {m: () for r in rows for m in r[10]}, cache(_ENTRY_ERRORS))
+
+    encoded = []
+    seen: Dict[int, List] = {}
+    for (entry_id, fax_id, user, entry_type, original, normalise, valide, pages,
+         dt, dt_ts, erreurs, num_type, _label) in rows:
+        number_id = numbers.get(normalise)
+        if number_id is not None:
+            number = seen.get(number_id)
+            if number is None:
+                seen[number_id] = [numero_types.get(num_type), dt_ts, dt_ts]
+            else:
+                number[0] = numero_types.get(num_type)
+                if dt_ts is not None:
+                    number[1] = dt_ts if number[1] is None else min(number[1], dt_ts)
+                    number[2] = dt_ts if number[2] is None else max(number[2], dt_ts)
+        datetime_raw = None
+        if dt is not None and (dt_ts is None or _canonical_datetime(dt_ts) != dt):
+            datetime_raw = str(dt)
+        error_mask, errors_raw = _error_mask(erreurs, errors)
+        encoded.append((
+            report_key,
+            _uuid_value(entry_id),
+            fax_id,
+            users.get(user),
+            types.get(entry_type),
+            originals.get(original),
+            number_id,
+            valide,
+            pages,
+            dt_ts,
+            datetime_raw,
+            error_mask,
+            errors_raw,
+        ))
+    return encoded, seen
+
+ENTRIES_INSERT_SQL = """
+    INSERT INTO entries (
+        report_key, uuid, fax_id, user_id, type_code, original_id, number_id,
+        valide, pages, datetime_ts, datetime_raw, error_mask, errors_raw
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _report_key(cur: sqlite3.Cursor, report_id: str) -> int:
+    cur.execute("INSERT OR IGNORE INTO report_keys (report_id) VALUES (?)", (report_id,))
+    return int(cur.execute("SELECT id FROM report_keys WHERE report_id = ?", (report_id,)).fetchone()[0])
+
+_REPORT_KEY_SQL = "(SELECT id FROM report_keys WHERE report_id = ?)"
+
+def set_number_types(cur: sqlite3.Cursor, codes: Dict[int, int],
+                     report_key: Optional[int] = None, kept: Optional[List[int]] = None) -> List[str]:
+    """Classe des numéros ({number_id: code numero_types}), une ligne par numéro.
+
+    Un type connu n'est jamais remplacé par "unknown" : un import qui ne sait
+    pas classer un numéro ne déclasse pas les rapports qui l'affichent. Les
+    numéros ainsi gardés sont ajoutés à `kept`. Retourne les rapports (hors
+    `report_key`) qui contiennent un numéro dont le type a changé, pour
+    recalculer leur répartition par type.
+    """
+    row = cur.execute("SELECT id FROM numero_types WHERE name = 'unknown'").fetchone()
+    unknown = row[0] if row else None
+    changed: List[Tuple[int, int]] = []
+    ids = list(codes)
+    for i in range(0, len(ids), 500):
+        batch = ids[i:i + 500]
+        cur.execute(
+            f"SELECT id, numero_type_code FROM numbers WHERE id IN ({', '.join('?' * len(batch))})",
+            batch,
+        )
+        for number_id, current in cur.fetchall():
+            if current == codes[number_id]:
+                continue
+            if codes[number_id] == unknown and current not in (None, unknown):
+                if kept is not None:
+                    kept.append(number_id)
+                continue
+            changed.append((codes[number_id], number_id))
+    cur.executemany("UPDATE numbers SET numero_type_code = ? WHERE id = ?", changed)
+
+    report_ids: set = set()
+    for i in range(0, len(changed), 500):
+        batch = [number_id for _, number_id in changed[i:i + 500]]
+        cur.execute(
+            f"""
+            SELECT DISTINCT k.report_id FROM entries e
+            JOIN report_keys k ON k.id = e.report_key
+            WHERE e.number_id IN ({', '.join('?' * len(batch))}) AND e.report_key IS NOT ?
+              AND {_ATTACHED_KEY_SQL}
+            """,
+            (*batch, report_key),
+        )
+        report_ids.update(r[0] for r in cur.fetchall())
+    return sorted(report_ids)
+
+def _record_numbers(cur: sqlite3.Cursor, report_key: int, seen: Dict[int, List],
+                    kept: Optional[List[int]] = None) -> List[str]:
+    """Reporte dans `numbers` la classification et les dates vues à l'import."""
+    reclassified = set_number_types(
+        cur, {n: v[0] for n, v in seen.items() if v[0] is not None}, report_key, kept,
+    )
+    _record_seen_dates(cur, seen)
+    return reclassified
+
+def _record_seen_dates(cur: sqlite3.Cursor, seen: Dict[int, List]) -> None:
+    cur.executemany(
+        """
+        UPDATE numbers SET
+            first_seen_ts = MIN(COALESCE(first_seen_ts, ?1), ?1),
+            last_seen_ts = MAX(COALESCE(last_seen_ts, ?2), ?2)
+        WHERE id = ?3
+        """,
+        [(v[1], v[2], n) for n, v in seen.items() if v[1] is not None],
+    )
+
+def record_number_tones(cur: sqlite3.Cursor, rows: List[Dict]) -> None:
+    """Reporte des résultats de détection de tonalité dans `numbers`."""
+    cur.executemany(
+        "UPDATE numbers SET tone = ?, tone_is_fax = ?, tone_detected_at = ? WHERE numero_normalise = ?",
+        [(r["tone"], 1 if r.get("is_fax") else 0, r["detected_at"], r["numero"]) for r in rows],
+    )
+
+# Colonnes d'une entrée sous leur forme historique (vue fax_entries).
+ENTRY_SELECT = """
+    CASE WHEN typeof(e.uuid) = 'blob' THEN lower(
+        substr(hex(e.uuid), 1, 8) || '-' || substr(hex(e.uuid), 9, 4) || '-' ||
+        substr(hex(e.uuid), 13, 4) || '-' || substr(hex(e.uuid), 17, 4) || '-' ||
+        substr(hex(e.uuid), 21)
+    ) ELSE e.uuid END AS id,
+    k.report_id AS report_id,
+    e.fax_id AS fax_id,
+    u.name AS utilisateur,
+    t.name AS type,
+    o.numero_original AS numero_original,
+    n.numero_normalise AS numero_normalise,
+    nt.name AS numero_type,
+    nt.label AS numero_type_label,
+    e.valide AS valide,
+    e.pages AS pages,
+    COALESCE(e.datetime_raw, strftime('%Y-%m-%d %H:%M:%S', e.datetime_ts, 'unixepoch')) AS datetime,
+    CASE
+        WHEN e.errors_raw IS NOT NULL THEN e.errors_raw
+        WHEN e.error_mask = 0 THEN '[]'
+        ELSE (
+            SELECT json_group_array(message) FROM (
+                SELECT message FROM entry_errors WHERE e.error_mask >> (id - 1) & 1 ORDER BY id
+            )
+        )
+    END AS erreurs
+"""
+
+ENTRY_FROM = """
+    entries e
+    JOIN report_keys k ON k.id = e.report_key
+    LEFT JOIN entry_users u ON u.id = e.user_id
+    LEFT JOIN entry_types t ON t.id = e.type_code
+    LEFT JOIN number_originals o ON o.id = e.original_id
+    LEFT JOIN numbers n ON n.id = e.number_id
+    LEFT JOIN numero_types nt ON nt.id = n.numero_type_code
+"""
+
+def _create_entry_dictionaries(cur: sqlite3.Cursor) -> None:
+    for table, columns in (
+        ("report_keys", "report_id TEXT NOT NULL UNIQUE"),
+        ("entry_users", "name TEXT NOT NULL UNIQUE"),
+        ("numbers", "numero_normalise TEXT NOT NULL UNIQUE"),
+        ("number_originals", "numero_original TEXT NOT NULL UNIQUE, number_id INTEGER"),
+        ("entry_types", "name TEXT NOT NULL UNIQUE"),
+        ("numero_types", "name TEXT NOT NULL UNIQUE, label TEXT NOT NULL DEFAULT ''"),
+        ("entry_errors", "message TEXT NOT NULL UNIQUE"),
+    ):
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {columns})")
+    cur.executemany(
+        "INSERT OR IGNORE INTO entry_types (id, name) VALUES (?, ?)",
+        [(code, name) for name, code in ENTRY_TYPE_CODES.items()],
+    )
+    for d in _ENTRY_DICTIONARIES:
+        if not d.fts:
+            continue
+        try:
+            cur.execute(
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {d.fts} USING fts5(
+                    {d.column}, content='{d.table}', content_rowid='id', tokenize='trigram'
+                )
+                """
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("Index plein texte indisponible (FTS5 trigram), recherche par LIKE: %s", e)
+            return
+
+# Ancienne table des entrées, convertie en arrière-plan par COMPACT_BACKFILL.
+LEGACY_ENTRIES = "fax_entries_legacy"
+LEGACY_KEYS = "fax_entries_legacy_keys"
+COMPACT_BACKFILL = "compact_entries"
+
+def _migration_compact_entries(cur: sqlite3.Cursor) -> None:
+    """Passe les entrées au stockage compact.
+
+    Les entrées vivent dans `entries` : rowid entier (les lignes d'un rapport
+    sont écrites d'un bloc et restent contiguës), rapport, utilisateur et
+    numéros encodés par dictionnaire, type et type de numéro en petits
+    entiers, erreurs en masque de bits, datetime_ts seul quand le texte
+    d'origine s'en déduit. La vue fax_entries restitue les colonnes
+    historiques. L'index plein texte porte sur les dictionnaires.
+
+    L'ancienne table est seulement renommée : ses lignes sont converties
+    par le rattrapage COMPACT_BACKFILL, qui la supprime à la fin.
+    """
+    global _dictionary_fts
+    _create_entry_dictionaries(cur)
+    _dictionary_fts = None
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            report_key INTEGER NOT NULL,
+            uuid BLOB,
+            fax_id TEXT,
+            user_id INTEGER,
+            type_code INTEGER,
+            original_id INTEGER,
+            number_id INTEGER,
+            numero_type_code INTEGER,
+            valide INTEGER NOT NULL DEFAULT 0,
+            pages INTEGER,
+            datetime_ts INTEGER,
+            datetime_raw TEXT,
+            error_mask INTEGER NOT NULL DEFAULT 0,
+            errors_raw TEXT
+        )
+        """
+    )
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS idx_entries_report_ts ON entries(report_key, datetime_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_report_type ON entries(report_key, type_code)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_report_valide ON entries(report_key, valide)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_report_pages ON entries(report_key, pages)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_user ON entries(user_id, report_key)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_number ON entries(number_id, report_key)",
+    ):
+        cur.execute(stmt)
+
+    cur.execute("SELECT type FROM sqlite_master WHERE name = 'fax_entries'")
+    row = cur.fetchone()
+    if row is not None and row[0] == "table":
+        for trigger in ("fax_entries_fts_ai", "fax_entries_fts_ad", "fax_entries_fts_au"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute(f"ALTER TABLE fax_entries RENAME TO {LEGACY_ENTRIES}")
+        # Clé de chaque rapport fixée maintenant : un rapport réimporté ou
+        # supprimé pendant la conversion change de clé et n'est plus converti.
+        cur.execute("INSERT OR IGNORE INTO report_keys (report_id) SELECT id FROM reports")
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {LEGACY_KEYS} (report_id TEXT PRIMARY KEY, report_key INTEGER NOT NULL)"
+        )
+        cur.execute(f"INSERT OR IGNORE INTO {LEGACY_KEYS} (report_id, report_key) SELECT report_id, id FROM report_keys")
+        upper = cur.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {LEGACY_ENTRIES}").fetchone()[0]
+        if upper:
+            enqueue_backfill(cur, COMPACT_BACKFILL, upper)
+        else:
+            _drop_legacy_entries(cur)
+    cur.execute(
+        "DELETE FROM schema_backfills WHERE name IN ('fax_entries.datetime_ts', 'fax_entries_fts')"
+    )
+    _create_entries_view(cur)
+
+def _create_entries_view(cur: sqlite3.Cursor) -> None:
+    cur.execute("DROP VIEW IF EXISTS fax_entries")
+    cur.execute(
+        f"""
+        CREATE VIEW fax_entries AS
+        SELECT e.id AS entry_rowid, e.datetime_ts AS datetime_ts, {ENTRY_SELECT}
+        FROM {ENTRY_FROM}
+        """
+    )
+
+def _drop_legacy_entries(cur: sqlite3.Cursor) -> None:
+    cur.execute("DROP TABLE IF EXISTS fax_entries_fts")
+    cur.execute(f"DROP TABLE IF EXISTS {LEGACY_ENTRIES}")
+    cur.execute(f"DROP TABLE IF EXISTS {LEGACY_KEYS}")
+
+def _backfill_compact_entries(cur: sqlite3.Cursor, position: int, upper: int, batch_size: int) -> int:
+    """Convertit `batch_size` lignes de l'ancienne table (ordre des rowid).
+
+    Les lignes d'un rapport supprimé, réimporté ou sans en-tête depuis la
+    migration sont ignorées. Le dernier lot supprime l'ancienne table,
+    reporte les tonalités connues sur les numéros créés et relance le calcul
+    des cumuls journaliers.
+    """
+    legacy = cur.execute(
+        f"SELECT rowid AS legacy_rowid, * FROM {LEGACY_ENTRIES} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?",
+        (position, upper, batch_size),
+    ).fetchall()
+    by_report: Dict[str, List[Dict]] = {}
+    for r in legacy:
+        by_report.setdefault(r["report_id"], []).append(dict(r))
+
+    caches: Dict[str, Dict[str, int]] = {}
+    converted: List[str] = []
+    for report_id, entries in by_report.items():
+        key = cur.execute(
+            f"""
+            SELECT l.report_key FROM {LEGACY_KEYS} l
+            JOIN report_keys k ON k.id = l.report_key AND k.report_id = l.report_id
+            JOIN reports r ON r.id = l.report_id AND r.deleted_at IS NULL AND r.archive_path IS NULL
+            WHERE l.report_id = ?
+            """,
+            (report_id,),
+        ).fetchone()
+        if key is None:
+            continue
+        for entry in entries:
+            try:
+                entry["erreurs"] = json.loads(entry.get("erreurs") or "[]")
+            except ValueError:
+                entry["erreurs"] = [entry["erreurs"]]
+        rows = list(_prepare_entry_rows(entries, {}, dict.fromkeys(REPORT_AGGREGATE_FIELDS, 0)))
+        encoded, seen = _encode_entry_rows(cur, key[0], rows, caches)
+        cur.executemany(ENTRIES_INSERT_SQL, encoded)
+        # Les numéros déjà classés par un import plus récent gardent leur type.
+        cur.executemany(
+            "UPDATE numbers SET numero_type_code = ? WHERE id = ? AND numero_type_code IS NULL",
+            [(v[0], n) for n, v in seen.items() if v[0] is not None],
+        )
+        _record_seen_dates(cur, seen)
+        converted.append(report_id)
+    invalidate_entry_counts(converted)
+
+    position = legacy[-1]["legacy_rowid"] if legacy else upper
+    if position >= upper:
+        _drop_legacy_entries(cur)
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'tone_detection_cache'")
+        if cur.fetchone() is not None:
+            cur.execute(
+                """
+                UPDATE numbers SET tone = c.tone, tone_is_fax = c.is_fax, tone_detected_at = c.detected_at
+                FROM tone_detection_cache AS c
+                WHERE c.numero = numbers.numero_normalise AND numbers.tone IS NULL
+                """
+            )
+        _create_entries_view(cur)
+        # Cumuls des rapports convertis : calculés avant leurs entrées.
+        upper_key = cur.execute("SELECT COALESCE(MAX(id), 0) FROM report_keys").fetchone()[0]
+        enqueue_backfill(cur, ROLLUP_BACKFILL, upper_key)
+        logger.info("Stockage compact: conversion des anciennes entrées terminée")
+    return position
+
+register_backfill(COMPACT_BACKFILL, _backfill_compact_entries)
+
+def _migration_numbers_dimension(cur: sqlite3.Cursor) -> None:
+    """Fait de `numbers` la dimension des numéros.
+
+    Chaque numéro porte son type (jusque-là répété sur chaque entrée), le
+    dernier résultat de détection de tonalité et ses premières et dernières
+    apparitions : reclasser un numéro ne modifie plus qu'une ligne.
+    """
+    # La vue dépend des colonnes déplacées : recréée à la fin.
+    cur.execute("DROP VIEW IF EXISTS fax_entries")
+    for column, decl in (
+        ("numero_type_code", "INTEGER"),
+        ("tone", "TEXT"),
+        ("tone_is_fax", "INTEGER"),
+        ("tone_detected_at", "TEXT"),
+        ("first_seen_ts", "INTEGER"),
+        ("last_seen_ts", "INTEGER"),
+    ):
+        add_column(cur, "numbers", column, decl)
+    if column_exists(cur, "entries", "numero_type_code"):
+        # Type de l'entrée la plus récente de chaque numéro.
+        cur.execute(
+            """
+            UPDATE numbers SET
+                numero_type_code = (SELECT numero_type_code FROM entries WHERE id = s.last_id),
+                first_seen_ts = s.first_ts,
+                last_seen_ts = s.last_ts
+            FROM (
+                SELECT number_id, MAX(id) AS last_id,
+                       MIN(datetime_ts) AS first_ts, MAX(datetime_ts) AS last_ts
+                FROM entries WHERE number_id IS NOT NULL GROUP BY number_id
+            ) AS s
+            WHERE s.number_id = numbers.id
+            """
+        )
+        cur.execute("ALTER TABLE entries DROP COLUMN numero_type_code")
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'tone_detection_cache'")
+    if cur.fetchone() is not None:
+        cur.execute(
+            """
+            UPDATE numbers SET tone = c.tone, tone_is_fax = c.is_fax, tone_detected_at = c.detected_at
+            FROM tone_detection_cache AS c
+            WHERE c.numero = numbers.numero_normalise
+            """
+        )
+    _create_entries_view(cur)
+
+def _migration_report_catalog(cur: sqlite3.Cursor) -> None:
+    # Le catalogue pagine sur (created_at, id) : pas de NULL dans la clé.
+    cur.execute("UPDATE reports SET created_at = COALESCE(date_rapport, '') WHERE created_at IS NULL")
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS idx_reports_created ON reports(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_contract ON reports(contract_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_period ON reports(date_debut, date_fin)",
+    ):
+        cur.execute(stmt)
+
+# Clé de chaque niveau des compteurs du tableau de bord, en SQL et en Python.
+_DASHBOARD_SCOPE_SQL = {
+    "global": "''",
+    "contract": (
+        "CASE WHEN contract_id IS NULL OR lower(trim(contract_id)) IN ('', 'none', 'null') "
+        "THEN '' ELSE contract_id END"
+    ),
+    "month": "substr(COALESCE(created_at, ''), 1, 7)",
+}
+
+def _contract_key(contract_id) -> str:
+    """Contrat tel que rangé dans les compteurs et cumuls ('' si absent)."""
+    if contract_id is None or str(contract_id).strip().lower() in {"", "none", "null"}:
+        return ""
+    return str(contract_id)
+
+def sharding_enabled() -> bool:
+    """Nouveaux rapports rangés dans une base par contrat (DB_SHARDING=contract)."""
+    return settings.db_sharding == "contract"
+
+def _shards_dir() -> Path:
+    return settings.database_path.parent / "shards"
+
+def _shard_name(contract_id) -> Optional[str]:
+    key = _contract_key(contract_id)
+    if not sharding_enabled() or not key:
+        return None
+    # Le hachage départage les contrats qui s'écrivent pareil une fois nettoyés.
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)[:64]}-{digest}.db"
+
+def _shard_path(contract_id) -> Path:
+    """Base qui reçoit les nouveaux rapports d'un contrat."""
+    name = _shard_name(contract_id)
+    return _shards_dir() / name if name else settings.database_path
+
+# Bases par contrat connues du processus (santé sans parcourir le dossier).
+_known_shards: Optional[set] = None
+
+def _open_database(path: Path) -> Path:
+    """Migre une base par contrat au premier usage (créée si besoin)."""
+    global _known_shards
+    if path != settings.database_path:
+        with using_database(path):
+            migrate(CORE_SCHEMA, CORE_MIGRATIONS)
+        if _known_shards is not None:
+            _known_shards.add(path.name)
+    return path
+
+def shard_databases() -> List[Path]:
+    """Bases par contrat existantes."""
+    global _known_shards
+    paths = sorted(_shards_dir().glob("*.db"))
+    _known_shards = {p.name for p in paths}
+    return paths
+
+def shard_stats() -> Dict:
+    if _known_shards is None:
+        shard_databases()
+    return {"enabled": sharding_enabled(), "databases": len(_known_shards)}
+
+def all_databases() -> List[Path]:
+    """Base principale (catalogue) puis bases par contrat."""
+    return [settings.database_path] + [_open_database(p) for p in shard_databases()]
+
+def report_database(report_id: str) -> Path:
+    """Base qui contient le rapport, d'après la table de routage du catalogue.
+
+    Les rapports sans route (importés sans sharding ou sans contrat) sont
+    dans la base principale. Le routage ne dépend pas de DB_SHARDING : les
+    rapports déjà rangés par contrat restent lisibles s'il est désactivé.
+    """
+    conn = _connect(readonly=True, path=settings.database_path)
     try:
-        _backfill_datetime_ts(cur)
-        conn.commit()
-    except Exception:
+        row = conn.execute("SELECT shard FROM report_shards WHERE report_id = ?", (report_id,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return _open_database(_shards_dir() / row["shard"]) if row else settings.database_path
+
+def _on_report_database(func):
+    """Exécute `func(report_id, ...)` sur la base qui contient le rapport."""
+    @functools.wraps(func)
+    def wrapper(report_id, *args, **kwargs):
+        path = report_database(report_id)
+        if path == current_database_path():
+            return func(report_id, *args, **kwargs)
+        with using_database(path):
+            return func(report_id, *args, **kwargs)
+    return wrapper
+
+def _sync_catalog(report_id: str) -> None:
+    """Recopie dans le catalogue l'état d'un rapport de la base par contrat courante.
+
+    Le catalogue (base principale) garde la route du rapport, une copie de sa
+    ligne reports (liste des rapports), ses compteurs du tableau de bord et
+    ses cumuls journaliers (tendances) : ces lectures ne touchent aucune base
+    par contrat. Un rapport supprimé sort de la copie ; sa route reste
+    jusqu'à la fin de sa purge. À appeler hors transaction d'écriture.
+    """
+    path = current_database_path()
+    if path == settings.database_path:
+        return
+    conn = _connect(readonly=True)
+    try:
+        row = conn.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
+        rollups = conn.execute(
+            "SELECT * FROM report_daily_rollups WHERE report_id = ?", (report_id,)
+        ).fetchall()
+    finally:
+        conn.close()
 
-        pass
+    with write_transaction(settings.database_path) as wconn:
+        cur = wconn.cursor()
+        _update_dashboard_counters(cur, report_id, -1)
+        cur.execute("DELETE FROM report_daily_rollups WHERE report_id = ?", (report_id,))
+        cur.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+        if row is None:
+            cur.execute(
+                "DELETE FROM report_shards WHERE report_id = ? AND shard = ?", (report_id, path.name)
+            )
+        else:
+            cur.execute(
+                "INSERT OR REPLACE INTO report_shards (report_id, contract_id, shard) VALUES (?, ?, ?)",
+                (report_id, _contract_key(row["contract_id"]), path.name),
+            )
+        if row is not None and not row["deleted_at"]:
+            _copy_report_to_catalog(cur, report_id, row, rollups)
+    invalidate_report_catalog()
 
-    conn.close()
+def _copy_report_to_catalog(cur: sqlite3.Cursor, report_id: str, row: sqlite3.Row,
+                            rollups: List[sqlite3.Row]) -> None:
+    cur.execute(
+        f"INSERT INTO reports ({', '.join(row.keys())}) VALUES ({', '.join('?' * len(row))})",
+        tuple(row),
+    )
+    _update_dashboard_counters(cur, report_id, 1)
+    if rollups:
+        columns = rollups[0].keys()
+        cur.executemany(
+            f"INSERT INTO report_daily_rollups ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(r) for r in rollups],
+        )
+
+def _dashboard_keys(row: sqlite3.Row) -> Dict[str, str]:
+    return {
+        "global": "",
+        "contract": _contract_key(row["contract_id"]),
+        "month": (row["created_at"] or "")[:7],
+    }
+
+def _dashboard_aggregates_sql(where: str = "deleted_at IS NULL") -> str:
+    return " UNION ALL ".join(
+        f"""
+        SELECT '{scope}' AS scope, {key_sql} AS key, COUNT(*) AS reports_count,
+               COALESCE(SUM(total_fax), 0) AS total_fax,
+               COALESCE(SUM(erreurs_totales), 0) AS total_errors,
+               COALESCE(SUM(taux_reussite), 0.0) AS rate_sum,
+               COUNT(taux_reussite) AS rate_count
+        FROM reports WHERE {where} GROUP BY 2
+        """
+        for scope, key_sql in _DASHBOARD_SCOPE_SQL.items()
+    )
+
+def _rebuild_dashboard_counters(cur: sqlite3.Cursor, where: str = "deleted_at IS NULL") -> None:
+    cur.execute("DELETE FROM dashboard_counters")
+    cur.execute(f"INSERT INTO dashboard_counters {_dashboard_aggregates_sql(where)}")
+
+def _migration_dashboard_counters(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            reports_count INTEGER NOT NULL DEFAULT 0,
+            total_fax INTEGER NOT NULL DEFAULT 0,
+            total_errors INTEGER NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0,
+            rate_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, key)
+        )
+        """
+    )
+    # reports.deleted_at n'existe qu'à partir de la migration 12.
+    _rebuild_dashboard_counters(cur, where="1")
+
+ROLLUP_BACKFILL = "report_daily_rollups"
+
+def _migration_daily_rollups(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_daily_rollups (
+            report_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            contract_id TEXT NOT NULL DEFAULT '',
+            fax_total INTEGER NOT NULL DEFAULT 0,
+            fax_sf INTEGER NOT NULL DEFAULT 0,
+            fax_rf INTEGER NOT NULL DEFAULT 0,
+            pages_sf INTEGER NOT NULL DEFAULT 0,
+            pages_rf INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            sda INTEGER NOT NULL DEFAULT 0,
+            sda_fax INTEGER NOT NULL DEFAULT 0,
+            telephone INTEGER NOT NULL DEFAULT 0,
+            mobile INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (report_id, day)
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rollups_contract_day ON report_daily_rollups(contract_id, day)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rollups_day ON report_daily_rollups(day)")
+    # Rapports existants : cumuls calculés en arrière-plan, par lots de rapports.
+    upper = cur.execute("SELECT COALESCE(MAX(id), 0) FROM report_keys").fetchone()[0]
+    enqueue_backfill(cur, ROLLUP_BACKFILL, upper)
+
+def _migration_entry_archive(cur: sqlite3.Cursor) -> None:
+    # Rapport archivé : ses entrées sont lues dans archive_path (voir core.archive).
+    add_column(cur, "reports", "archived_at", "TEXT")
+    add_column(cur, "reports", "archive_path", "TEXT")
+
+def _migration_deleted_reports(cur: sqlite3.Cursor) -> None:
+    # Rapport supprimé en attente de purge (voir purge_deleted_reports).
+    add_column(cur, "reports", "deleted_at", "TEXT")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reports_deleted ON reports(deleted_at) WHERE deleted_at IS NOT NULL"
+    )
+
+def _migration_report_shards(cur: sqlite3.Cursor) -> None:
+    # Catalogue : base par contrat de chaque rapport (voir report_database).
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_shards (
+            report_id TEXT PRIMARY KEY,
+            contract_id TEXT NOT NULL DEFAULT '',
+            shard TEXT NOT NULL
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_report_shards_shard ON report_shards(shard)")
+
+CORE_MIGRATIONS = (
+    Migration(1, "tables de base", _migration_base_tables),
+    Migration(2, "index des entrées", _migration_entry_indexes),
+    Migration(3, "agrégats par rapport", _migration_report_aggregates),
+    Migration(4, "rattrapage datetime_ts", _migration_superseded),
+    Migration(5, "index plein texte des entrées", _migration_superseded),
+    Migration(6, "stockage compact des entrées", _migration_compact_entries),
+    Migration(7, "dimension numéros", _migration_numbers_dimension),
+    Migration(8, "index du catalogue des rapports", _migration_report_catalog),
+    Migration(9, "compteurs du tableau de bord", _migration_dashboard_counters),
+    Migration(10, "cumuls journaliers par contrat", _migration_daily_rollups),
+    Migration(11, "archivage des entrées", _migration_entry_archive),
+    Migration(12, "suppression différée des rapports", _migration_deleted_reports),
+    Migration(13, "routage des bases par contrat", _migration_report_shards),
+)
+
+def init_database() -> None:
+    """Applique les migrations en attente (une seule lecture si la base est à jour).
+
+    Les rattrapages longs sont lancés séparément par `start_backfills()`.
+    """
+    ensure_directories()
+    migrate(CORE_SCHEMA, CORE_MIGRATIONS)
+
+def database_status() -> Dict:
+    """Sonde de santé en temps constant : version du schéma et rattrapages en cours."""
+    return {
+        "schema_version": schema_version(CORE_SCHEMA),
+        "backfills_pending": [b["name"] for b in pending_backfills()],
+    }
+
+def _dictionary_fts_enabled() -> bool:
+    if _dictionary_fts is None:
+        conn = _connect(readonly=True)
+        try:
+            _dictionary_fts_exists(conn.cursor())
+        finally:
+            conn.close()
+    return bool(_dictionary_fts)
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
 
 def _parse_datetime_to_ts(value) -> Optional[int]:
     if value is None:
@@ -159,203 +1013,814 @@ def _date_str_to_range(date_str: str) -> Tuple[Optional[int], Optional[int]]:
     except Exception:
         return None, None
 
-def _backfill_datetime_ts(cur: sqlite3.Cursor) -> None:
+INSERT_CHUNK_SIZE = 5000
 
-    cur.execute("SELECT COUNT(*) AS cnt FROM fax_entries WHERE datetime_ts IS NULL")
-    missing = int(cur.fetchone()["cnt"])
-    if missing <= 0:
-        return
+_BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": "-65536",
+}
 
-    batch_size = 5000
-    while True:
-        cur.execute(
-            "SELECT id, datetime FROM fax_entries WHERE datetime_ts IS NULL LIMIT ?",
-            (batch_size,),
-        )
-        rows = cur.fetchall()
-        if not rows:
-            break
+# Clés de report_keys détachées de leur rapport : entrées d'un import en cours
+# ("import"), d'un import échoué ou d'une version remplacée par un réimport
+# ("detached", purgées en arrière-plan). Le séparateur 0x1F ne figure pas
+# dans les identifiants de rapport.
+_KEY_SEP = "\x1f"
+_ATTACHED_KEY_SQL = "instr(k.report_id, char(31)) = 0"
 
-        for r in rows:
-            entry_id = r["id"]
-            ts = _parse_datetime_to_ts(r["datetime"])
-            if ts is None:
+def _detached_key_name(report_id: str, state: str) -> str:
+    return f"{report_id}{_KEY_SEP}{state}:{uuid.uuid4().hex}"
 
-                continue
-            cur.execute(
-                "UPDATE fax_entries SET datetime_ts = ? WHERE id = ?",
-                (ts, entry_id),
-            )
+def _detach_key(cur: sqlite3.Cursor, key: int, report_id: str) -> None:
+    cur.execute(
+        "UPDATE report_keys SET report_id = ? WHERE id = ?",
+        (_detached_key_name(report_id, "detached"), key),
+    )
 
-def insert_audit_event(
-    action: str,
-    user: str = "anonymous",
-    report_id: Optional[str] = None,
-    ip: Optional[str] = None,
-    user_agent: Optional[str] = None,
-    meta: Optional[Dict] = None,
-) -> None:
-    """Insère un événement d'audit (best-effort).
+REPORT_AGGREGATE_FIELDS = (
+    "entries_total", "fax_sf", "fax_rf", "pages_sf", "pages_rf", "valid_count", "invalid_count",
+)
 
-    Ne doit jamais casser l'app si l'audit échoue.
+def _prepare_entry_rows(entries: List[Dict], type_counts: Dict[str, int],
+                        aggregates: Dict[str, int]):
+    """Prépare les lignes d'insertion (parsing des dates mémorisé).
+
+    Remplit au passage `type_counts` (par numero_type) et `aggregates`
+    (champs de REPORT_AGGREGATE_FIELDS). Les lignes sont encodées pour la
+    table entries par `_encode_entry_rows`.
     """
-    try:
-        conn = _connect()
-        cur = conn.cursor()
-        ts = datetime.now(timezone.utc).isoformat()
-        meta_json = json.dumps(meta or {}, ensure_ascii=False)
+    ts_cache: Dict[object, Optional[int]] = {}
+    for entry in entries:
+        dt = entry.get("datetime")
+        if dt in ts_cache:
+            dt_ts = ts_cache[dt]
+        else:
+            dt_ts = ts_cache[dt] = _parse_datetime_to_ts(dt)
+
+        num_type = entry.get("numero_type", "unknown")
+        type_counts[num_type] = type_counts.get(num_type, 0) + 1
+
+        valide = 1 if entry.get("valide") else 0
+        aggregates["entries_total"] += 1
+        aggregates["valid_count" if valide else "invalid_count"] += 1
+        entry_type = (entry.get("type") or "").lower()
+        if entry_type in ("send", "receive"):
+            suffix = "sf" if entry_type == "send" else "rf"
+            try:
+                pages = int(entry.get("pages") or 0)
+            except (TypeError, ValueError):
+                pages = 0
+            aggregates[f"fax_{suffix}"] += 1
+            aggregates[f"pages_{suffix}"] += pages
+
+        yield (
+            entry.get("id"),
+            entry.get("fax_id"),
+            entry.get("utilisateur"),
+            entry.get("type"),
+            entry.get("numero_original"),
+            entry.get("numero_normalise"),
+            valide,
+            entry.get("pages"),
+            dt,
+            dt_ts,
+            tuple(entry.get("erreurs", []) or ()),
+            num_type,
+            entry.get("numero_type_label", ""),
+        )
+
+_DASHBOARD_ROW_SQL = (
+    "SELECT contract_id, created_at, total_fax, erreurs_totales, taux_reussite FROM reports "
+    "WHERE id = ? AND deleted_at IS NULL"
+)
+
+def _update_dashboard_counters(cur: sqlite3.Cursor, report_id: str, sign: int) -> None:
+    """Ajoute (sign=1) ou retire (sign=-1) un rapport des compteurs du tableau de bord.
+
+    À appeler dans la transaction qui écrit ou supprime la ligne de reports.
+    """
+    row = cur.execute(_DASHBOARD_ROW_SQL, (report_id,)).fetchone()
+    if row is None:
+        return
+    rate = row["taux_reussite"]
+    values = (
+        sign,
+        sign * int(row["total_fax"] or 0),
+        sign * int(row["erreurs_totales"] or 0),
+        sign * float(rate or 0.0),
+        sign if rate is not None else 0,
+    )
+    for scope, key in _dashboard_keys(row).items():
         cur.execute(
             """
-            INSERT INTO audit_log (ts, user, action, report_id, ip, user_agent, meta_json)
+            INSERT INTO dashboard_counters
+                (scope, key, reports_count, total_fax, total_errors, rate_sum, rate_count)
             VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(scope, key) DO UPDATE SET
+                reports_count = reports_count + excluded.reports_count,
+                total_fax = total_fax + excluded.total_fax,
+                total_errors = total_errors + excluded.total_errors,
+                rate_sum = rate_sum + excluded.rate_sum,
+                rate_count = rate_count + excluded.rate_count
             """,
-            (ts, user, action, report_id, ip, user_agent, meta_json),
+            (scope, key) + values,
         )
-        conn.commit()
-        conn.close()
-    except Exception:
-
-        return
-
-def list_audit_events(limit: int = 200, offset: int = 0) -> List[Dict]:
-    """Retourne les événements d'audit les plus récents."""
-    limit = max(1, min(1000, int(limit)))
-    offset = max(0, int(offset))
+        if sign < 0:
+            cur.execute(
+                "DELETE FROM dashboard_counters WHERE scope = ? AND key = ? AND reports_count <= 0",
+                (scope, key),
+            )
 
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, ts, user, action, report_id, ip, user_agent, meta_json
-        FROM audit_log
-        ORDER BY id DESC
-        LIMIT ? OFFSET ?
-        """,
-        (limit, offset),
-    )
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+def insert_report_to_db(report_id: str, report_json: Dict, qr_path: Optional[str], **kwargs) -> None:
+    """Enregistre un rapport et ses entrées dans la base de son contrat.
 
-def insert_report_to_db(
+    Sans sharding, c'est toujours la base principale. Les imports de contrats
+    différents n'écrivent pas dans la même base et ne s'attendent donc pas ;
+    le catalogue n'est mis à jour qu'une fois le rapport complet. Voir
+    `_insert_report` pour l'écriture elle-même.
+    """
+    target = _open_database(_shard_path(report_json.get("contract_id")))
+    previous = report_database(report_id)
+    if previous != target:
+        # Réimport sous un autre contrat : l'ancienne version quitte sa base
+        # (ses fichiers JSON et QR, déjà régénérés, sont gardés).
+        with using_database(previous):
+            if _mark_deleted(report_id) and _purge_report(report_id, keep_files=True):
+                _count_purge(purged=1)
+    with using_database(target):
+        _insert_report(report_id, report_json, qr_path, **kwargs)
+        _sync_catalog(report_id)
+
+def _insert_report(
     report_id: str,
     report_json: Dict,
     qr_path: Optional[str],
     source_filename: Optional[str] = None,
     source_filesize: Optional[int] = None,
     source_sha256: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    chunk_size: int = INSERT_CHUNK_SIZE,
 ) -> None:
-    conn = _connect()
-    cur = conn.cursor()
+    """Enregistre un rapport et ses entrées.
+
+    Les entrées sont encodées (voir `_encode_entry_rows`) et écrites par lots
+    (`executemany`, une transaction par lot) sur une connexion dédiée aux
+    pragmas orientés écriture, sous une clé de rapport provisoire. La
+    dernière transaction écrit l'en-tête et les agrégats et bascule la clé :
+    le rapport n'est visible qu'une fois complet et, en cas de réimport,
+    l'ancienne version reste entière jusque-là (ses entrées, détachées, sont
+    purgées en arrière-plan). `on_progress(lignes_écrites, total)` est appelé
+    après chaque lot.
+    """
+    entries = report_json.get("entries", [])
+    total = len(entries)
     stats = report_json.get("statistics", {})
+    type_counts: Dict[str, int] = {}
+    aggregates = dict.fromkeys(REPORT_AGGREGATE_FIELDS, 0)
+    chunk_size = max(1, int(chunk_size))
+
+    # Rapport archivé réimporté : l'INSERT OR REPLACE le désarchive.
+    previous_archive = _report_archive_path(report_id)
+    replaced = False
+    with write_transaction() as wconn:
+        cur = wconn.cursor()
+        cur.execute("INSERT INTO report_keys (report_id) VALUES (?)", (_detached_key_name(report_id, "import"),))
+        staging_key = cur.lastrowid
+        # Rapport supprimé en attente de purge : sa purge s'arrête avec sa ligne,
+        # ses entrées partent avec sa clé détachée.
+        if cur.execute("DELETE FROM reports WHERE id = ? AND deleted_at IS NOT NULL", (report_id,)).rowcount:
+            cur.execute("DELETE FROM report_numero_types WHERE report_id = ?", (report_id,))
+            cur.execute("DELETE FROM report_aggregates WHERE report_id = ?", (report_id,))
+            old = cur.execute("SELECT id FROM report_keys WHERE report_id = ?", (report_id,)).fetchone()
+            if old is not None:
+                _detach_key(cur, old["id"], report_id)
+                replaced = True
+
+    try:
+        rows = _prepare_entry_rows(entries, type_counts, aggregates)
+        caches: Dict[str, Dict[str, int]] = {}
+        reclassified: set = set()
+        kept: List[int] = []
+        written = 0
+        # Pragmas de chargement sur une connexion à part : ils ne restent pas
+        # sur la connexion partagée du thread.
+        bulk = dedicated_connection(pragmas=_BULK_LOAD_PRAGMAS)
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                with write_transaction(conn=bulk) as wconn:
+                    cur = wconn.cursor()
+                    encoded, seen = _encode_entry_rows(cur, staging_key, chunk, caches)
+                    cur.executemany(ENTRIES_INSERT_SQL, encoded)
+                    reclassified.update(_record_numbers(cur, staging_key, seen, kept))
+                written += len(chunk)
+                if on_progress:
+                    on_progress(written, total)
+        finally:
+            bulk.close()
+
+        with write_transaction() as wconn:
+            cur = wconn.cursor()
+            # Bascule : l'ancienne version (s'il y en a une) perd sa clé.
+            old = cur.execute("SELECT id FROM report_keys WHERE report_id = ?", (report_id,)).fetchone()
+            if old is not None:
+                _detach_key(cur, old["id"], report_id)
+            cur.execute("UPDATE report_keys SET report_id = ? WHERE id = ?", (report_id, staging_key))
+            cur.execute("DELETE FROM report_numero_types WHERE report_id = ?", (report_id,))
+            cur.executemany(
+                "INSERT INTO report_numero_types (report_id, numero_type, cnt) VALUES (?, ?, ?)",
+                [(report_id, t, c) for t, c in type_counts.items()],
+            )
+            _write_report_aggregates(cur, report_id, aggregates)
+            # Rapport réimporté : l'ancienne version sort des compteurs.
+            _update_dashboard_counters(cur, report_id, -1)
+            cur.execute(
+                """
+                INSERT OR REPLACE INTO reports (
+                    id, date_rapport, contract_id, date_debut, date_fin,
+                    total_fax, fax_envoyes, fax_recus, pages_totales, erreurs_totales,
+                    taux_reussite, qr_path, url_rapport, created_at
+                    , source_filename, source_filesize, source_sha256
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    report_json.get("report_id"),
+                    report_json.get("timestamp"),
+                    report_json.get("contract_id"),
+                    report_json.get("date_debut"),
+                    report_json.get("date_fin"),
+                    stats.get("total_fax", 0),
+                    stats.get("fax_envoyes", 0),
+                    stats.get("fax_recus", 0),
+                    stats.get("pages_totales", 0),
+                    stats.get("erreurs_totales", 0),
+                    stats.get("taux_reussite", 0.0),
+                    qr_path,
+                    report_json.get("url_rapport"),
+                    report_json.get("timestamp"),
+                    source_filename,
+                    source_filesize,
+                    source_sha256,
+                ),
+            )
+            _update_dashboard_counters(cur, report_id, 1)
+            _write_report_rollups(cur, report_id)
+            replaced = replaced or old is not None
+    except Exception:
+        # Import interrompu : la version en place n'a pas bougé, les entrées
+        # déjà écrites partent avec la clé provisoire.
+        with write_transaction() as wconn:
+            _detach_key(wconn.cursor(), staging_key, report_id)
+        start_report_purge()
+        raise
+    finally:
+        invalidate_entry_counts([report_id])
+        invalidate_report_catalog()
+    # Rapports antérieurs dont des numéros viennent d'être reclassés ; le
+    # rapport lui-même si des numéros y ont gardé un type connu.
+    if kept:
+        reclassified.add(report_id)
+    refresh_report_numero_types(sorted(reclassified))
+    if previous_archive:
+        _remove_report_file(previous_archive)
+    if replaced:
+        start_report_purge()
+
+def refresh_report_numero_types(report_ids: List[str]) -> None:
+    """Recalcule la répartition persistée par numero_type des rapports donnés.
+
+    Les rapports archivés gardent la répartition de leur archive ; les
+    rapports supprimés sont ignorés.
+    """
+    if not report_ids:
+        return
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        for report_id in report_ids:
+            row = cur.execute(
+                "SELECT archive_path, deleted_at FROM reports WHERE id = ?", (report_id,)
+            ).fetchone()
+            if row is not None and (row["archive_path"] or row["deleted_at"]):
+                continue
+            cur.execute("DELETE FROM report_numero_types WHERE report_id = ?", (report_id,))
+            cur.execute(
+                f"""
+                INSERT INTO report_numero_types (report_id, numero_type, cnt)
+                SELECT ?, COALESCE(nt.name, 'unknown'), COUNT(*)
+                FROM entries e
+                LEFT JOIN numbers n ON n.id = e.number_id
+                LEFT JOIN numero_types nt ON nt.id = n.numero_type_code
+                WHERE e.report_key = {_REPORT_KEY_SQL}
+                GROUP BY COALESCE(nt.name, 'unknown')
+                """,
+                (report_id, report_id),
+            )
+            # Répartition SDA/téléphone des cumuls journaliers.
+            _write_report_rollups(cur, report_id)
+    invalidate_entry_counts(report_ids)
+    for report_id in report_ids:
+        _sync_catalog(report_id)
+
+def _write_report_aggregates(cur: sqlite3.Cursor, report_id: str, aggregates: Dict[str, int]) -> None:
+    cols = ", ".join(REPORT_AGGREGATE_FIELDS)
     cur.execute(
-        """
-        INSERT OR REPLACE INTO reports (
-            id, date_rapport, contract_id, date_debut, date_fin,
-            total_fax, fax_envoyes, fax_recus, pages_totales, erreurs_totales,
-            taux_reussite, qr_path, url_rapport, created_at
-            , source_filename, source_filesize, source_sha256
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        f"""
+        INSERT OR REPLACE INTO report_aggregates (report_id, {cols})
+        VALUES (?, {", ".join("?" for _ in REPORT_AGGREGATE_FIELDS)})
         """,
-        (
-            report_json.get("report_id"),
-            report_json.get("timestamp"),
-            report_json.get("contract_id"),
-            report_json.get("date_debut"),
-            report_json.get("date_fin"),
-            stats.get("total_fax", 0),
-            stats.get("fax_envoyes", 0),
-            stats.get("fax_recus", 0),
-            stats.get("pages_totales", 0),
-            stats.get("erreurs_totales", 0),
-            stats.get("taux_reussite", 0.0),
-            qr_path,
-            report_json.get("url_rapport"),
-            report_json.get("timestamp"),
-            source_filename,
-            source_filesize,
-            source_sha256,
-        ),
+        (report_id, *(int(aggregates.get(f, 0)) for f in REPORT_AGGREGATE_FIELDS)),
     )
 
-    entries = report_json.get("entries", [])
-    for entry in entries:
-        dt_ts = _parse_datetime_to_ts(entry.get("datetime"))
-        cur.execute(
-            """
-            INSERT OR REPLACE INTO fax_entries (
-                id, report_id, fax_id, utilisateur, type,
-                numero_original, numero_normalise, valide, pages, datetime, datetime_ts, erreurs,
-                numero_type, numero_type_label
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                entry.get("id"),
-                report_id,
-                entry.get("fax_id"),
-                entry.get("utilisateur"),
-                entry.get("type"),
-                entry.get("numero_original"),
-                entry.get("numero_normalise"),
-                1 if entry.get("valide") else 0,
-                entry.get("pages"),
-                entry.get("datetime"),
-                dt_ts,
-                json.dumps(entry.get("erreurs", [])),
-                entry.get("numero_type", "unknown"),
-                entry.get("numero_type_label", ""),
-            ),
-        )
+_ROLLUP_COLUMNS = (
+    "fax_total", "fax_sf", "fax_rf", "pages_sf", "pages_rf", "errors",
+    "sda", "sda_fax", "telephone", "mobile",
+)
 
-    conn.commit()
-    conn.close()
+def _write_report_rollups(cur: sqlite3.Cursor, report_id: str) -> None:
+    """(Re)calcule les cumuls journaliers d'un rapport depuis ses entrées.
 
-def get_all_reports() -> List[Dict]:
-    conn = _connect()
-    cur = conn.cursor()
+    Le jour est la date UTC de datetime_ts (entrées sans date ignorées) ; le
+    contrat est relu dans reports, à écrire avant. Parcours de l'index
+    (report_key, datetime_ts) du rapport seulement. Les cumuls d'un rapport
+    archivé, calculés avant l'archivage, ne sont plus touchés ; un rapport
+    supprimé n'en a plus.
+    """
+    row = cur.execute(
+        "SELECT contract_id, archive_path, deleted_at FROM reports WHERE id = ?", (report_id,)
+    ).fetchone()
+    if row is not None and (row["archive_path"] or row["deleted_at"]):
+        return
+    cur.execute("DELETE FROM report_daily_rollups WHERE report_id = ?", (report_id,))
+    if row is None:
+        return
     cur.execute(
-        """
-        SELECT id, contract_id, date_debut, date_fin, total_fax, erreurs_totales, taux_reussite,
-               source_filename, source_filesize, source_sha256
-        FROM reports
-        ORDER BY created_at DESC
-        """
+        f"""
+        INSERT INTO report_daily_rollups (report_id, day, contract_id, {", ".join(_ROLLUP_COLUMNS)})
+        SELECT ?, date(e.datetime_ts, 'unixepoch'), ?,
+               COUNT(*),
+               TOTAL(e.type_code = {ENTRY_TYPE_CODES["send"]}),
+               TOTAL(e.type_code = {ENTRY_TYPE_CODES["receive"]}),
+               TOTAL(CASE WHEN e.type_code = {ENTRY_TYPE_CODES["send"]} THEN e.pages END),
+               TOTAL(CASE WHEN e.type_code = {ENTRY_TYPE_CODES["receive"]} THEN e.pages END),
+               TOTAL(e.valide = 0),
+               TOTAL(nt.name = 'sda'),
+               TOTAL(nt.name = 'sda_fax'),
+               TOTAL(nt.name IN ('geographic', 'phone')),
+               TOTAL(nt.name = 'mobile')
+        FROM entries e
+        LEFT JOIN numbers n ON n.id = e.number_id
+        LEFT JOIN numero_types nt ON nt.id = n.numero_type_code
+        WHERE e.report_key = {_REPORT_KEY_SQL} AND e.datetime_ts IS NOT NULL
+        GROUP BY 2
+        """,
+        (report_id, _contract_key(row["contract_id"]), report_id),
     )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
-def get_dashboard_stats() -> Dict:
-    """Retourne des KPIs globaux (dashboard) calculés en SQL."""
-    conn = _connect()
+def _backfill_daily_rollups(cur: sqlite3.Cursor, position: int, upper: int, batch_size: int) -> int:
+    """Cumuls des rapports existants ; un lot couvre environ `batch_size` entrées."""
+    budget = 0
+    for key in cur.execute(
+        """
+        SELECT k.id, k.report_id, COALESCE(a.entries_total, 0) AS entries
+        FROM report_keys k LEFT JOIN report_aggregates a ON a.report_id = k.report_id
+        WHERE k.id > ? AND k.id <= ? ORDER BY k.id
+        """,
+        (position, upper),
+    ).fetchall():
+        _write_report_rollups(cur, key["report_id"])
+        position = key["id"]
+        budget += key["entries"] or 1
+        if budget >= batch_size:
+            return position
+    return upper
+
+register_backfill(ROLLUP_BACKFILL, _backfill_daily_rollups)
+
+def refresh_report_aggregates(report_ids: List[str]) -> None:
+    """Recalcule depuis fax_entries les agrégats persistés des rapports donnés.
+
+    Réservé aux rapports antérieurs à la table : les rapports importés ont
+    leurs agrégats écrits à l'insertion.
+    """
+    if not report_ids:
+        return
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        for report_id in report_ids:
+            cur.execute(
+                """
+                SELECT
+                    COUNT(*) AS entries_total,
+                    COALESCE(SUM(LOWER(type) = 'send'), 0) AS fax_sf,
+                    COALESCE(SUM(LOWER(type) = 'receive'), 0) AS fax_rf,
+                    COALESCE(SUM(CASE WHEN LOWER(type) = 'send' THEN COALESCE(pages, 0) END), 0) AS pages_sf,
+                    COALESCE(SUM(CASE WHEN LOWER(type) = 'receive' THEN COALESCE(pages, 0) END), 0) AS pages_rf,
+                    COALESCE(SUM(valide = 1), 0) AS valid_count,
+                    COALESCE(SUM(valide IS NOT 1), 0) AS invalid_count
+                FROM fax_entries
+                WHERE report_id = ?
+                """,
+                (report_id,),
+            )
+            _write_report_aggregates(cur, report_id, dict(cur.fetchone()))
+    refresh_report_numero_types(report_ids)
+
+@_on_report_database
+def get_report_aggregates(report_id: str) -> Dict[str, int]:
+    """Retourne les agrégats persistés d'un rapport (calculés au premier appel si absents)."""
+    conn = _connect(readonly=True)
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(REPORT_AGGREGATE_FIELDS)} FROM report_aggregates WHERE report_id = ?",
+            (report_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        refresh_report_aggregates([report_id])
+        return get_report_aggregates(report_id)
+    return {k: int(row[k]) for k in REPORT_AGGREGATE_FIELDS}
+
+def _apply_report_aggregates(report: Dict, aggregates: Dict[str, int]) -> Dict:
+    """Ajoute au rapport les stats dérivées SF/RF/pages réelles."""
+    pages_sf = aggregates["pages_sf"]
+    pages_rf = aggregates["pages_rf"]
+    report["fax_sf"] = aggregates["fax_sf"]
+    report["fax_rf"] = aggregates["fax_rf"]
+    report["pages_reelles_sf"] = pages_sf
+    report["pages_reelles_rf"] = pages_rf
+    report["pages_reelles_totales"] = pages_sf + pages_rf
+    report["pages_envoyees"] = pages_sf
+    report["pages_recues"] = pages_rf
+    report["entries_total"] = aggregates["entries_total"]
+    report["entries_valides"] = aggregates["valid_count"]
+    report["entries_invalides"] = aggregates["invalid_count"]
+
+    if report.get("fax_envoyes") in (None, ""):
+        report["fax_envoyes"] = aggregates["fax_sf"]
+    if report.get("fax_recus") in (None, ""):
+        report["fax_recus"] = aggregates["fax_rf"]
+    if report.get("pages_totales") in (None, ""):
+        report["pages_totales"] = pages_sf + pages_rf
+    return report
+
+@_on_report_database
+def get_report_numero_types(report_id: str) -> Dict[str, int]:
+    """Retourne la répartition {numero_type: nombre d'entrées} d'un rapport.
+
+    Les rapports antérieurs à la table d'agrégats sont calculés puis persistés
+    au premier appel.
+    """
+    conn = _connect(readonly=True)
     cur = conn.cursor()
     cur.execute(
-        """
-        SELECT
-            COUNT(*) AS reports_count,
-            COALESCE(SUM(total_fax), 0) AS total_fax,
-            COALESCE(SUM(erreurs_totales), 0) AS total_errors,
-            COALESCE(AVG(taux_reussite), 0.0) AS avg_success_rate
-        FROM reports
-        """
+        "SELECT numero_type, cnt FROM report_numero_types WHERE report_id = ?",
+        (report_id,),
     )
-    row = cur.fetchone()
+    rows = cur.fetchall()
+    if not rows:
+        cur.execute("SELECT 1 FROM fax_entries WHERE report_id = ? LIMIT 1", (report_id,))
+        has_entries = cur.fetchone() is not None
+        conn.close()
+        if not has_entries:
+            return {}
+        refresh_report_numero_types([report_id])
+        return get_report_numero_types(report_id)
     conn.close()
-    if not row:
-        return {
-            "reports_count": 0,
-            "total_fax": 0,
-            "total_errors": 0,
-            "avg_success_rate": 0.0,
-        }
+    return {r["numero_type"]: int(r["cnt"]) for r in rows}
+
+REPORT_CATALOG_FIELDS = (
+    "id", "contract_id", "date_debut", "date_fin", "total_fax", "fax_envoyes", "fax_recus",
+    "pages_totales", "erreurs_totales", "taux_reussite", "source_filename",
+    "source_filesize", "source_sha256", "created_at", "archived_at",
+)
+REPORT_CATALOG_DEFAULT_FIELDS = (
+    "id", "contract_id", "date_debut", "date_fin", "total_fax", "erreurs_totales",
+    "taux_reussite", "source_filename", "source_filesize", "source_sha256", "created_at",
+)
+
+class ReportCatalogCache:
+    """Premières pages du catalogue par (filtres, champs, taille), LRU.
+
+    Vidé à chaque insertion ou suppression de rapport dans ce processus ;
+    le TTL borne le retard sur les écritures des autres processus (CLI).
+    Une page lue avant une invalidation n'est pas mise en cache ensuite.
+    """
+
+    def __init__(self, max_size: int = settings.report_catalog_cache_size,
+                 ttl: float = settings.report_catalog_cache_ttl):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[Tuple, Tuple[float, Dict]]" = OrderedDict()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._stats["misses"] += 1
+                return None
+            self._pages.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Tuple, page: Dict, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._pages[key] = (time.monotonic(), page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_size:
+                self._pages.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._pages.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, cached=len(self._pages))
+
+_report_catalog = ReportCatalogCache()
+
+def invalidate_report_catalog() -> None:
+    _report_catalog.invalidate()
+
+def report_catalog_stats() -> Dict[str, int]:
+    return _report_catalog.stats()
+
+def encode_reports_cursor(created_at: str, report_id: str) -> str:
+    raw = json.dumps([created_at, report_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_reports_cursor(token: str) -> Tuple[str, str]:
+    """Décode un jeton de `encode_reports_cursor` ; ValueError s'il est invalide."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, report_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Curseur invalide: {token!r}") from e
+    if not isinstance(created_at, str) or not isinstance(report_id, str):
+        raise ValueError(f"Curseur invalide: {token!r}")
+    return created_at, report_id
+
+def _catalog_date(value: Optional[str], label: str) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), "%Y-%m-%d").date().isoformat()
+    except ValueError as e:
+        raise ValueError(f"{label} invalide (AAAA-MM-JJ attendu): {value!r}") from e
+
+def _report_catalog_filters_sql(
+    contract: Optional[str], period_from: Optional[str], period_to: Optional[str],
+    created_from: Optional[str], created_to: Optional[str],
+) -> Tuple[List[str], List]:
+    where: List[str] = ["deleted_at IS NULL"]
+    params: List = []
+    if contract:
+        where.append("contract_id = ?")
+        params.append(contract)
+    # Période : rapports dont [date_debut, date_fin] recoupe [period_from, period_to].
+    if period_from:
+        where.append("date_fin >= ?")
+        params.append(period_from)
+    if period_to:
+        where.append("date_debut <= ?")
+        params.append(period_to)
+    if created_from:
+        where.append("created_at >= ?")
+        params.append(created_from)
+    if created_to:
+        where.append("created_at < ?")
+        params.append(
+            (datetime.strptime(created_to, "%Y-%m-%d") + timedelta(days=1)).date().isoformat()
+        )
+    return where, params
+
+def list_reports(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    *,
+    contract: Optional[str] = None,
+    period_from: Optional[str] = None,
+    period_to: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> Dict:
+    """Page du catalogue des rapports, du plus récent au plus ancien.
+
+    Retourne {"reports", "next_cursor", "total"} ; `total` n'est calculé que
+    pour la première page, servie par `ReportCatalogCache`. `fields`
+    restreint les colonnes renvoyées (parmi REPORT_CATALOG_FIELDS). Lève
+    ValueError si un champ, une date ou le curseur est invalide.
+    """
+    limit = max(1, min(500, int(limit)))
+    fields = list(fields or REPORT_CATALOG_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in REPORT_CATALOG_FIELDS]
+    if unknown:
+        raise ValueError(f"Champs inconnus: {', '.join(unknown)}")
+    after = decode_reports_cursor(cursor) if cursor else None
+    filters = (
+        contract or None,
+        _catalog_date(period_from, "period_from"),
+        _catalog_date(period_to, "period_to"),
+        _catalog_date(created_from, "created_from"),
+        _catalog_date(created_to, "created_to"),
+    )
+
+    key = filters + (tuple(fields), limit)
+    if after is None:
+        cached = _report_catalog.get(key)
+        if cached is not None:
+            return dict(cached, reports=[dict(r) for r in cached["reports"]])
+    generation = _report_catalog.generation()
+
+    where, params = _report_catalog_filters_sql(*filters)
+    page_where = list(where)
+    page_params = list(params)
+    if after is not None:
+        page_where.append("(created_at, id) < (?, ?)")
+        page_params.extend(after)
+    columns = list(dict.fromkeys(fields + ["created_at", "id"]))
+
+    conn = _connect(readonly=True)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT {", ".join(columns)}
+            FROM reports
+            WHERE {" AND ".join(page_where)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+            """,
+            tuple(page_params + [limit + 1]),
+        ).fetchall()
+        total = None
+        if after is None:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM reports WHERE {' AND '.join(where)}",
+                tuple(params),
+            ).fetchone()[0]
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_reports_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    page = {
+        "reports": [{f: r[f] for f in fields} for r in rows],
+        "next_cursor": next_cursor,
+        "total": total,
+    }
+    if after is None:
+        _report_catalog.put(key, page, generation)
+    return page
 
+def iter_reports(page_size: int = 500, **filters) -> Iterator[Dict]:
+    """Parcourt tout le catalogue filtré, page par page (curseur)."""
+    cursor = None
+    while True:
+        page = list_reports(page_size, cursor, **filters)
+        yield from page["reports"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
+
+def get_all_reports() -> List[Dict]:
+    """Tous les rapports du catalogue (préférer `list_reports`, paginé)."""
+    return list(iter_reports())
+
+def _dashboard_counter(row: Optional[sqlite3.Row]) -> Dict:
+    if row is None:
+        return {"reports_count": 0, "total_fax": 0, "total_errors": 0, "avg_success_rate": 0.0}
     return {
-        "reports_count": int(row["reports_count"] or 0),
-        "total_fax": int(row["total_fax"] or 0),
-        "total_errors": int(row["total_errors"] or 0),
-        "avg_success_rate": float(row["avg_success_rate"] or 0.0),
+        "reports_count": int(row["reports_count"]),
+        "total_fax": int(row["total_fax"]),
+        "total_errors": int(row["total_errors"]),
+        "avg_success_rate": float(row["rate_sum"] / row["rate_count"]) if row["rate_count"] else 0.0,
     }
 
+def get_dashboard_stats(breakdowns: bool = False) -> Dict:
+    """Retourne des KPIs globaux (dashboard) lus dans dashboard_counters.
+
+    Une seule ligne lue ; `breakdowns` ajoute la répartition par contrat
+    (`by_contract`) et par mois d'import (`by_month`).
+    """
+    conn = _connect(readonly=True)
+    try:
+        stats = _dashboard_counter(conn.execute(
+            "SELECT * FROM dashboard_counters WHERE scope = 'global' AND key = ''"
+        ).fetchone())
+        if breakdowns:
+            for scope, field, name in (("contract", "contract_id", "by_contract"), ("month", "month", "by_month")):
+                stats[name] = [
+                    dict({field: r["key"] or None}, **_dashboard_counter(r))
+                    for r in conn.execute(
+                        "SELECT * FROM dashboard_counters WHERE scope = ? ORDER BY key", (scope,)
+                    )
+                ]
+    finally:
+        conn.close()
+    return stats
+
+def rebuild_dashboard_counters() -> None:
+    """Recalcule les compteurs du tableau de bord depuis la table reports."""
+    with write_transaction() as conn:
+        _rebuild_dashboard_counters(conn.cursor())
+
+def check_dashboard_counters() -> List[Dict]:
+    """Compare les compteurs à un recalcul complet ; retourne les écarts (vide si cohérent)."""
+    columns = ("reports_count", "total_fax", "total_errors", "rate_sum", "rate_count")
+    conn = _connect(readonly=True)
+    try:
+        expected = {(r["scope"], r["key"]): r for r in conn.execute(_dashboard_aggregates_sql())}
+        stored = {(r["scope"], r["key"]): r for r in conn.execute("SELECT * FROM dashboard_counters")}
+    finally:
+        conn.close()
+    mismatches = []
+    for scope_key in sorted(set(expected) | set(stored)):
+        want, have = expected.get(scope_key), stored.get(scope_key)
+        for column in columns:
+            a = want[column] if want is not None else 0
+            b = have[column] if have is not None else 0
+            if abs(a - b) > 1e-6:
+                mismatches.append({
+                    "scope": scope_key[0], "key": scope_key[1], "column": column,
+                    "expected": a, "stored": b,
+                })
+    return mismatches
+
+TREND_GRANULARITIES = {
+    "day": "day",
+    "week": "date(day, 'weekday 0', '-6 days')",  # lundi de la semaine
+    "month": "substr(day, 1, 7)",
+    "year": "substr(day, 1, 4)",
+}
+
+def get_trends(
+    contract: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    granularity: str = "month",
+) -> List[Dict]:
+    """Série temporelle (volumes, pages, taux d'erreur, mix SDA/téléphone).
+
+    Lue dans report_daily_rollups (index (contract_id, day)), jamais dans
+    les entrées. `contract` None = tous les contrats ; dates AAAA-MM-JJ
+    incluses. Lève ValueError si la granularité ou une date est invalide.
+    """
+    period_sql = TREND_GRANULARITIES.get(granularity)
+    if period_sql is None:
+        raise ValueError(f"Granularité invalide: {granularity!r} ({', '.join(TREND_GRANULARITIES)})")
+    where: List[str] = []
+    params: List = []
+    if contract is not None:
+        where.append("contract_id = ?")
+        params.append(_contract_key(contract))
+    for value, op, label in ((date_from, ">=", "date_from"), (date_to, "<=", "date_to")):
+        day = _catalog_date(value, label)
+        if day:
+            where.append(f"day {op} ?")
+            params.append(day)
+
+    conn = _connect(readonly=True)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT {period_sql} AS period, {", ".join(f"SUM({c}) AS {c}" for c in _ROLLUP_COLUMNS)}
+            FROM report_daily_rollups
+            {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY period
+            ORDER BY period
+            """,
+            tuple(params),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    series = []
+    for r in rows:
+        point = {"period": r["period"], **{c: int(r[c]) for c in _ROLLUP_COLUMNS}}
+        total = point["fax_total"] or 1
+        point["pages"] = point["pages_sf"] + point["pages_rf"]
+        point["error_rate"] = round(point["errors"] / total * 100, 2)
+        point["pct_sda"] = round((point["sda"] + point["sda_fax"]) / total * 100, 1)
+        point["pct_telephone"] = round(point["telephone"] / total * 100, 1)
+        series.append(point)
+    return series
+
 def _normalize_report_text_fields(report: Dict) -> Dict:
     for key in ("contract_id", "date_debut", "date_fin"):
         val = report.get(key)
@@ -363,76 +1828,114 @@ def _normalize_report_text_fields(report: Dict) -> Dict:
             report[key] = None
     return report
 
-def get_report_summary_by_id(report_id: str) -> Optional[Dict]:
-    """Retourne un rapport sans les entrées (rapide pour affichage/API).
+ENTRY_FETCH_SIZE = 1000
 
-    Ajoute aussi des stats dérivées SF/RF/pages réelles via agrégats SQL.
-    """
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM reports WHERE id = ?", (report_id,))
-    row = cur.fetchone()
-    if not row:
+def _archive_path(conn, report_id: str) -> Optional[str]:
+    """Archive des entrées du rapport, None s'il n'est pas archivé."""
+    row = conn.execute("SELECT archive_path FROM reports WHERE id = ?", (report_id,)).fetchone()
+    return row["archive_path"] if row else None
+
+def _report_archive_path(report_id: str) -> Optional[str]:
+    conn = _connect(readonly=True)
+    try:
+        return _archive_path(conn, report_id)
+    finally:
         conn.close()
-        return None
 
-    cur.execute(
-        """
-        SELECT type, COUNT(*) AS cnt, COALESCE(SUM(pages), 0) AS pages
-        FROM fax_entries
-        WHERE report_id = ?
-        GROUP BY type
-        """,
-        (report_id,),
-    )
-    agg = cur.fetchall()
+class LazyReport(dict):
+    """Rapport chargé sans ses entrées.
 
-    cur.execute(
-        "SELECT COUNT(*) AS total FROM fax_entries WHERE report_id = ?",
-        (report_id,),
-    )
-    entries_total = int(cur.fetchone()["total"])
+    Les champs d'en-tête et les agrégats sont lus à la construction (le
+    rapport se comporte comme le dict de `get_report_summary_by_id`) ;
+    les entrées ne sont lues que si on les parcourt, par lots `fetchmany`
+    (ou bloc par bloc dans l'archive d'un rapport archivé), sans jamais
+    matérialiser la liste complète.
+    """
 
-    conn.close()
+    database: Optional[Path] = None
 
-    report = dict(row)
-    _normalize_report_text_fields(report)
+    @property
+    def entries(self) -> Iterator[Dict]:
+        return self.iter_entries()
 
-    fax_sf = 0
-    fax_rf = 0
-    pages_sf = 0
-    pages_rf = 0
-    for r in agg:
-        t = (r["type"] or "").lower()
-        if t == "send":
-            fax_sf = int(r["cnt"])
-            pages_sf = int(r["pages"])
-        elif t == "receive":
-            fax_rf = int(r["cnt"])
-            pages_rf = int(r["pages"])
-
-    report["fax_sf"] = fax_sf
-    report["fax_rf"] = fax_rf
-    report["pages_reelles_sf"] = pages_sf
-    report["pages_reelles_rf"] = pages_rf
-    report["pages_reelles_totales"] = pages_sf + pages_rf
-    report["pages_envoyees"] = pages_sf
-    report["pages_recues"] = pages_rf
-    report["entries_total"] = entries_total
+    def iter_entries(self, batch_size: int = ENTRY_FETCH_SIZE) -> Iterator[Dict]:
+        """Entrées du rapport dans l'ordre d'insertion, lues par lots."""
+        if self.get("archive_path"):
+            from .archive import EntryArchive
 
-    if report.get("fax_envoyes") in (None, ""):
-        report["fax_envoyes"] = fax_sf
-    if report.get("fax_recus") in (None, ""):
-        report["fax_recus"] = fax_rf
-    if report.get("pages_totales") in (None, ""):
-        report["pages_totales"] = pages_sf + pages_rf
+            yield from EntryArchive(self["archive_path"]).iter_entries()
+            return
+        # Parcours éventuellement hors du contexte de get_report : base explicite.
+        conn = _connect(readonly=True, path=self.database)
+        try:
+            cur = conn.execute(
+                f"""
+                SELECT {ENTRY_SELECT}, e.datetime_ts AS datetime_ts
+                FROM {ENTRY_FROM}
+                WHERE e.report_key = {_REPORT_KEY_SQL}
+                ORDER BY e.id
+                """,
+                (self["id"],),
+            )
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                for r in rows:
+                    yield dict(r)
+        finally:
+            conn.close()
+
+@_on_report_database
+def get_report(report_id: str) -> Optional[LazyReport]:
+    """Retourne un rapport dont les entrées sont parcourues à la demande.
+
+    Ajoute aussi les stats dérivées SF/RF/pages réelles, lues dans
+    report_aggregates (les entrées ne sont pas parcourues).
+    """
+    conn = _connect(readonly=True)
+    try:
+        row = conn.execute(
+            "SELECT * FROM reports WHERE id = ? AND deleted_at IS NULL", (report_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
 
-    return report
+    report = LazyReport(row)
+    report.database = current_database_path()
+    _normalize_report_text_fields(report)
+    return _apply_report_aggregates(report, get_report_aggregates(report_id))
 
-def get_report_entries(
+def get_report_summary_by_id(report_id: str) -> Optional[Dict]:
+    """Retourne un rapport sans les entrées (rapide pour affichage/API)."""
+    return get_report(report_id)
+
+ENTRY_COLUMNS = (
+    "id, report_id, fax_id, utilisateur, type, "
+    "numero_original, numero_normalise, numero_type, numero_type_label, "
+    "valide, pages, datetime, erreurs"
+)
+
+def encode_entries_cursor(datetime_ts: Optional[int], rowid: int) -> str:
+    """Encode la position (datetime_ts, rowid) d'une entrée en jeton opaque."""
+    raw = json.dumps([datetime_ts, rowid], separators=(",", ":")).encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_entries_cursor(token: str) -> Tuple[Optional[int], int]:
+    """Décode un jeton de `encode_entries_cursor` ; ValueError s'il est invalide."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        ts, rowid = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Curseur invalide: {token!r}") from e
+    if (ts is not None and not isinstance(ts, int)) or not isinstance(rowid, int):
+        raise ValueError(f"Curseur invalide: {token!r}")
+    return ts, rowid
+
+def _entries_filters_sql(
     report_id: str,
-    offset: int = 0,
-    limit: int = 200,
     *,
     entry_type: Optional[str] = None,
     valide: Optional[int] = None,
@@ -441,52 +1944,43 @@ def get_report_entries(
     date_to: Optional[str] = None,
     pages_min: Optional[int] = None,
     pages_max: Optional[int] = None,
-    order: str = "asc",
-) -> Tuple[List[Dict], int]:
-    """Retourne une page d'entrées + le total filtré d'entrées pour un rapport.
-
-    Filtres (optionnels):
-    - entry_type: "send" | "receive"
-    - valide: 1 | 0
-    - q: recherche sur utilisateur + numéros
-    """
-    offset = max(0, int(offset))
-    limit = max(1, min(2000, int(limit)))
-
-    where = ["report_id = ?"]
+) -> Tuple[List[str], List]:
+    where = [f"e.report_key = {_REPORT_KEY_SQL}"]
     params: List = [report_id]
 
     if entry_type:
-        where.append("LOWER(type) = LOWER(?)")
+        where.append("e.type_code IN (SELECT id FROM entry_types WHERE name = ? COLLATE NOCASE)")
         params.append(entry_type)
 
     if valide in (0, 1):
-        where.append("valide = ?")
+        where.append("e.valide = ?")
         params.append(int(valide))
 
+    q = (q or "").strip()
     if q:
-        q_like = f"%{q.strip()}%"
-        where.append(
-            "(utilisateur LIKE ? COLLATE NOCASE OR numero_normalise LIKE ? COLLATE NOCASE OR numero_original LIKE ? COLLATE NOCASE)"
-        )
-        params.extend([q_like, q_like, q_like])
+        # La recherche part des index des dictionnaires : "+e.report_key"
+        # empêche le planificateur de parcourir tout le rapport.
+        where[0] = f"+e.report_key = {_REPORT_KEY_SQL}"
+        search_sql, search_params = _entries_search_sql(report_id, q)
+        where.append(search_sql)
+        params.extend(search_params)
 
     if date_from:
         start_ts, _ = _date_str_to_range(date_from)
         if start_ts is not None:
-            where.append("datetime_ts >= ?")
+            where.append("e.datetime_ts >= ?")
             params.append(start_ts)
 
     if date_to:
         _, end_exclusive = _date_str_to_range(date_to)
         if end_exclusive is not None:
-            where.append("datetime_ts < ?")
+            where.append("e.datetime_ts < ?")
             params.append(end_exclusive)
 
     if pages_min is not None:
         try:
             pmin = int(pages_min)
-            where.append("pages >= ?")
+            where.append("e.pages >= ?")
             params.append(pmin)
         except Exception:
             pass
@@ -494,104 +1988,703 @@ def get_report_entries(
     if pages_max is not None:
         try:
             pmax = int(pages_max)
-            where.append("pages <= ?")
+            where.append("e.pages <= ?")
             params.append(pmax)
         except Exception:
             pass
 
-    where_sql = " AND ".join(where)
+    return where, params
 
-    order_dir = "ASC" if str(order).lower() != "desc" else "DESC"
-    order_sql = f"ORDER BY COALESCE(datetime_ts, 0) {order_dir}, datetime {order_dir}"
+def _entries_search_sql(report_id: str, q: str) -> Tuple[str, List]:
+    """Recherche sur utilisateur + numéros, résolue dans les dictionnaires.
 
-    conn = _connect()
-    cur = conn.cursor()
+    Les valeurs correspondantes sont cherchées dans les dictionnaires (FTS5
+    trigram, LIKE pour moins de 3 caractères), puis les entrées par les index
+    (user_id, report_key) et (number_id, report_key). Un numéro d'origine
+    passe par son numéro normalisé, en écartant les autres écritures de ce
+    numéro.
+    """
+    if len(q) >= ENTRIES_FTS_MIN_QUERY and _dictionary_fts_enabled():
+        def match(d: _Dictionary) -> Tuple[str, str]:
+            return f"SELECT rowid FROM {d.fts} WHERE {d.fts} MATCH ?", _fts_phrase(q)
+    else:
+        def match(d: _Dictionary) -> Tuple[str, str]:
+            return f"SELECT id FROM {d.table} WHERE {d.column} LIKE ? COLLATE NOCASE", f"%{q}%"
+    users, u = match(_ENTRY_USERS)
+    numbers, n = match(_NUMBERS)
+    originals, o = match(_NUMBER_ORIGINALS)
+    sql = f"""e.id IN (
+        SELECT id FROM entries WHERE report_key = {_REPORT_KEY_SQL} AND user_id IN ({users})
+        UNION ALL
+        SELECT id FROM entries
+        WHERE report_key = {_REPORT_KEY_SQL}
+          AND number_id IN ({numbers} UNION SELECT number_id FROM number_originals WHERE id IN ({originals}))
+          AND (number_id IN ({numbers}) OR original_id IN ({originals}))
+    )"""
+    return sql, [report_id, u, report_id, n, o, n, o]
+
+def _entries_order_sql(order: str) -> Tuple[bool, str]:
+    # Tri sur (datetime_ts, id) : suit l'index (report_key, datetime_ts),
+    # dont chaque clé porte déjà le rowid. NULL en tête en ASC, en fin en DESC.
+    desc = str(order).lower() == "desc"
+    order_dir = "DESC" if desc else "ASC"
+    return desc, f"ORDER BY e.datetime_ts {order_dir}, e.id {order_dir}"
+
+def _entries_after_cursor_segments(
+    cursor: Optional[Tuple[Optional[int], int]], desc: bool,
+) -> List[Tuple[Optional[str], List]]:
+    """Conditions successives couvrant les entrées situées après `cursor`.
+
+    Chaque segment est une plage de l'index ; les lignes à datetime_ts NULL
+    forment un segment à part, pour ne pas mettre d'OR dans la recherche.
+    """
+    if cursor is None:
+        return [(None, [])]
+    ts, rowid = cursor
+    if not desc:
+        if ts is None:
+            return [("e.datetime_ts IS NULL AND e.id > ?", [rowid]), ("e.datetime_ts IS NOT NULL", [])]
+        return [("(e.datetime_ts, e.id) > (?, ?)", [ts, rowid])]
+    if ts is None:
+        return [("e.datetime_ts IS NULL AND e.id < ?", [rowid])]
+    return [("(e.datetime_ts, e.id) < (?, ?)", [ts, rowid]), ("e.datetime_ts IS NULL", [])]
+
+@_on_report_database
+def get_report_entries(
+    report_id: str,
+    offset: int = 0,
+    limit: int = 200,
+    *,
+    entry_type: Optional[str] = None,
+    valide: Optional[int] = None,
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    pages_min: Optional[int] = None,
+    pages_max: Optional[int] = None,
+    order: str = "asc",
+    approximate: bool = False,
+) -> Tuple[List[Dict], int, bool]:
+    """Retourne une page d'entrées, le total filtré d'entrées du rapport et
+    s'il est exact.
 
-    cur.execute(
-        f"""
-        SELECT id, report_id, fax_id, utilisateur, type,
-               numero_original, numero_normalise, valide, pages, datetime, erreurs,
-               COUNT(*) OVER() AS total_count
-        FROM fax_entries
-        WHERE {where_sql}
-        {order_sql}
-        LIMIT ? OFFSET ?
-        """,
-        tuple(params + [limit, offset]),
+    Filtres (optionnels):
+    - entry_type: "send" | "receive"
+    - valide: 1 | 0
+    - q: recherche sur utilisateur + numéros
+
+    Le total vient de `get_entry_count` (cache, estimation si `approximate`) :
+    l'appelant n'a pas à le redemander.
+
+    Pagination par OFFSET : réservée aux sauts de page, les parcours suivis
+    passent par `get_report_entries_page` (curseur).
+    """
+    offset = max(0, int(offset))
+    limit = max(1, min(2000, int(limit)))
+    filters = dict(
+        entry_type=entry_type, valide=valide, q=q, date_from=date_from,
+        date_to=date_to, pages_min=pages_min, pages_max=pages_max,
     )
-    fetched = cur.fetchall()
-    if fetched:
-        total = int(fetched[0]["total_count"])
-        rows = [dict(r) for r in fetched]
-        for r in rows:
-            r.pop("total_count", None)
-        conn.close()
-        return rows, total
 
-    cur.execute(
-        f"SELECT COUNT(*) AS total FROM fax_entries WHERE {where_sql}",
-        tuple(params),
+    archive_path = _report_archive_path(report_id)
+    if archive_path:
+        from .archive import archived_entries_slice
+
+        rows = archived_entries_slice(archive_path, offset, limit, order, **filters)
+        return (rows, *get_entry_count(report_id, approximate=approximate, **filters))
+
+    where, params = _entries_filters_sql(
+        report_id, entry_type=entry_type, valide=valide, q=q, date_from=date_from,
+        date_to=date_to, pages_min=pages_min, pages_max=pages_max,
     )
-    total = int(cur.fetchone()["total"])
-    conn.close()
-    return [], total
+    where_sql = " AND ".join(where)
+    _, order_sql = _entries_order_sql(order)
 
-def delete_report(report_id: str) -> None:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM fax_entries WHERE report_id = ?", (report_id,))
-    cur.execute("DELETE FROM reports WHERE id = ?", (report_id,))
-    conn.commit()
-    conn.close()
+    conn = _connect(readonly=True)
+    try:
+        rows = [
+            dict(r) for r in conn.execute(
+                f"""
+                SELECT {ENTRY_SELECT}
+                FROM {ENTRY_FROM}
+                WHERE {where_sql}
+                {order_sql}
+                LIMIT ? OFFSET ?
+                """,
+                tuple(params + [limit, offset]),
+            )
+        ]
+    finally:
+        conn.close()
+    return (rows, *get_entry_count(report_id, approximate=approximate, **filters))
+
+@_on_report_database
+def count_report_entries(report_id: str, **filters) -> int:
+    """Nombre exact d'entrées d'un rapport correspondant aux filtres (sans cache)."""
+    archive_path = _report_archive_path(report_id)
+    if archive_path:
+        from .archive import count_archived_entries
+
+        return count_archived_entries(archive_path, **filters)
+    where, params = _entries_filters_sql(report_id, **filters)
+    conn = _connect(readonly=True)
+    try:
+        row = conn.execute(
+            f"SELECT COUNT(*) AS total FROM entries e WHERE {' AND '.join(where)}",
+            tuple(params),
+        ).fetchone()
+    finally:
+        conn.close()
+    return int(row["total"])
 
-def get_report_by_id(report_id: str) -> Optional[Dict]:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM reports WHERE id = ?", (report_id,))
-    row = cur.fetchone()
-    if not row:
+ENTRY_COUNT_SAMPLE_SIZE = 20000
+
+class EntryCountCache:
+    """Totaux filtrés par (rapport, filtres), LRU, invalidés par rapport.
+
+    Chaque rapport a une génération : un comptage lancé avant une
+    invalidation n'est pas mis en cache s'il se termine après.
+    """
+
+    def __init__(self, max_size: int = settings.entry_count_cache_size):
+        self.max_size = max(1, max_size)
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[Tuple, Tuple[int, bool]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._pending: set = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="entry-count")
+
+    @staticmethod
+    def key(report_id: str, filters: Dict) -> Tuple:
+        return (report_id,) + tuple(sorted((k, v) for k, v in filters.items() if v not in (None, "")))
+
+    def get(self, key: Tuple) -> Optional[Tuple[int, bool]]:
+        """Retourne (total, exact) ou None."""
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None:
+                self._counts.move_to_end(key)
+            return entry
+
+    def generation(self, report_id: str) -> int:
+        with self._lock:
+            return self._generations.get(report_id, 0)
+
+    def put(self, key: Tuple, count: int, generation: int, exact: bool = True) -> None:
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            previous = self._counts.get(key)
+            if not exact and previous is not None and previous[1]:
+                return
+            self._counts[key] = (count, exact)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+    def invalidate(self, report_ids: Optional[List[str]] = None) -> None:
+        """Oublie les totaux des rapports donnés (tous si None)."""
+        with self._lock:
+            if report_ids is None:
+                targets = {k[0] for k in self._counts} | set(self._generations)
+            else:
+                targets = set(report_ids)
+            for report_id in targets:
+                self._generations[report_id] = self._generations.get(report_id, 0) + 1
+            for key in [k for k in self._counts if k[0] in targets]:
+                del self._counts[key]
+
+    def schedule(self, key: Tuple, count_fn: Callable[[], int]) -> None:
+        """Lance le comptage exact en arrière-plan (une fois par clé)."""
+        generation = self.generation(key[0])
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+
+        def run() -> None:
+            try:
+                self.put(key, count_fn(), generation)
+            except Exception as e:
+                logger.warning("Comptage des entrées échoué (%s): %s", key[0], e)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        self._executor.submit(run)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached": len(self._counts), "pending": len(self._pending)}
+
+_entry_counts = EntryCountCache()
+
+def invalidate_entry_counts(report_ids: Optional[List[str]] = None) -> None:
+    _entry_counts.invalidate(report_ids)
+
+def entry_count_stats() -> Dict[str, int]:
+    return _entry_counts.stats()
+
+@_on_report_database
+def _estimate_entry_count(report_id: str, report_total: int, **filters) -> int:
+    """Estime le total filtré sur un échantillon régulier (1 rowid sur k) du rapport."""
+    where, params = _entries_filters_sql(report_id, **filters)
+    predicate = " AND ".join(where[1:]) or "1"
+    stride = max(1, report_total // ENTRY_COUNT_SAMPLE_SIZE)
+    conn = _connect(readonly=True)
+    try:
+        # L'index (report_key, datetime_ts) ne trie pas selon un filtre : le
+        # planificateur ne peut pas choisir un index qui biaise l'échantillon.
+        row = conn.execute(
+            f"""
+            SELECT COUNT(*) AS sampled, COALESCE(SUM({predicate}), 0) AS matched
+            FROM entries e INDEXED BY idx_entries_report_ts
+            WHERE e.report_key = {_REPORT_KEY_SQL} AND e.id % ? = 0
+            """,
+            tuple(params[1:] + [report_id, stride]),
+        ).fetchone()
+    finally:
         conn.close()
-        return None
-    cur.execute("SELECT * FROM fax_entries WHERE report_id = ?", (report_id,))
-    entries = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    report = dict(row)
+    sampled = int(row["sampled"])
+    if sampled == 0:
+        return 0
+    return int(round(report_total * int(row["matched"]) / sampled))
+
+@_on_report_database
+def get_entry_count(report_id: str, *, approximate: bool = False, **filters) -> Tuple[int, bool]:
+    """Total filtré des entrées d'un rapport, mis en cache ; retourne (total, exact).
+
+    Sans filtre, le total vient de la table d'agrégats. Avec `approximate`,
+    un rapport de plus de `Settings.entry_count_exact_threshold` entrées
+    reçoit une estimation (exact=False) pendant que le comptage exact tourne
+    en arrière-plan ; les appels suivants obtiennent le total exact.
+    """
+    key = EntryCountCache.key(report_id, filters)
+    cached = _entry_counts.get(key)
+    if cached is not None and (cached[1] or approximate):
+        return cached
+
+    generation = _entry_counts.generation(report_id)
+    if len(key) == 1:
+        count = sum(get_report_numero_types(report_id).values())
+        _entry_counts.put(key, count, generation)
+        return count, True
+
+    if approximate and not _report_archive_path(report_id):
+        report_total, _ = get_entry_count(report_id)
+        if report_total > settings.entry_count_exact_threshold:
+            estimate = _estimate_entry_count(report_id, report_total, **filters)
+            _entry_counts.put(key, estimate, generation, exact=False)
+            _entry_counts.schedule(key, lambda: count_report_entries(report_id, **filters))
+            return estimate, False
+
+    count = count_report_entries(report_id, **filters)
+    _entry_counts.put(key, count, generation)
+    return count, True
+
+@_on_report_database
+def get_report_entries_page(
+    report_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 200,
+    *,
+    order: str = "asc",
+    **filters,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Retourne une page d'entrées après `cursor` + le curseur de la page suivante.
 
-    report["entries"] = entries
-    report["fax_entries"] = entries
+    Mêmes filtres que `get_report_entries`. Le coût d'une page ne dépend pas
+    de sa profondeur. Le curseur suivant vaut None en fin de liste.
+    Lève ValueError si le curseur est invalide.
+    """
+    limit = max(1, min(2000, int(limit)))
+    position = decode_entries_cursor(cursor) if cursor else None
+    archive_path = _report_archive_path(report_id)
+    if archive_path:
+        from .archive import archived_entries_page
 
-    _normalize_report_text_fields(report)
+        rows, last = archived_entries_page(archive_path, position, limit, order, **filters)
+        return rows, (encode_entries_cursor(*last) if last else None)
+
+    where, params = _entries_filters_sql(report_id, **filters)
+    desc, order_sql = _entries_order_sql(order)
+    segments = _entries_after_cursor_segments(position, desc)
+
+    fetched: List[sqlite3.Row] = []
+    conn = _connect(readonly=True)
+    try:
+        for segment_sql, segment_params in segments:
+            where_sql = " AND ".join(where + ([segment_sql] if segment_sql else []))
+            fetched.extend(conn.execute(
+                f"""
+                SELECT e.id AS _rowid, e.datetime_ts AS _ts, {ENTRY_SELECT}
+                FROM {ENTRY_FROM}
+                WHERE {where_sql}
+                {order_sql}
+                LIMIT ?
+                """,
+                tuple(params + segment_params + [limit + 1 - len(fetched)]),
+            ).fetchall())
+            if len(fetched) > limit:
+                break
+    finally:
+        conn.close()
 
-    pages_sf = 0
-    pages_rf = 0
-    fax_sf = 0
-    fax_rf = 0
-    for e in entries:
-        t = (e.get("type") or "").lower()
-        pages = e.get("pages") or 0
+    has_more = len(fetched) > limit
+    fetched = fetched[:limit]
+    next_cursor = None
+    if has_more:
+        last = fetched[-1]
+        next_cursor = encode_entries_cursor(last["_ts"], last["_rowid"])
+    rows = []
+    for r in fetched:
+        row = dict(r)
+        del row["_rowid"], row["_ts"]
+        rows.append(row)
+    return rows, next_cursor
+
+def iter_report_entries(report_id: str, page_size: int = 2000, **filters) -> Iterator[Dict]:
+    """Parcourt toutes les entrées filtrées d'un rapport, page par page (curseur)."""
+    cursor = None
+    while True:
+        rows, cursor = get_report_entries_page(report_id, cursor, page_size, **filters)
+        yield from rows
+        if cursor is None:
+            return
+
+def get_number(numero_normalise: str) -> Optional[Dict]:
+    """Fiche d'un numéro : classification, tonalité, apparitions et rapports.
+
+    Les rapports qui contiennent le numéro sont lus dans l'index
+    (number_id, report_key), sans parcourir les entrées. Avec des bases par
+    contrat, chacune a sa dimension des numéros : la fiche vient de la
+    première base qui connaît le numéro, les rapports de toutes.
+    """
+    number: Optional[Dict] = None
+    for path in all_databases():
+        conn = _connect(readonly=True, path=path)
         try:
-            pages = int(pages)
-        except Exception:
-            pages = 0
+            row = conn.execute(
+                """
+                SELECT n.id, n.numero_normalise, nt.name AS numero_type, nt.label AS numero_type_label,
+                       n.tone, n.tone_is_fax, n.tone_detected_at, n.first_seen_ts, n.last_seen_ts
+                FROM numbers n
+                LEFT JOIN numero_types nt ON nt.id = n.numero_type_code
+                WHERE n.numero_normalise = ?
+                """,
+                (numero_normalise,),
+            ).fetchone()
+            if row is None:
+                continue
+            reports = conn.execute(
+                """
+                SELECT k.report_id, c.entries
+                FROM (
+                    SELECT report_key, COUNT(*) AS entries FROM entries
+                    WHERE number_id = ? GROUP BY report_key
+                ) AS c
+                JOIN report_keys k ON k.id = c.report_key
+                JOIN reports r ON r.id = k.report_id AND r.deleted_at IS NULL
+                ORDER BY c.report_key
+                """,
+                (row["id"],),
+            ).fetchall()
+        finally:
+            conn.close()
+        if number is None:
+            number = dict(row)
+            del number["id"]
+            number["reports"] = []
+        else:
+            for bound, pick in (("first_seen_ts", min), ("last_seen_ts", max)):
+                values = [v for v in (number[bound], row[bound]) if v is not None]
+                number[bound] = pick(values) if values else None
+        number["reports"].extend(dict(r) for r in reports)
+    return number
+
+def _remove_report_file(path) -> None:
+    try:
+        Path(path).unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning("Fichier du rapport non supprimé (%s): %s", path, e)
+
+def reclaim_free_pages(max_pages: int = 0) -> int:
+    """Rend au système les pages libres de la base ; retourne leur nombre.
 
-        if t == "send":
-            fax_sf += 1
-            pages_sf += pages
-        elif t == "receive":
-            fax_rf += 1
-            pages_rf += pages
+    Sans effet si la base n'est pas en auto_vacuum INCREMENTAL : les pages
+    libérées restent alors dans le fichier et sont réutilisées par les
+    écritures suivantes. `max_pages` = 0 rend toutes les pages libres.
+    """
+    with write_transaction() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = min(before, int(max_pages)) if max_pages > 0 else before
+        # Le pragma rend une page par pas et, sans colonne de résultat, le
+        # module sqlite3 n'en fait qu'un par execute() ; executescript, lui,
+        # validerait la transaction en cours.
+        for _ in range(pages):
+            conn.execute("PRAGMA incremental_vacuum(1)")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return before - after
+
+PURGE_VACUUM_PAGES = 2000
+
+@_on_report_database
+def delete_report(report_id: str) -> bool:
+    """Supprime un rapport ; retourne False s'il est introuvable.
+
+    Le rapport disparaît immédiatement des lectures, du catalogue, du tableau
+    de bord et des tendances ; ses entrées et ses fichiers sont purgés en
+    arrière-plan par lots (voir `purge_deleted_reports`), sans tenir le
+    verrou d'écriture plus d'un lot.
+    """
+    if not _mark_deleted(report_id):
+        return False
+    start_report_purge()
+    return True
 
-    report["fax_sf"] = fax_sf
-    report["fax_rf"] = fax_rf
+def _mark_deleted(report_id: str) -> bool:
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        row = cur.execute(
+            "SELECT 1 FROM reports WHERE id = ? AND deleted_at IS NULL", (report_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        _update_dashboard_counters(cur, report_id, -1)
+        cur.execute("DELETE FROM report_daily_rollups WHERE report_id = ?", (report_id,))
+        cur.execute(
+            "UPDATE reports SET deleted_at = ? WHERE id = ?",
+            (datetime.now(timezone.utc).isoformat(), report_id),
+        )
+    invalidate_entry_counts([report_id])
+    invalidate_report_catalog()
+    _sync_catalog(report_id)
+    _count_purge(pending=1)
+    return True
+
+def _report_artifacts(report: sqlite3.Row) -> List[Path]:
+    """Fichiers produits pour un rapport : JSON, QR code, archive des entrées."""
+    paths = [
+        settings.reports_dir / f"{report['id']}.json",
+        settings.reports_qr_dir / f"{report['id']}.png",
+    ]
+    for column in ("qr_path", "archive_path"):
+        if report[column]:
+            paths.append(Path(report[column]))
+    return list(dict.fromkeys(paths))
+
+def _purge_report(report_id: str, keep_files: bool = False) -> bool:
+    """Purge un rapport marqué supprimé ; False s'il a été réimporté entre-temps.
+
+    Entrées supprimées par lots (une transaction par lot, pause entre deux),
+    puis les lignes du rapport, ses fichiers (sauf JSON et QR si
+    `keep_files`) et les pages libérées.
+    """
+    batch_size = settings.db_backfill_batch_size
+    while True:
+        with write_transaction() as conn:
+            cur = conn.cursor()
+            marked = cur.execute(
+                "SELECT 1 FROM reports WHERE id = ? AND deleted_at IS NOT NULL", (report_id,)
+            ).fetchone()
+            if marked is None:
+                return False
+            deleted = cur.execute(
+                f"""
+                DELETE FROM entries WHERE id IN (
+                    SELECT id FROM entries WHERE report_key = {_REPORT_KEY_SQL} LIMIT ?
+                )
+                """,
+                (report_id, batch_size),
+            ).rowcount
+        if deleted < batch_size:
+            break
+        reclaim_free_pages(PURGE_VACUUM_PAGES)
+        time.sleep(settings.db_backfill_pause_ms / 1000)
 
-    report["fax_envoyes"] = report.get("fax_envoyes", fax_sf)
-    report["fax_recus"] = report.get("fax_recus", fax_rf)
+    with write_transaction() as conn:
+        cur = conn.cursor()
+        report = cur.execute(
+            "SELECT id, qr_path, archive_path FROM reports WHERE id = ? AND deleted_at IS NOT NULL",
+            (report_id,),
+        ).fetchone()
+        if report is None:
+            return False
+        cur.execute("DELETE FROM report_keys WHERE report_id = ?", (report_id,))
+        cur.execute("DELETE FROM report_numero_types WHERE report_id = ?", (report_id,))
+        cur.execute("DELETE FROM report_aggregates WHERE report_id = ?", (report_id,))
+        cur.execute("DELETE FROM report_daily_rollups WHERE report_id = ?", (report_id,))
+        cur.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+    _sync_catalog(report_id)
+    for path in _report_artifacts(report):
+        if keep_files and path.suffix != ".zip":
+            continue
+        _remove_report_file(path)
+    while reclaim_free_pages(PURGE_VACUUM_PAGES):
+        time.sleep(settings.db_backfill_pause_ms / 1000)
+    logger.info("Rapport supprimé purgé: %s", report_id)
+    return True
+
+def _pending_purges() -> List[str]:
+    conn = _connect(readonly=True)
+    try:
+        rows = conn.execute(
+            "SELECT id FROM reports WHERE deleted_at IS NOT NULL ORDER BY deleted_at"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [r["id"] for r in rows]
 
-    report["pages_reelles_sf"] = pages_sf
-    report["pages_reelles_rf"] = pages_rf
-    report["pages_reelles_totales"] = pages_sf + pages_rf
+def _detached_keys() -> List[int]:
+    conn = _connect(readonly=True)
+    try:
+        rows = conn.execute(
+            "SELECT id FROM report_keys WHERE instr(report_id, char(31) || 'detached:') > 0 ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [r["id"] for r in rows]
 
-    report["pages_envoyees"] = pages_sf
-    report["pages_recues"] = pages_rf
+def _purge_detached_key(key: int) -> None:
+    """Supprime par lots les entrées d'une clé détachée, puis la clé."""
+    batch_size = settings.db_backfill_batch_size
+    while True:
+        with write_transaction() as conn:
+            deleted = conn.execute(
+                "DELETE FROM entries WHERE id IN (SELECT id FROM entries WHERE report_key = ? LIMIT ?)",
+                (key, batch_size),
+            ).rowcount
+            if deleted < batch_size:
+                conn.execute("DELETE FROM report_keys WHERE id = ?", (key,))
+                break
+        reclaim_free_pages(PURGE_VACUUM_PAGES)
+        time.sleep(settings.db_backfill_pause_ms / 1000)
+    reclaim_free_pages(PURGE_VACUUM_PAGES)
+
+def detached_entry_keys() -> int:
+    """Versions d'entrées remplacées ou d'imports échoués restant à purger."""
+    count = 0
+    for path in all_databases():
+        with using_database(path):
+            count += len(_detached_keys())
+    return count
+
+# État de la purge tenu par les suppressions et le thread de purge : la
+# sonde de santé le lit sans ouvrir les bases.
+_purge_state = {"pending": 0, "purged": 0, "last_run_at": None}
+_purge_state_lock = threading.Lock()
+
+def _count_purge(pending: int = 0, purged: int = 0) -> None:
+    with _purge_state_lock:
+        _purge_state["pending"] = max(0, _purge_state["pending"] + pending - purged)
+        _purge_state["purged"] += purged
+
+def pending_report_purges() -> List[str]:
+    """Rapports marqués supprimés, toutes bases confondues."""
+    pending: List[str] = []
+    for path in all_databases():
+        with using_database(path):
+            pending.extend(_pending_purges())
+    with _purge_state_lock:
+        _purge_state["pending"] = len(pending)
+    return pending
+
+def purge_deleted_reports(interrupted_imports: bool = False) -> int:
+    """Purge les rapports marqués supprimés (thread courant) ; retourne leur nombre.
+
+    Purge aussi les entrées détachées (versions remplacées, imports échoués).
+    `interrupted_imports` y ajoute les imports coupés par un arrêt du
+    processus : à n'activer que sans import en cours (serveur arrêté).
+    """
+    purged = 0
+    pending_report_purges()
+    for path in all_databases():
+        with using_database(path):
+            if interrupted_imports:
+                with write_transaction() as conn:
+                    conn.execute(
+                        """
+                        UPDATE report_keys
+                        SET report_id = replace(report_id, char(31) || 'import:', char(31) || 'detached:')
+                        WHERE instr(report_id, char(31) || 'import:') > 0
+                        """
+                    )
+            for report_id in _pending_purges():
+                try:
+                    if _purge_report(report_id):
+                        purged += 1
+                        _count_purge(purged=1)
+                except sqlite3.Error as e:
+                    logger.warning("Purge du rapport %s interrompue (reprise plus tard): %s", report_id, e)
+            for key in _detached_keys():
+                try:
+                    _purge_detached_key(key)
+                except sqlite3.Error as e:
+                    logger.warning("Purge des entrées détachées %s interrompue: %s", key, e)
+    with _purge_state_lock:
+        _purge_state["last_run_at"] = datetime.now(timezone.utc).isoformat()
+    return purged
+
+_purge_wakeup = threading.Event()
+_purger: Optional[threading.Thread] = None
+_purger_lock = threading.Lock()
+
+def _purge_loop() -> None:
+    while True:
+        _purge_wakeup.wait()
+        _purge_wakeup.clear()
+        purge_deleted_reports()
+
+def start_report_purge() -> threading.Thread:
+    """Réveille le thread de purge (démarré au premier appel)."""
+    global _purger
+    with _purger_lock:
+        if _purger is None or not _purger.is_alive():
+            _purger = threading.Thread(target=_purge_loop, name="report-purge", daemon=True)
+            _purger.start()
+    _purge_wakeup.set()
+    return _purger
+
+def report_purge_stats() -> Dict:
+    with _purge_state_lock:
+        return dict(_purge_state)
+
+def vacuum_database() -> Dict[str, int]:
+    """Passe la base en auto_vacuum INCREMENTAL et la reconstruit (VACUUM).
+
+    Opération ponctuelle pour les bases créées avant ce réglage : elle
+    réécrit tout le fichier sous le verrou d'écriture et demande un accès
+    exclusif (serveur arrêté). Ensuite, les purges
+    rendent les pages libérées au fil de l'eau. Retourne la taille avant/après.
+    """
+    path = current_database_path()
+    checkpoint(mode="TRUNCATE")
+    before = path.stat().st_size
+    # Les connexions en lecture du thread empêcheraient la sortie du mode WAL.
+    close_thread_connections()
+    with write_transaction() as conn:
+        # En WAL, VACUUM ne change pas auto_vacuum : passage temporaire en journal classique.
+        conn.execute("PRAGMA journal_mode = DELETE")
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.execute("PRAGMA journal_mode = WAL")
+    return {"size_before": before, "size_after": path.stat().st_size}
 
-    return report
+def get_report_by_id(report_id: str) -> Optional[Dict]:
+    """Retourne un rapport avec toutes ses entrées en mémoire.
+
+    Réservé aux exports complets : les pages et les CLI passent par
+    `get_report`, qui lit les entrées à la demande.
+    """
+    report = get_report(report_id)
+    if report is None:
+        return None
+    entries = list(report.iter_entries())
+    full = dict(report)
+    full["entries"] = entries
+    full["fax_entries"] = entries
+    return full
@@ -0,0 +1,237 @@
+"""
+Migrations versionnées du schéma SQLite.
+
+Chaque composant (core, asterisk) déclare une liste ordonnée de `Migration`.
+La table schema_migrations garde les versions appliquées par composant :
+quand la base est à jour, `migrate()` ne coûte qu'une lecture (et rien du
+tout au second appel dans le même processus).
+
+Les rattrapages longs (backfills) ne tournent pas dans la migration : elle
+les enregistre dans schema_backfills avec une borne haute, et
+`start_backfills()` les exécute en arrière-plan par lots, chaque lot
+commitant sa position. Un processus arrêté reprend au dernier lot commité.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .connection import current_database_path, get_connection, write_transaction
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Cursor], None]
+
+@dataclass(frozen=True)
+class Backfill:
+    """Rattrapage par lots : `step(cur, position, upper, batch_size)` traite les
+    lignes après `position` (jusqu'à `upper`) et retourne la nouvelle position."""
+    name: str
+    step: Callable[[sqlite3.Cursor, int, int, int], int]
+
+_BACKFILLS: Dict[str, Backfill] = {}
+_applied: Dict[Tuple[str, str], int] = {}
+_applied_lock = threading.Lock()
+_runner: Optional[threading.Thread] = None
+_runner_lock = threading.Lock()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _ensure_tables(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            component TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL,
+            PRIMARY KEY (component, version)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL DEFAULT 0,
+            upper_bound INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        """
+    )
+
+def column_exists(cur: sqlite3.Cursor, table: str, column: str) -> bool:
+    return any(r[1] == column for r in cur.execute(f"PRAGMA table_info({table})"))
+
+def add_column(cur: sqlite3.Cursor, table: str, column: str, decl: str) -> None:
+    """ALTER TABLE ADD COLUMN, sans effet si la colonne existe déjà."""
+    if not column_exists(cur, table, column):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def schema_version(component: str) -> int:
+    """Dernière version appliquée d'un composant (0 si base vierge)."""
+    conn = get_connection(readonly=True)
+    try:
+        row = conn.execute(
+            "SELECT MAX(version) FROM schema_migrations WHERE component = ?",
+            (component,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+    return int(row[0] or 0)
+
+def migrate(component: str, migrations: Sequence[Migration]) -> int:
+    """Applique les migrations manquantes d'un composant ; retourne la version."""
+    latest = max((m.version for m in migrations), default=0)
+    # Versions connues par base : chaque base par contrat a les siennes.
+    key = (component, str(current_database_path()))
+    with _applied_lock:
+        if _applied.get(key, -1) >= latest:
+            return _applied[key]
+
+    current = schema_version(component)
+    if current < latest:
+        with write_transaction() as conn:
+            _ensure_tables(conn.cursor())
+        for migration in sorted(migrations, key=lambda m: m.version):
+            with write_transaction() as conn:
+                # BEGIN explicite : sqlite3 n'en ouvre pas avant un CREATE ou un
+                # ALTER, qu'une migration en échec laisserait sinon validés.
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                cur = conn.cursor()
+                # Relu sous le verrou : un autre thread a pu migrer entre-temps.
+                cur.execute(
+                    "SELECT 1 FROM schema_migrations WHERE component = ? AND version = ?",
+                    (component, migration.version),
+                )
+                if cur.fetchone() is not None:
+                    continue
+                migration.apply(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (component, version, name, applied_at) VALUES (?, ?, ?, ?)",
+                    (component, migration.version, migration.name, _now()),
+                )
+            logger.info("Migration %s %d appliquée: %s", component, migration.version, migration.name)
+        current = latest
+
+    with _applied_lock:
+        _applied[key] = current
+    return current
+
+def register_backfill(name: str, step: Callable[[sqlite3.Cursor, int, int, int], int]) -> None:
+    _BACKFILLS[name] = Backfill(name, step)
+
+def enqueue_backfill(cur: sqlite3.Cursor, name: str, upper_bound: int) -> None:
+    """Planifie un rattrapage (à appeler depuis une migration)."""
+    if upper_bound <= 0:
+        return
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO schema_backfills (name, position, upper_bound, done, updated_at)
+        VALUES (?, 0, ?, 0, ?)
+        """,
+        (name, int(upper_bound), _now()),
+    )
+
+def pending_backfills() -> List[Dict]:
+    conn = get_connection(readonly=True)
+    try:
+        rows = conn.execute(
+            "SELECT name, position, upper_bound FROM schema_backfills WHERE done = 0 ORDER BY name"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+def backfill_pending(name: str) -> bool:
+    conn = get_connection(readonly=True)
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM schema_backfills WHERE name = ? AND done = 0", (name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+    return row is not None
+
+def run_backfill_batch(name: str, batch_size: int = settings.db_backfill_batch_size) -> bool:
+    """Exécute un lot d'un rattrapage ; retourne True quand il est terminé."""
+    backfill = _BACKFILLS.get(name)
+    if backfill is None:
+        return True
+    with write_transaction() as conn:
+        # Position relue sous le verrou de la base (autre processus compris).
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        cur = conn.cursor()
+        row = cur.execute(
+            "SELECT position, upper_bound, done FROM schema_backfills WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None or row["done"]:
+            return True
+        position = backfill.step(cur, int(row["position"]), int(row["upper_bound"]), batch_size)
+        done = position >= int(row["upper_bound"])
+        cur.execute(
+            "UPDATE schema_backfills SET position = ?, done = ?, updated_at = ? WHERE name = ?",
+            (position, 1 if done else 0, _now(), name),
+        )
+    if done:
+        logger.info("Rattrapage terminé: %s", name)
+    return done
+
+def run_backfills() -> None:
+    """Exécute jusqu'au bout les rattrapages en attente (thread courant).
+
+    Par ordre de nom ; la liste est relue après chacun, un rattrapage
+    pouvant en replanifier un autre en se terminant.
+    """
+    stop = threading.Event()
+    skipped: set = set()
+    while True:
+        pending = [b for b in pending_backfills() if b["name"] not in skipped]
+        if not pending:
+            return
+        item = pending[0]
+        name = item["name"]
+        if name not in _BACKFILLS:
+            logger.warning("Rattrapage inconnu ignoré: %s", name)
+            skipped.add(name)
+            continue
+        logger.info("Rattrapage en arrière-plan: %s (%d/%d)", name, item["position"], item["upper_bound"])
+        try:
+            while not run_backfill_batch(name):
+                # Laisse passer les autres écrivains entre deux lots.
+                stop.wait(settings.db_backfill_pause_ms / 1000)
+        except sqlite3.Error as e:
+            logger.warning("Rattrapage %s interrompu (repris au prochain démarrage): %s", name, e)
+            skipped.add(name)
+
+def start_backfills() -> Optional[threading.Thread]:
+    """Lance les rattrapages en attente dans un thread de fond (une seule fois)."""
+    global _runner
+    if not pending_backfills():
+        return None
+    with _runner_lock:
+        if _runner is not None and _runner.is_alive():
+            return _runner
+        _runner = threading.Thread(target=run_backfills, name="schema-backfill", daemon=True)
+        _runner.start()
+        return _runner
@@ -25,6 +25,9 @@ class ReportEntries {
     this.total = null;
     this.page = 1;
     this.pageCount = 1;
+    // Curseurs connus par numéro de page (page suivante = curseur renvoyé).
+    this.cursors = new Map();
+    this._cursorKey = '';
 
     this.filters = {
       type: '',
@@ -196,10 +199,12 @@ class ReportEntries {
     this.filters.order = (this.orderSelect?.value || 'asc').trim() || 'asc';
   }
 
-  _buildQueryParams(offset) {
+  _buildQueryParams(offset, cursor) {
     const params = new URLSearchParams();
-    params.set('offset', String(offset));
+    if (cursor !== undefined) params.set('cursor', cursor);
+    else params.set('offset', String(offset));
     params.set('limit', String(this.limit));
+    params.set('approx', '1');
 
     if (this.filters.type) params.set('type', this.filters.type);
     if (this.filters.valide) params.set('valide', this.filters.valide);
@@ -325,10 +330,19 @@ class ReportEntries {
       this._updateUrl(target);
       const offset = (target - 1) * this.limit;
 
-      const url = `/api/report/${encodeURIComponent(this.reportId)}/entries?${this._buildQueryParams(offset)}`;
+      const cursorKey = JSON.stringify([this.filters, this.limit]);
+      if (cursorKey !== this._cursorKey) {
+        this.cursors.clear();
+        this._cursorKey = cursorKey;
+      }
+      const cursor = target === 1 ? '' : this.cursors.get(target);
+
+      const url = `/api/report/${encodeURIComponent(this.reportId)}/entries?${this._buildQueryParams(offset, cursor)}`;
       const data = await fetchJson(url, { signal: this._abortController.signal });
+      if (data.next_cursor) this.cursors.set(target + 1, data.next_cursor);
 
       this.total = data.total;
+      this.totalExact = data.total_exact !== false;
       this.pageCount = Math.max(1, Math.ceil((this.total || 0) / this.limit));
       this.page = Math.min(this.pageCount, target);
 
@@ -347,7 +361,7 @@ class ReportEntries {
       const from = (this.page - 1) * this.limit + (shown > 0 ? 1 : 0);
       const to = (this.page - 1) * this.limit + shown;
       this.renderFilterSummary();
-      this.setStatus(`Page ${this.page}/${this.pageCount} — lignes ${from}-${to} / ${this.total}`);
+      this.setStatus(`Page ${this.page}/${this.pageCount} — lignes ${from}-${to} / ${this.totalExact ? '' : '≈'}${this.total}`);
       this.renderPagination();
     } catch (e) {
       if (e?.name === 'AbortError') {
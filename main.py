@@ -3,13 +3,15 @@ from __future__ import annotations
 import argparse
 import json
 import logging
+import sqlite3
+import sys
+import textwrap
 from pathlib import Path
 
 from core import (
     analyze_data,
     generate_report,
-    get_all_reports,
-    get_report_by_id,
+    get_report,
     import_faxcloud_export,
     init_database,
     insert_report_to_db,
@@ -18,6 +20,7 @@ from core import (
     settings,
 )
 from core.config import configure_logging, ensure_directories
+from core.db import iter_reports
 
 
 def cmd_init(args: argparse.Namespace) -> None:
@@ -26,6 +29,128 @@ def cmd_init(args: argparse.Namespace) -> None:
     print("✓ Répertoires et base de données initialisés")
 
 
+def cmd_migrate(args: argparse.Namespace) -> None:
+    from core.asterisk import init_asterisk_tables
+    from core.audit import init_audit_tables
+    from core.migrations import pending_backfills, run_backfills, schema_version
+
+    ensure_directories()
+    init_database()
+    init_asterisk_tables()
+    init_audit_tables()
+    print(
+        f"✓ Schéma à jour (core v{schema_version('core')}, asterisk v{schema_version('asterisk')}, "
+        f"audit v{schema_version('audit')})"
+    )
+    pending = pending_backfills()
+    if not pending:
+        return
+    if args.no_backfill:
+        print(f"Rattrapages en attente (exécutés au démarrage du serveur): {', '.join(b['name'] for b in pending)}")
+        return
+    run_backfills()
+    print(f"✓ Rattrapages terminés: {', '.join(b['name'] for b in pending)}")
+
+
+def cmd_audit_archive(args: argparse.Namespace) -> None:
+    from core.audit import apply_audit_retention, init_audit_tables
+
+    ensure_directories()
+    init_database()
+    init_audit_tables()
+    archived = apply_audit_retention(args.months)
+    if not archived:
+        print("Aucune partition d'audit à archiver")
+    for item in archived:
+        print(f"✓ Audit {item['month']}: {item['rows']} événements → {item['archive_path']}")
+
+
+def cmd_archive(args: argparse.Namespace) -> None:
+    from core.archive import archive_old_reports, archive_report
+
+    init_database()
+    try:
+        archived = [archive_report(args.report)] if args.report else archive_old_reports(args.days, limit=args.limit)
+    except ValueError as e:
+        print(f"✗ {e}")
+        raise SystemExit(1)
+    if not archived:
+        print("Aucun rapport à archiver")
+    for item in archived:
+        print(
+            f"✓ {item['report_id']}: {item['entries']} entrées → {item['archive_path']} "
+            f"({item['archive_size'] // 1024} Ko, {item['pages_reclaimed']} pages rendues)"
+        )
+
+
+def cmd_vacuum(args: argparse.Namespace) -> None:
+    from core.db import purge_deleted_reports, vacuum_database
+
+    init_database()
+    purged = purge_deleted_reports(interrupted_imports=True)
+    if purged:
+        print(f"✓ {purged} rapport(s) supprimé(s) purgé(s)")
+    try:
+        sizes = vacuum_database()
+    except sqlite3.OperationalError as e:
+        print(f"✗ Compactage impossible (base utilisée par un autre processus ?): {e}")
+        raise SystemExit(1)
+    print(
+        f"✓ Base compactée (auto_vacuum incrémental): "
+        f"{sizes['size_before'] // 1024} Ko → {sizes['size_after'] // 1024} Ko"
+    )
+
+
+def cmd_rebuild_counters(args: argparse.Namespace) -> None:
+    from core.db import check_dashboard_counters, rebuild_dashboard_counters
+
+    init_database()
+    if args.check:
+        mismatches = check_dashboard_counters()
+        for m in mismatches:
+            print(f"✗ {m['scope']}[{m['key']}] {m['column']}: attendu {m['expected']}, stocké {m['stored']}")
+        if mismatches:
+            raise SystemExit(1)
+        print("✓ Compteurs du tableau de bord cohérents")
+        return
+    rebuild_dashboard_counters()
+    print("✓ Compteurs du tableau de bord recalculés")
+
+
+def cmd_analytics(args: argparse.Namespace) -> None:
+    from core.analytics import AnalyticsUnavailable, aggregate, query_mirror, sync_analytics
+
+    init_database()
+    try:
+        if args.action == "sync":
+            stats = sync_analytics(full=args.full)
+            print(
+                f"✓ Miroir analytique: {stats['reports_synced']} rapports synchronisés, "
+                f"{stats['entries_copied']} entrées copiées ({stats['duration_ms']} ms)"
+            )
+            return
+        if args.sql:
+            result = query_mirror(args.sql)
+        else:
+            result = aggregate(
+                [d for d in (args.by or "").split(",") if d],
+                [m for m in (args.metrics or "entries").split(",") if m],
+                contract=args.contract,
+                date_from=args.date_from,
+                date_to=args.date_to,
+                engine=args.engine,
+                limit=args.limit,
+            )
+    except (AnalyticsUnavailable, ValueError) as e:
+        print(f"✗ {e}")
+        raise SystemExit(1)
+    print(" | ".join(result["columns"]))
+    for row in result["rows"]:
+        print(" | ".join("" if v is None else str(v) for v in row.values()))
+    if "duration_ms" in result:
+        print(f"({len(result['rows'])} lignes, moteur {result['engine']}, {result['duration_ms']} ms)")
+
+
 def cmd_import(args: argparse.Namespace) -> None:
     ensure_directories()
     init_database()
@@ -49,17 +174,17 @@ def cmd_import(args: argparse.Namespace) -> None:
 
 def cmd_list(args: argparse.Namespace) -> None:
     init_database()
-    reports = get_all_reports()
-    if not reports:
-        print("Aucun rapport en base.")
-        return
-    for rpt in reports:
+    count = 0
+    for rpt in iter_reports(contract=args.contract):
+        count += 1
         print(
             f"{rpt['id']} | contrat={rpt['contract_id']} "
             f"période={rpt['date_debut']}->{rpt['date_fin']} "
             f"fax={rpt['total_fax']} erreurs={rpt['erreurs_totales']} "
             f"taux={rpt['taux_reussite']}%"
         )
+    if not count:
+        print("Aucun rapport en base.")
 
 
 def cmd_view(args: argparse.Namespace) -> None:
@@ -69,11 +194,17 @@ def cmd_view(args: argparse.Namespace) -> None:
         print(path.read_text(encoding="utf-8"))
         return
 
-    data = get_report_by_id(report_id)
-    if not data:
+    report = get_report(report_id)
+    if not report:
         print(f"Rapport introuvable: {report_id}")
         return
-    print(json.dumps(data, indent=2, ensure_ascii=False))
+    # En-tête puis entrées écrites au fil de la lecture (jamais toutes en mémoire).
+    header = json.dumps(dict(report), indent=2, ensure_ascii=False)
+    sys.stdout.write(header[:-2] + ',\n  "entries": [')
+    for i, entry in enumerate(report.iter_entries()):
+        body = textwrap.indent(json.dumps(entry, indent=2, ensure_ascii=False), "    ")
+        sys.stdout.write(("," if i else "") + "\n" + body)
+    sys.stdout.write("\n  ]\n}\n")
 
 
 def cmd_reports_dir(args: argparse.Namespace) -> None:
@@ -88,6 +219,40 @@ def build_parser() -> argparse.ArgumentParser:
     p_init = sub.add_parser("init", help="Initialiser la base et les répertoires")
     p_init.set_defaults(func=cmd_init)
 
+    p_migrate = sub.add_parser("migrate", help="Appliquer les migrations et les rattrapages du schéma")
+    p_migrate.add_argument("--no-backfill", action="store_true", help="Ne pas exécuter les rattrapages longs")
+    p_migrate.set_defaults(func=cmd_migrate)
+
+    p_archive = sub.add_parser("archive", help="Archiver les entrées des rapports anciens (fichiers en colonnes)")
+    p_archive.add_argument("--days", type=int, default=None, help="Âge minimal en jours (défaut: ARCHIVE_AFTER_DAYS)")
+    p_archive.add_argument("--report", default=None, help="Archiver ce rapport, quel que soit son âge")
+    p_archive.add_argument("--limit", type=int, default=None, help="Nombre maximal de rapports par passage")
+    p_archive.set_defaults(func=cmd_archive)
+
+    p_vacuum = sub.add_parser("vacuum", help="Purger les rapports supprimés et compacter la base")
+    p_vacuum.set_defaults(func=cmd_vacuum)
+
+    p_audit = sub.add_parser("audit-archive", help="Archiver les partitions d'audit hors rétention")
+    p_audit.add_argument("--months", type=int, default=None, help="Mois gardés en base (défaut: AUDIT_RETENTION_MONTHS)")
+    p_audit.set_defaults(func=cmd_audit_archive)
+
+    p_counters = sub.add_parser("rebuild-counters", help="Recalculer les compteurs du tableau de bord")
+    p_counters.add_argument("--check", action="store_true", help="Vérifier sans modifier (code 1 si écart)")
+    p_counters.set_defaults(func=cmd_rebuild_counters)
+
+    p_analytics = sub.add_parser("analytics", help="Agrégats sur tous les rapports (miroir colonnes duckdb optionnel)")
+    p_analytics.add_argument("action", choices=["sync", "query"], help="sync: mettre à jour le miroir ; query: agréger")
+    p_analytics.add_argument("--full", action="store_true", help="sync: reconstruire le miroir entièrement")
+    p_analytics.add_argument("--by", default="", help="Dimensions (ex: utilisateur,quarter)")
+    p_analytics.add_argument("--metrics", default="entries", help="Mesures (ex: entries,error_rate)")
+    p_analytics.add_argument("--contract", default=None, help="Filtrer par contrat")
+    p_analytics.add_argument("--from", dest="date_from", default=None, help="Date début (YYYY-MM-DD)")
+    p_analytics.add_argument("--to", dest="date_to", default=None, help="Date fin (YYYY-MM-DD)")
+    p_analytics.add_argument("--engine", default="auto", choices=["auto", "sqlite", "duckdb"], help="Moteur de requête")
+    p_analytics.add_argument("--limit", type=int, default=1000, help="Nombre maximal de lignes")
+    p_analytics.add_argument("--sql", default=None, help="SQL libre sur le miroir duckdb (lecture seule)")
+    p_analytics.set_defaults(func=cmd_analytics)
+
     p_import = sub.add_parser("import", help="Importer un fichier CSV/XLSX")
     p_import.add_argument("--file", required=True, help="Chemin du fichier à importer")
     p_import.add_argument("--contract", default=None, help="Identifiant contrat")
@@ -97,6 +262,7 @@ def build_parser() -> argparse.ArgumentParser:
     p_import.set_defaults(func=cmd_import)
 
     p_list = sub.add_parser("list", help="Lister les rapports en base")
+    p_list.add_argument("--contract", default=None, help="Filtrer par identifiant contrat")
     p_list.set_defaults(func=cmd_list)
 
     p_view = sub.add_parser("view", help="Afficher un rapport (fichier ou base)")
@@ -0,0 +1,57 @@
+"""
+Fixtures communes : chaque session de tests travaille dans un répertoire
+temporaire (base, données, rapports, journaux), jamais dans database/ ni data/.
+"""
+
+import pytest
+
+from core.config import settings
+
+_PATHS = ("data_dir", "imports_dir", "reports_dir", "reports_qr_dir", "logs_dir")
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_settings(tmp_path_factory):
+    root = tmp_path_factory.mktemp("faxcloud")
+    previous = {name: getattr(settings, name) for name in _PATHS + ("database_path",)}
+    # Settings est figé : les chemins sont redirigés comme le ferait l'environnement.
+    for name in _PATHS:
+        object.__setattr__(settings, name, root / name)
+    object.__setattr__(settings, "database_path", root / "database" / "faxcloud.db")
+
+    from core.db import init_database
+
+    init_database()
+    yield root
+    for name, value in previous.items():
+        object.__setattr__(settings, name, value)
+
+def make_report(report_id, count, *, contract="A", total_fax=None, bad_at=None):
+    """JSON de rapport tel que produit par l'analyseur, avec `count` entrées."""
+    entries = []
+    for i in range(count):
+        entries.append({
+            "id": f"{report_id}-{i}",
+            "fax_id": str(i),
+            "utilisateur": f"U{i % 7}",
+            "type": "send" if i % 2 else "receive",
+            "numero_original": f"0493{i % 50:06d}",
+            "numero_normalise": f"33493{i % 50:06d}",
+            "valide": i % 3 != 0,
+            "pages": i % 5,
+            # Dates absentes et horodatages répétés : cas limites du curseur.
+            "datetime": None if i % 17 == 0 else f"2025-01-{1 + i % 28:02d} 10:{i % 4:02d}:00",
+            "erreurs": [] if i % 3 else ["numéro invalide"],
+        })
+    if bad_at is not None:
+        entries[bad_at]["erreurs"] = object()
+    return {
+        "report_id": report_id,
+        "timestamp": "2025-02-01T00:00:00",
+        "contract_id": contract,
+        "statistics": {
+            "total_fax": count if total_fax is None else total_fax,
+            "erreurs_totales": sum(1 for e in entries if not e["valide"]),
+            "taux_reussite": 66.7,
+        },
+        "entries": entries,
+    }
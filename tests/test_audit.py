@@ -0,0 +1,75 @@
+import threading
+import uuid
+
+import pytest
+
+from core import audit
+from core.audit import AuditWriter, insert_audit_event, list_audit_events
+
+@pytest.fixture
+def writer(monkeypatch):
+    """File d'audit sans écriture périodique : seules les écritures forcées passent."""
+    writer = AuditWriter(flush_size=10000, flush_interval=3600)
+    monkeypatch.setattr(audit, "_audit_writer", writer)
+    yield writer
+    writer.close()
+
+def _user():
+    return f"user-{uuid.uuid4().hex[:8]}"
+
+def test_queued_events_are_listed_without_flush(writer, monkeypatch):
+    user = _user()
+    insert_audit_event("report_view", user=user, report_id="r1")
+    insert_audit_event("report_delete", user=user, report_id="r2")
+    with monkeypatch.context() as m:
+        m.setattr(writer, "flush", lambda: pytest.fail("lecture de l'audit avec écriture"))
+        events, cursor = list_audit_events(user=user)
+        filtered, _ = list_audit_events(user=user, action="report_view")
+
+    assert [(e["id"], e["action"]) for e in events] == [(None, "report_delete"), (None, "report_view")]
+    assert cursor is None
+    assert [e["report_id"] for e in filtered] == ["r1"]
+    assert writer.stats()["pending"] == 2
+
+def test_events_stay_listed_while_their_batch_is_written(writer, monkeypatch):
+    user = _user()
+    for i in range(3):
+        insert_audit_event("report_view", user=user, report_id=f"r{i}")
+    entered, release = threading.Event(), threading.Event()
+    write_events = audit._write_events
+
+    def blocked(rows):
+        entered.set()
+        assert release.wait(10)
+        return write_events(rows)
+
+    monkeypatch.setattr(audit, "_write_events", blocked)
+    flusher = threading.Thread(target=writer.flush)
+    flusher.start()
+    try:
+        assert entered.wait(10)
+        assert [e["report_id"] for e in list_audit_events(user=user)[0]] == ["r2", "r1", "r0"]
+    finally:
+        release.set()
+        flusher.join(10)
+
+    events, _ = list_audit_events(user=user)
+    assert [e["report_id"] for e in events] == ["r2", "r1", "r0"]
+    assert all(e["id"] is not None for e in events)
+
+def test_pages_continue_from_queue_into_partitions(writer):
+    user = _user()
+    for i in range(3):
+        insert_audit_event("report_view", user=user, report_id=f"old{i}")
+    writer.flush()
+    for i in range(3):
+        insert_audit_event("report_view", user=user, report_id=f"new{i}")
+
+    seen, cursor = [], None
+    for _ in range(5):
+        events, cursor = list_audit_events(limit=2, cursor=cursor, user=user)
+        seen += [e["report_id"] for e in events]
+        if cursor is None:
+            break
+    assert seen[:2] == ["new2", "new1"]
+    assert seen[2:] == ["old2", "old1", "old0"]
@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+
+from core.db import (
+    check_dashboard_counters,
+    count_report_entries,
+    delete_report,
+    get_report,
+    insert_report_to_db,
+    pending_report_purges,
+    purge_deleted_reports,
+)
+
+from conftest import make_report
+
+def _new_id():
+    return str(uuid.uuid4())
+
+def test_counters_follow_insert_reimport_and_delete():
+    first, second = _new_id(), _new_id()
+    insert_report_to_db(first, make_report(first, 300, contract="A"), None)
+    insert_report_to_db(second, make_report(second, 120, contract="B"), None)
+    assert check_dashboard_counters() == []
+
+    # Réimport sous le même identifiant, avec d'autres totaux.
+    insert_report_to_db(first, make_report(first, 80, contract="B", total_fax=500), None)
+    assert check_dashboard_counters() == []
+    assert count_report_entries(first) == 80
+
+    assert delete_report(second)
+    assert check_dashboard_counters() == []
+    purge_deleted_reports()
+    assert second not in pending_report_purges()
+    assert get_report(second) is None
+    assert check_dashboard_counters() == []
+
+def test_failed_reimport_keeps_previous_version():
+    report_id = _new_id()
+    insert_report_to_db(report_id, make_report(report_id, 1200), None)
+
+    with pytest.raises(TypeError):
+        insert_report_to_db(report_id, make_report(report_id, 1200, bad_at=1100), None, chunk_size=500)
+
+    assert count_report_entries(report_id) == 1200
+    assert get_report(report_id)["entries_total"] == 1200
+    assert check_dashboard_counters() == []
+
+def test_reimport_after_delete():
+    report_id = _new_id()
+    insert_report_to_db(report_id, make_report(report_id, 200), None)
+    assert delete_report(report_id)
+    insert_report_to_db(report_id, make_report(report_id, 40), None)
+    purge_deleted_reports()
+
+    assert count_report_entries(report_id) == 40
+    assert check_dashboard_counters() == []
@@ -0,0 +1,95 @@
+import uuid
+
+import pytest
+
+from core.archive import archive_report
+from core.db import (
+    count_report_entries,
+    get_report_entries,
+    get_report_entries_page,
+    insert_report_to_db,
+    iter_report_entries,
+)
+
+from conftest import make_report
+
+FILTERS = (
+    {},
+    {"entry_type": "send"},
+    {"valide": 1, "pages_min": 2},
+    {"date_from": "2025-01-10", "date_to": "2025-01-20"},
+)
+
+@pytest.fixture(scope="module")
+def report_id():
+    report_id = str(uuid.uuid4())
+    insert_report_to_db(report_id, make_report(report_id, 2500), None)
+    return report_id
+
+def _offset_ids(report_id, order, filters, page_size=333):
+    ids, offset = [], 0
+    while True:
+        rows, _, _ = get_report_entries(report_id, offset, page_size, order=order, **filters)
+        if not rows:
+            return ids
+        ids += [r["id"] for r in rows]
+        offset += len(rows)
+
+@pytest.mark.parametrize("order", ("asc", "desc"))
+@pytest.mark.parametrize("filters", FILTERS)
+def test_cursor_pages_match_offset_pages(report_id, order, filters):
+    by_cursor = [r["id"] for r in iter_report_entries(report_id, page_size=333, order=order, **filters)]
+
+    assert by_cursor == _offset_ids(report_id, order, filters)
+    assert len(set(by_cursor)) == len(by_cursor) == count_report_entries(report_id, **filters)
+
+def test_last_page_has_no_cursor(report_id):
+    total = count_report_entries(report_id, entry_type="send")
+    rows, cursor = get_report_entries_page(report_id, None, total, entry_type="send")
+    assert len(rows) == total and cursor is None
+
+    rows, cursor = get_report_entries_page(report_id, None, total - 1, entry_type="send")
+    last, cursor = get_report_entries_page(report_id, cursor, 10, entry_type="send")
+    assert len(last) == 1 and cursor is None
+
+def test_invalid_cursor_is_rejected(report_id):
+    with pytest.raises(ValueError):
+        get_report_entries_page(report_id, "garbage!!")
+
+@pytest.mark.parametrize("order", ("asc", "desc"))
+def test_archived_report_keeps_its_pages(order):
+    report_id = str(uuid.uuid4())
+    insert_report_to_db(report_id, make_report(report_id, 1500), None)
+    before = {
+        str(filters): [r["id"] for r in iter_report_entries(report_id, page_size=200, order=order, **filters)]
+        for filters in FILTERS
+    }
+
+    archive_report(report_id)
+
+    for filters in FILTERS:
+        after = [r["id"] for r in iter_report_entries(report_id, page_size=200, order=order, **filters)]
+        assert after == before[str(filters)]
+
+@pytest.mark.parametrize("page", ("offset=50", "cursor="))
+def test_entries_route_resolves_the_total_once(report_id, page, monkeypatch):
+    from backend import server
+    from core import db
+
+    calls = []
+    get_entry_count = db.get_entry_count
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return get_entry_count(*args, **kwargs)
+
+    monkeypatch.setattr(db, "get_entry_count", counting)
+    monkeypatch.setattr(server, "get_entry_count", counting)
+    client = server.create_app().test_client()
+
+    body = client.get(f"/api/report/{report_id}/entries?limit=50&type=send&{page}").get_json()
+
+    assert len(calls) == 1
+    assert body["total"] == count_report_entries(report_id, entry_type="send")
+    assert body["total_exact"] is True
+    assert len(body["entries"]) == 50
@@ -0,0 +1,55 @@
+import sqlite3
+
+from core.config import settings
+from core.connection import write_transaction
+from core.db import _NUMBERS
+
+class _RacingCursor:
+    """Curseur dont la première insertion dans `numbers` est précédée de celle
+    d'un autre processus (connexion à part, validée aussitôt)."""
+
+    def __init__(self, cur, other):
+        self._cur = cur
+        self._other = other
+        self.raced = False
+
+    def _race(self, sql):
+        if not self.raced and sql.lstrip().startswith("INSERT INTO numbers "):
+            self.raced = True
+            self._other.execute("INSERT INTO numbers (numero_normalise) VALUES ('33999000001')")
+            self._other.execute(
+                "INSERT INTO numbers_fts (rowid, numero_normalise) VALUES (last_insert_rowid(), '33999000001')"
+            )
+            self._other.commit()
+
+    def execute(self, sql, params=()):
+        self._race(sql)
+        return self._cur.execute(sql, params)
+
+    def executemany(self, sql, params):
+        self._race(sql)
+        return self._cur.executemany(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+def test_concurrent_insert_is_not_indexed_twice():
+    other = sqlite3.connect(settings.database_path, timeout=10)
+    cache = {}
+    try:
+        with write_transaction() as conn:
+            cur = _RacingCursor(conn.cursor(), other)
+            ids = _NUMBERS.ids(cur, {"33999000002": (), "33999000003": ()}, cache)
+        assert cur.raced
+    finally:
+        other.close()
+
+    assert set(ids) == {"33999000002", "33999000003"}
+    assert "33999000001" not in cache
+    with write_transaction() as conn:
+        # Lève "database disk image is malformed" si l'index ne suit pas la table.
+        conn.execute("INSERT INTO numbers_fts (numbers_fts) VALUES ('integrity-check')")
+        found = {r[0] for r in conn.execute(
+            "SELECT numero_normalise FROM numbers_fts WHERE numbers_fts MATCH '\"3399900000\"'"
+        )}
+    assert found == {"33999000001", "33999000002", "33999000003"}
@@ -0,0 +1,182 @@
+import sqlite3
+import uuid
+
+import pytest
+
+from core import migrations
+from core.config import settings
+from core.connection import get_connection, using_database, write_transaction
+from core.db import (
+    COMPACT_BACKFILL,
+    CORE_MIGRATIONS,
+    CORE_SCHEMA,
+    check_dashboard_counters,
+    count_report_entries,
+    database_status,
+    delete_report,
+    get_trends,
+    init_database,
+    insert_report_to_db,
+    iter_report_entries,
+)
+from core.migrations import (
+    Migration,
+    enqueue_backfill,
+    migrate,
+    pending_backfills,
+    register_backfill,
+    run_backfill_batch,
+    run_backfills,
+    schema_version,
+)
+
+from conftest import make_report
+
+def _applied_rows(component):
+    conn = get_connection(readonly=True)
+    try:
+        return [tuple(r) for r in conn.execute(
+            "SELECT version, name, applied_at FROM schema_migrations WHERE component = ? ORDER BY version",
+            (component,),
+        )]
+    finally:
+        conn.close()
+
+def _forget_versions():
+    # Oublie les versions mémorisées par le processus : relit schema_migrations.
+    with migrations._applied_lock:
+        migrations._applied.clear()
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    latest = max(m.version for m in CORE_MIGRATIONS)
+    with using_database(tmp_path / "fresh.db"):
+        init_database()
+        assert schema_version(CORE_SCHEMA) == latest
+        assert database_status()["schema_version"] == latest
+        rows = _applied_rows(CORE_SCHEMA)
+        assert [r[0] for r in rows] == sorted(m.version for m in CORE_MIGRATIONS)
+
+        _forget_versions()
+        init_database()
+        assert _applied_rows(CORE_SCHEMA) == rows
+
+def test_only_missing_migrations_are_applied(tmp_path):
+    calls = []
+
+    def step(version):
+        def apply(cur):
+            calls.append(version)
+            cur.execute(f"CREATE TABLE t{version} (id INTEGER)")
+        return Migration(version, f"table t{version}", apply)
+
+    with using_database(tmp_path / "component.db"):
+        assert migrate("test", [step(1), step(2)]) == 2
+        _forget_versions()
+        assert migrate("test", [step(1), step(2), step(3)]) == 3
+        assert migrate("test", [step(1), step(2), step(3)]) == 3
+    assert calls == [1, 2, 3]
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    def broken(cur):
+        cur.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("échec")
+
+    with using_database(tmp_path / "broken.db"):
+        migrate("test", [Migration(1, "base", lambda cur: cur.execute("CREATE TABLE base (id INTEGER)"))])
+        _forget_versions()
+        with pytest.raises(RuntimeError):
+            migrate("test", [
+                Migration(1, "base", lambda cur: None),
+                Migration(2, "cassée", broken),
+            ])
+        assert schema_version("test") == 1
+        conn = get_connection(readonly=True)
+        try:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("SELECT * FROM half_done")
+        finally:
+            conn.close()
+
+def test_backfill_resumes_from_committed_position(tmp_path):
+    seen = []
+
+    def step(cur, position, upper, batch_size):
+        end = min(upper, position + batch_size)
+        seen.append((position, end))
+        return end
+
+    register_backfill("test_resume", step)
+    with using_database(tmp_path / "backfill.db"):
+        migrate("test", [Migration(1, "rattrapage", lambda cur: enqueue_backfill(cur, "test_resume", 10))])
+        assert not run_backfill_batch("test_resume", batch_size=4)
+        assert not run_backfill_batch("test_resume", batch_size=4)
+        assert run_backfill_batch("test_resume", batch_size=4)
+        assert run_backfill_batch("test_resume", batch_size=4)
+    assert seen == [(0, 4), (4, 8), (8, 10)]
+
+@pytest.fixture
+def legacy_database(tmp_path):
+    """Base principale au schéma 5 : entrées dans l'ancienne table fax_entries."""
+    previous = settings.database_path
+    object.__setattr__(settings, "database_path", tmp_path / "legacy.db")
+    migrate(CORE_SCHEMA, [m for m in CORE_MIGRATIONS if m.version <= 5])
+
+    def add_report(count):
+        report_id = str(uuid.uuid4())
+        with write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO reports (id, contract_id, total_fax, created_at) VALUES (?, 'A', ?, '2024-05-01T00:00:00')",
+                (report_id, count),
+            )
+            conn.executemany(
+                """
+                INSERT INTO fax_entries (id, report_id, fax_id, utilisateur, type, numero_original,
+                                         numero_normalise, valide, pages, datetime, erreurs, numero_type)
+                VALUES (?, ?, ?, ?, 'send', ?, ?, 1, 2, ?, '[]', 'mobile')
+                """,
+                [
+                    (f"{report_id}-{i}", report_id, str(i), f"U{i % 3}", f"06{i:08d}", f"336{i:08d}",
+                     f"2024-04-{1 + i % 28:02d} 09:00:00")
+                    for i in range(count)
+                ],
+            )
+        return report_id
+
+    yield add_report
+    object.__setattr__(settings, "database_path", previous)
+
+def test_legacy_entries_are_converted_in_background(legacy_database):
+    first, second = legacy_database(1200), legacy_database(300)
+    init_database()
+    # La migration ne convertit rien : elle planifie le rattrapage.
+    assert COMPACT_BACKFILL in [b["name"] for b in pending_backfills()]
+    assert count_report_entries(first) == 0
+
+    assert not run_backfill_batch(COMPACT_BACKFILL, batch_size=500)
+    assert 0 < count_report_entries(first) < 1200
+    run_backfills()
+
+    assert pending_backfills() == []
+    assert count_report_entries(first) == 1200 and count_report_entries(second) == 300
+    entries = list(iter_report_entries(second))
+    assert sorted(e["id"] for e in entries) == sorted(f"{second}-{i}" for i in range(300))
+    assert entries[0]["numero_type"] == "mobile"
+    assert sum(p["fax_total"] for p in get_trends(contract="A")) == 1500
+    conn = get_connection(readonly=True)
+    try:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    assert not tables & {"fax_entries_legacy", "fax_entries_legacy_keys"}
+
+def test_reimported_or_deleted_report_is_not_converted(legacy_database):
+    reimported, deleted = legacy_database(600), legacy_database(600)
+    init_database()
+    assert not run_backfill_batch(COMPACT_BACKFILL, batch_size=200)
+    insert_report_to_db(reimported, make_report(reimported, 50), None)
+    delete_report(deleted)
+    run_backfills()
+
+    assert count_report_entries(reimported) == 50
+    assert count_report_entries(deleted) == 0
+    assert check_dashboard_counters() == []
@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core import db
+from core.asterisk import ToneCacheWriter, _TONE_CACHE_COLUMNS, init_asterisk_tables
+from core.connection import get_connection
+
+@pytest.fixture(scope="module", autouse=True)
+def asterisk_tables():
+    init_asterisk_tables()
+
+def _tone_row(numero):
+    now = datetime.now(timezone.utc)
+    row = dict.fromkeys(_TONE_CACHE_COLUMNS)
+    row.update(
+        numero=numero, tone="fax", is_fax=1, details="", duration_ms=1200,
+        detected_at=now.isoformat(), expires_at=(now + timedelta(hours=1)).isoformat(),
+        stable_count=1, ttl_hours=1, source="test",
+    )
+    return row
+
+def test_rows_stay_visible_while_flush_is_blocked(monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+    record_number_tones = db.record_number_tones
+
+    def blocked(cur, rows):
+        entered.set()
+        assert release.wait(10)
+        record_number_tones(cur, rows)
+
+    monkeypatch.setattr(db, "record_number_tones", blocked)
+    writer = ToneCacheWriter(max_pending=1000, flush_interval=60)
+    writer.put(_tone_row("33100000001"))
+    result = {}
+    flusher = threading.Thread(target=lambda: result.setdefault("written", writer.flush()))
+    flusher.start()
+    try:
+        assert entered.wait(10)
+        # Lot pris par flush() mais pas encore commité : toujours visible.
+        assert writer.get("33100000001")["tone"] == "fax"
+        assert [r["numero"] for r in writer.pending()] == ["33100000001"]
+    finally:
+        release.set()
+        flusher.join(10)
+        writer.close()
+
+    assert result["written"] == 1
+    assert writer.get("33100000001") is None and writer.pending() == []
+    conn = get_connection(readonly=True)
+    try:
+        row = conn.execute(
+            "SELECT tone FROM tone_detection_cache WHERE numero = ?", ("33100000001",)
+        ).fetchone()
+    finally:
+        conn.close()
+    assert row["tone"] == "fax"
+
+def test_failed_flush_keeps_rows_pending(monkeypatch):
+    def failing(cur, rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(db, "record_number_tones", failing)
+    writer = ToneCacheWriter(max_pending=1000, flush_interval=60)
+    writer.put(_tone_row("33100000002"))
+    assert writer.flush() == 0
+    assert writer.get("33100000002")["tone"] == "fax"
+    monkeypatch.undo()
+    writer.close()
+    assert writer.get("33100000002") is None